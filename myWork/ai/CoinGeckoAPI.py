@@ -1,7 +1,8 @@
-import requests
 import json
 from datetime import datetime, timedelta
 
+from myWork.another.http_client import get_http_client
+
 
 class CoinGeckoAPI:
     BASE_URL = "https://api.coingecko.com/api/v3"
@@ -19,8 +20,7 @@ class CoinGeckoAPI:
             "include_last_updated_at": "true"
         }
 
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_http_client().get_json(url, params=params)
 
         return {
             "symbol": "BTC",
@@ -31,6 +31,13 @@ class CoinGeckoAPI:
             "last_updated": datetime.fromtimestamp(data["bitcoin"]["last_updated_at"])
         }
 
+    @staticmethod
+    def get_simple_price(coin_id="bitcoin"):
+        """只获取美元价格，用于行情查询"""
+        url = f"{CoinGeckoAPI.BASE_URL}/simple/price"
+        data = get_http_client().get_json(url, params={"ids": coin_id, "vs_currencies": "usd"})
+        return data.get(coin_id, {}).get("usd")
+
     @staticmethod
     def get_btc_historical_data(days=30):
         """获取 BTC 历史价格数据"""
@@ -44,8 +51,7 @@ class CoinGeckoAPI:
             "to": end_date.timestamp()
         }
 
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_http_client().get_json(url, params=params)
 
         prices = []
         for timestamp, price in data["prices"]:
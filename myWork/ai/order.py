@@ -2,9 +2,9 @@ import os
 import json
 import time
 from datetime import datetime
-from okx.Trade import TradeAPI
+from myWork.another.okx_api import MarketAPI, TradeAPI
+from myWork.another.price_service import HedgedPriceService, coingecko_source, okx_ticker_source
 import precheck
-from myWork.ai.CoinGeckoAPI import CoinGeckoAPI
 
 # 获取API凭证
 api_key = os.getenv("OKX_API_KEY")
@@ -15,6 +15,12 @@ ENV_FLAG = os.getenv("OKX_ENV_FLAG")
 # 初始化交易API
 trade_api = TradeAPI(api_key, api_secret_key, passphrase, use_server_time=False, flag='1')
 
+# 价格查询同时使用OKX和CoinGecko，先请求健康分高的来源，慢时再请求另一个，先返回的生效
+price_service = HedgedPriceService([
+    okx_ticker_source(MarketAPI(flag='1')),
+    coingecko_source()
+])
+
 
 def parse_analysis_result():
     """解析AI分析结果，提取交易建议"""
@@ -189,10 +195,12 @@ def get_ai_predict():
 
 
 def get_current_price(instId):
-    """获取当前市场价格（需要根据实际情况实现）"""
-    # 这里应该调用OKX的市场数据API
-    # 示例返回一个模拟价格
-    return CoinGeckoAPI.get_btc_price()
+    """获取当前市场价格(买一卖一中间价)，所有来源都失败时返回None"""
+    data = price_service.get_price(instId)
+    if data is None:
+        return None
+    print(f"价格来源: {data['source']}，耗时 {data['latency'] * 1000:.0f}ms")
+    return (data['bid_px'] + data['ask_px']) / 2
 
 
 def cancel_order(instId, ordType, side):
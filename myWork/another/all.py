@@ -1,11 +1,17 @@
+import atexit
 import csv
+import threading
 import time
 from typing import List, Dict, Optional
 import os
 from dotenv import load_dotenv
-from okx.api.trade import Trade
-from okx.api.market import Market
-from okx.api.public import Public
+from myWork.another.instruments import InstrumentRegistry, InstrumentSpec
+from myWork.another.metrics import metrics
+from myWork.another.okx_api import Market, Public, Trade
+from myWork.another.price_limit import PriceLimitCache
+from myWork.another.price_service import HedgedPriceService, okx_ticker_source
+from myWork.another.tick_recorder import TickRecorder
+from myWork.another.ws_ticker import TickerStream, OKX_PUBLIC_WS_URL, OKX_PUBLIC_WS_URL_DEMO
 
 # 初始化API客户端
 load_dotenv()
@@ -14,61 +20,224 @@ api_secret_key = os.getenv("OKX_API_SECRET")
 passphrase = os.getenv("OKX_API_PASSPHRASE")
 ENV_FLAG = os.getenv("OKX_ENV_FLAG")
 
-# API实例
+# API实例，请求经过进程内共享的限速连接池
 trade_api = Trade(api_key, api_secret_key, passphrase, flag=ENV_FLAG)
 market_api = Market(flag=ENV_FLAG)
 public_api = Public(flag=ENV_FLAG)
 
-# 缓存产品信息，避免重复查询
-instrument_cache = {}
+# 产品信息注册表，按类型批量加载并缓存到本地文件
+instrument_registry = InstrumentRegistry(public_api)
 
 
 def get_instrument_info(inst_id: str) -> Optional[Dict]:
     """获取产品基础信息，包括最小下单量等参数"""
-    global instrument_cache
+    try:
+        return instrument_registry.get(inst_id)
+    except Exception as e:
+        print(f"查询产品信息异常: {str(e)}")
+        return None
 
-    # 优先使用缓存
-    if inst_id in instrument_cache:
-        return instrument_cache[inst_id]
 
+def get_instrument_spec(inst_id: str) -> Optional[InstrumentSpec]:
+    """获取产品下单规格(预先计算好的价格/数量精度)"""
     try:
-        # 根据instId推断instType
-        if "-SWAP" in inst_id:
-            inst_type = "SWAP"
-        elif "-FUTURES" in inst_id:
-            inst_type = "FUTURES"
-        elif "-OPTION" in inst_id:
-            inst_type = "OPTION"
-        elif "-MARGIN" in inst_id:
-            inst_type = "MARGIN"
-        else:
-            inst_type = "SPOT"
-
-        # 查询产品信息
-        result = public_api.get_instruments(instType=inst_type, instId=inst_id)
-        if result["code"] == "0" and len(result["data"]) > 0:
-            info = result["data"][0]
-            instrument_cache[inst_id] = info
-            return info
-        else:
-            print(f"获取{inst_id}产品信息失败: {result.get('msg', '无错误信息')}")
-            return None
+        return instrument_registry.get_spec(inst_id)
     except Exception as e:
         print(f"查询产品信息异常: {str(e)}")
         return None
 
 
+def preload_instruments(inst_types=("SPOT", "SWAP")):
+    """启动时批量加载产品信息，每种类型只请求一次"""
+    for inst_type in inst_types:
+        try:
+            instrument_registry.load(inst_type)
+        except Exception as e:
+            print(f"批量加载{inst_type}产品信息异常: {str(e)}")
+
+
+# 限价缓存，后台定时刷新，下单前先把价格限制在允许范围内
+price_limit_cache = PriceLimitCache(public_api)
+
+
+def get_price_limit(inst_id: str) -> Optional[Dict[str, float]]:
+    """获取产品当前的最高买价/最低卖价"""
+    try:
+        return price_limit_cache.get(inst_id)
+    except Exception as e:
+        print(f"查询限价异常: {str(e)}")
+        return None
+
+
 from functools import lru_cache
 from datetime import datetime, timedelta
 
 
+# 行情推送客户端，启动后get_realtime_price优先读取内存中的推送价格
+ticker_stream: Optional[TickerStream] = None
+# 行情记录器，通过start_tick_recorder开启
+tick_recorder: Optional[TickRecorder] = None
+
+
+def start_ticker_stream(inst_ids: List[str], url: Optional[str] = None, wait: bool = True) -> TickerStream:
+    """启动(或扩展)tickers频道订阅，返回全局推送客户端"""
+    global ticker_stream
+
+    if ticker_stream is None:
+        if url is None:
+            url = OKX_PUBLIC_WS_URL_DEMO if ENV_FLAG == "1" else OKX_PUBLIC_WS_URL
+        ticker_stream = TickerStream(inst_ids, url=url)
+        if tick_recorder is not None:
+            ticker_stream.add_listener(tick_recorder.on_ticker)
+        ticker_stream.start()
+    else:
+        ticker_stream.add_instruments(inst_ids)
+
+    if wait and not ticker_stream.wait_ready(inst_ids):
+        print(f"等待{inst_ids}推送行情超时，将回退到REST查询")
+    return ticker_stream
+
+
+def start_tick_recorder(directory: Optional[str] = None) -> Optional[TickRecorder]:
+    """
+    开启行情记录，推送行情和REST查询到的行情都会写入二进制日志
+    directory为空时读取环境变量TICK_RECORD_DIR，都未设置时不记录
+    """
+    global tick_recorder
+
+    directory = directory or os.getenv("TICK_RECORD_DIR")
+    if not directory or tick_recorder is not None:
+        return tick_recorder
+
+    tick_recorder = TickRecorder(directory)
+    atexit.register(tick_recorder.close)
+    if ticker_stream is not None:
+        ticker_stream.add_listener(tick_recorder.on_ticker)
+    return tick_recorder
+
+
+class TickerCache:
+    """线程安全的行情缓存，有效期内同一产品只请求一次，并发调用共享同一次请求"""
+
+    def __init__(self, fetch_func, ttl: float = 2.0):
+        """
+        参数:
+        fetch_func: 实际查询行情的函数 fetch_func(inst_id) -> Dict 或 None
+        ttl: 缓存有效期(秒)
+        """
+        self.fetch_func = fetch_func
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = {}  # inst_id -> (获取时间, 行情)
+        self._inflight = {}  # inst_id -> 进行中的请求
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, inst_id: str, max_age: Optional[float] = None) -> Optional[Dict[str, float]]:
+        """读取行情，过期或不存在时请求一次，其余并发调用等待该请求的结果"""
+        max_age = self.ttl if max_age is None else max_age
+
+        with self._lock:
+            entry = self._data.get(inst_id)
+            if entry and time.monotonic() - entry[0] <= max_age:
+                self.hits += 1
+                return dict(entry[1])
+
+            pending = self._inflight.get(inst_id)
+            if pending is None:
+                pending = {'event': threading.Event(), 'result': None, 'error': None}
+                self._inflight[inst_id] = pending
+                self.misses += 1
+                is_owner = True
+            else:
+                self.coalesced += 1
+                is_owner = False
+
+        if not is_owner:
+            pending['event'].wait()
+            if pending['error'] is not None:
+                raise pending['error']
+            return dict(pending['result']) if pending['result'] else None
+
+        try:
+            result = self.fetch_func(inst_id)
+            pending['result'] = result
+            if result:
+                with self._lock:
+                    self._data[inst_id] = (time.monotonic(), result)
+            return dict(result) if result else None
+        except Exception as e:
+            pending['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(inst_id, None)
+            pending['event'].set()
+
+    def invalidate(self, inst_id: Optional[str] = None):
+        """使指定产品(或全部)的缓存失效"""
+        with self._lock:
+            if inst_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(inst_id, None)
+
+    def get_stats(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': (self.hits + self.coalesced) / total if total else 0,
+                'size': len(self._data),
+                'ttl': self.ttl
+            }
+
+
+# REST行情查询的超时，HTTP请求使用相同的超时，超时的请求不会继续占用查询线程
+TICKER_TIMEOUT = 2.0
+# 行情查询单独的客户端: 超时或服务繁忙时不重试，由调用方下一轮重新查询
+ticker_market_api = Market(flag=ENV_FLAG, retry_num=1, request_timeout=TICKER_TIMEOUT, request_retries=0)
+# 只有OKX一个来源，不向同一来源重复请求，避免同一个行情消耗两倍的接口限速
+okx_price_service = HedgedPriceService([okx_ticker_source(ticker_market_api, timeout=TICKER_TIMEOUT)],
+                                       retry_single_source=False)
+
+
+def _fetch_ticker(inst_id: str) -> Optional[Dict[str, float]]:
+    """通过REST接口查询行情"""
+    metrics.incr('ticker_rest_fetch')
+    with metrics.timer('ticker_rest'):
+        data = okx_price_service.get_price(inst_id)
+    if data is None:
+        return None
+    price_data = {
+        "ask_px": data["ask_px"],
+        "bid_px": data["bid_px"],
+        "ts": data.get("ts")
+    }
+    if tick_recorder is not None:
+        tick_recorder.on_ticker(inst_id, price_data)
+    return price_data
+
+
+# 进程内共享的行情缓存，有效期可通过环境变量TICKER_CACHE_TTL(秒)配置
+ticker_cache = TickerCache(_fetch_ticker, ttl=float(os.getenv("TICKER_CACHE_TTL", "2")))
+
+
 def get_realtime_price(inst_id: str) -> Dict[str, float]:
-    """获取实时行情数据(带2分钟缓存)"""
-    result = market_api.get_ticker(instId=inst_id)
-    if result["code"] == "0" and len(result["data"]) > 0:
-        data = result["data"][0]
-        return {
-            "ask_px": float(data["askPx"]),
-            "bid_px": float(data["bidPx"])
-        }
+    """获取实时行情数据，优先读取推送数据，其次读取共享缓存"""
+    if ticker_stream is not None:
+        data = ticker_stream.get_price(inst_id)
+        if data:
+            return {
+                "ask_px": data["ask_px"],
+                "bid_px": data["bid_px"]
+            }
+
+    return ticker_cache.get(inst_id)
 
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 默认磁盘缓存文件，可通过环境变量BACKTEST_CACHE_DIR修改，设为空字符串时只使用内存缓存
+DEFAULT_BACKTEST_CACHE_DIR = os.getenv("BACKTEST_CACHE_DIR", str(Path(__file__).parent / "cache"))
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    return str(obj)
+
+
+def canonical_params(params):
+    """参数规范化为字符串: 字典按键排序，NumPy标量转成Python数值，其它对象用str"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+
+def data_fingerprint(data, columns=None):
+    """
+    计算行情数据窗口的指纹，相同数据得到相同指纹
+
+    参数:
+    data: PriceSeries或DataFrame
+    columns: DataFrame只对这些列计算，回测过程中新增的列不影响指纹
+
+    PriceSeries是只读的，指纹计算一次后保存在对象上，重复调用不再遍历数据
+    """
+    fingerprint = getattr(data, "_fingerprint", None)
+    if fingerprint is not None:
+        return fingerprint
+
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, pd.DataFrame):
+        frame = data if columns is None else data[list(columns)]
+        digest.update(canonical_params([list(map(str, frame.columns)), len(frame)]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    for array in (data.ts, data.close):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    fingerprint = digest.hexdigest()
+    data._fingerprint = fingerprint
+    return fingerprint
+
+
+def result_key(kind, fingerprint, params):
+    """
+    回测结果的缓存键
+
+    参数:
+    kind: 回测类型及版本，如"dca-v1"，回测逻辑变化时修改版本使旧结果失效
+    fingerprint: data_fingerprint的返回值
+    params: 影响回测结果的全部参数，包括手续费率
+    """
+    raw = f"{kind}|{fingerprint}|{canonical_params(params)}"
+    return hashlib.blake2b(raw.encode(), digest_size=20).hexdigest()
+
+
+class BacktestResultCache:
+    """
+    回测结果缓存: 进程内LRU + 可选的SQLite磁盘缓存(同一台机器上的进程共享，重启后仍可用)
+
+    结果以pickle字节保存，命中时反序列化出新对象，调用方修改返回值不影响缓存
+    """
+
+    def __init__(self, max_entries=100000, max_memory_bytes=64 * 1024 * 1024, directory=DEFAULT_BACKTEST_CACHE_DIR,
+                 max_disk_bytes=512 * 1024 * 1024, busy_timeout=30):
+        """
+        参数:
+        max_entries: 内存中最多保存的结果数
+        max_memory_bytes: 内存缓存的最大字节数
+        directory: 磁盘缓存目录，为None或空字符串时不使用磁盘缓存
+        max_disk_bytes: 磁盘缓存的最大字节数，超出时删除最久未使用的结果
+        busy_timeout: 等待其他进程写入的最长时间(秒)
+        """
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.path = Path(directory) / "backtest_results.db" if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self.busy_timeout = busy_timeout
+
+        self._memory = OrderedDict()  # key -> pickle字节，按最近使用排序
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._puts_since_evict = 0
+
+        # 统计信息
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # SQLite连接不能跨进程使用，fork后的子进程重新连接
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS backtest_results (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_backtest_results_last_used ON backtest_results (last_used)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, blob):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_memory_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get(self, key):
+        """返回缓存的结果，没有时返回None"""
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(blob)
+
+            if self.path is not None:
+                try:
+                    conn = self._connection()
+                    row = conn.execute("SELECT value FROM backtest_results WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE backtest_results SET last_used = ? WHERE key = ?", (time.time(), key))
+                except sqlite3.Error as e:
+                    print(f"读取回测结果缓存失败: {e}")
+                    row = None
+                if row is not None:
+                    blob = bytes(row[0])
+                    self._remember(key, blob)
+                    self.disk_hits += 1
+                    return pickle.loads(blob)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """保存结果，value为None时不保存"""
+        if value is None:
+            return
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, blob)
+            if self.path is None:
+                return
+            try:
+                conn = self._connection()
+                conn.execute("INSERT OR REPLACE INTO backtest_results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                             (key, blob, len(blob), time.time()))
+                self._puts_since_evict += 1
+                if self._puts_since_evict >= 100:
+                    self._puts_since_evict = 0
+                    self._evict_disk(conn)
+            except sqlite3.Error as e:
+                print(f"写入回测结果缓存失败: {e}")
+
+    def _evict_disk(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM backtest_results").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        # 删除到上限的90%，避免每次检查都要删除
+        target = self.max_disk_bytes * 0.9
+        expired = []
+        for key, size in conn.execute("SELECT key, size FROM backtest_results ORDER BY last_used"):
+            if total <= target:
+                break
+            expired.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM backtest_results WHERE key = ?", expired)
+
+    def clear(self, disk=False):
+        """清空内存缓存，disk为True时同时清空磁盘缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if disk and self.path is not None:
+                self._connection().execute("DELETE FROM backtest_results")
+
+    def get_cache_info(self):
+        """返回缓存统计信息"""
+        info = {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes
+        }
+        if self.path is not None:
+            with self._lock:
+                count, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM backtest_results").fetchone()
+            info.update({'disk_path': str(self.path), 'disk_entries': count, 'disk_bytes': size})
+        return info
+
+
+_default_cache = None
+
+
+def get_backtest_cache():
+    """进程内共享的默认回测结果缓存"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = BacktestResultCache()
+    return _default_cache
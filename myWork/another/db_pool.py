@@ -0,0 +1,99 @@
+import os
+import queue
+import threading
+import time
+
+import pymysql
+
+
+class ConnectionPool:
+    """
+    线程安全的MySQL连接池: 连接按需创建，用完归还，最多同时存在max_size个连接
+
+    归还时回滚未结束的事务，下一个使用者总是从新的快照开始读取，
+    不会沿用上一次的REPEATABLE READ快照而看不到其他连接之后提交的数据
+    """
+
+    def __init__(self, connect_func, max_size=8, idle_check_seconds=0):
+        """
+        参数:
+        connect_func: 创建新连接的函数
+        max_size: 最大连接数，连接都被占用时等待归还
+        idle_check_seconds: 连接空闲超过该时间后，取出时先ping确认可用
+        """
+        self.connect_func = connect_func
+        self.max_size = max_size
+        self.idle_check_seconds = idle_check_seconds
+        self._idle = queue.LifoQueue()  # (连接, 归还时间)
+        self._created = 0
+        self._lock = threading.Lock()
+        # fork出的子进程不能复用父进程的连接
+        self._pid = os.getpid()
+
+    def acquire(self, timeout=None):
+        """取出一个连接，没有空闲连接且已达上限时等待，空闲连接失效且重连失败时丢弃后重新获取"""
+        while True:
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.max_size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self.connect_func()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                connection, released_at = self._idle.get(timeout=timeout)
+
+            # 空闲期间可能被服务器断开
+            if time.monotonic() - released_at < self.idle_check_seconds:
+                return connection
+            try:
+                connection.ping(reconnect=True)
+                return connection
+            except pymysql.Error as e:
+                print(f"空闲连接重连失败，丢弃后重新获取: {e}")
+                self._discard(connection)
+
+    def release(self, connection):
+        """归还连接，先回滚未结束的事务，已关闭或回滚失败的连接直接丢弃"""
+        if connection.open:
+            try:
+                connection.rollback()
+            except pymysql.Error:
+                self._discard(connection)
+                return
+        if connection.open:
+            self._idle.put((connection, time.monotonic()))
+        else:
+            self._discard(connection)
+
+    def owned_by_current_process(self):
+        """连接池是否由当前进程创建，fork出的子进程应新建连接池"""
+        return self._pid == os.getpid()
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._created -= 1
@@ -0,0 +1,250 @@
+import json
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from myWork.another.metrics import metrics
+
+# OKX各接口的限速(次数, 时间窗口秒)，来自接口文档的"限速"说明
+OKX_RATE_LIMITS = {
+    ('GET', '/api/v5/market/ticker'): (20, 2),
+    ('GET', '/api/v5/market/tickers'): (20, 2),
+    ('GET', '/api/v5/market/books'): (40, 2),
+    ('GET', '/api/v5/market/candles'): (40, 2),
+    ('GET', '/api/v5/market/history-candles'): (20, 2),
+    ('GET', '/api/v5/public/instruments'): (20, 2),
+    ('GET', '/api/v5/public/price-limit'): (20, 2),
+    ('GET', '/api/v5/public/time'): (10, 2),
+    ('POST', '/api/v5/trade/order'): (60, 2),
+    ('POST', '/api/v5/trade/batch-orders'): (300, 2),  # 按订单数计算
+    ('POST', '/api/v5/trade/cancel-order'): (60, 2),
+    ('POST', '/api/v5/trade/cancel-batch-orders'): (300, 2),  # 按订单数计算
+    ('POST', '/api/v5/trade/amend-order'): (60, 2),
+    ('GET', '/api/v5/trade/order'): (60, 2),
+    ('GET', '/api/v5/trade/orders-pending'): (60, 2),
+    ('GET', '/api/v5/trade/orders-history'): (40, 2),
+    ('GET', '/api/v5/trade/fills'): (60, 2),
+    ('GET', '/api/v5/account/balance'): (10, 2),
+    ('GET', '/api/v5/account/positions'): (10, 2),
+}
+# 文档中未列出的OKX接口按最严格的常见限速处理
+OKX_DEFAULT_LIMIT = (10, 2)
+OKX_HOSTS = {'www.okx.com', 'aws.okx.com', 'okx.com'}
+
+# 其他服务按主机整体限速，CoinGecko免费接口约每分钟30次
+HOST_RATE_LIMITS = {
+    'api.coingecko.com': (30, 60),
+}
+
+# 触发限速时返回的错误码: 50011 请求频率过快，50061 子账户请求频率过快
+THROTTLE_CODES = {'50011', '50061'}
+
+
+class TokenBucket:
+    """令牌桶限速，预留令牌后在锁外等待，多个线程按申请顺序排队"""
+
+    def __init__(self, capacity: int, period: float):
+        """
+        参数:
+        capacity: 时间窗口内允许的请求数(令牌桶容量)
+        period: 时间窗口(秒)
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: int = 1) -> float:
+        """预留令牌，返回需要等待的秒数"""
+        cost = min(cost, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= cost
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def penalize(self, min_backoff: float = 0.5, max_backoff: float = 10.0) -> float:
+        """被服务端限速后暂停该接口，连续被限速时暂停时间加倍，返回暂停秒数"""
+        with self._lock:
+            self.backoff = min(max(self.backoff * 2, min_backoff), max_backoff)
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + self.backoff)
+            self.tokens = min(self.tokens, 0.0)
+            return self.backoff
+
+    def relax(self):
+        """请求成功后逐步恢复"""
+        if self.backoff:
+            with self._lock:
+                self.backoff /= 2
+                if self.backoff < 0.05:
+                    self.backoff = 0.0
+
+
+class RateLimitedHttpClient:
+    """进程内共享的HTTP客户端: 长连接池(HTTP/2)、按接口的令牌桶限速、被限速时自适应退避"""
+
+    def __init__(self, proxy: Optional[str] = None, max_connections: int = 20, timeout: float = 10,
+                 max_retries: int = 5, http2: bool = True):
+        """
+        参数:
+        proxy: 代理地址，如http://127.0.0.1:7890
+        max_connections: 连接池最大连接数
+        timeout: 请求超时(秒)
+        max_retries: 被限速或连接失败时的最大重试次数
+        http2: 是否启用HTTP/2
+        """
+        self.max_retries = max_retries
+        self._client = httpx.Client(
+            http2=http2,
+            proxy=proxy,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=60)
+        )
+        self._buckets = {}  # 限速键 -> TokenBucket
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.queued = 0  # 当前正在排队等待令牌的请求数
+        self.sent = 0
+        self.throttled = 0
+
+    def _bucket_for(self, method: str, url: str) -> Optional[Tuple[str, TokenBucket]]:
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        if host in OKX_HOSTS:
+            key = (method, parts.path)
+            limit = OKX_RATE_LIMITS.get(key, OKX_DEFAULT_LIMIT)
+        elif host in HOST_RATE_LIMITS:
+            key = host
+            limit = HOST_RATE_LIMITS[host]
+        else:
+            return None
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*limit)
+        name = parts.path.strip('/').replace('/', '_').replace('-', '_') if host in OKX_HOSTS else host.replace('.', '_')
+        return name, bucket
+
+    def request(self, method: str, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                content: Optional[str] = None, cost: int = 1,
+                header_func: Optional[Callable[[], Dict]] = None, timeout: Optional[float] = None,
+                max_retries: Optional[int] = None) -> httpx.Response:
+        """
+        发送请求，按接口限速排队，被限速(HTTP 429或错误码50011)时退避后重试
+
+        参数:
+        method: GET或POST
+        url: 完整地址(GET参数可以已拼接在url中)
+        params: 查询参数
+        headers: 请求头
+        content: 请求体
+        cost: 消耗的令牌数，如批量下单按订单数计算
+        header_func: 每次发送前生成请求头，用于需要签名时间戳的接口(排队或重试后重新签名)
+        timeout: 本次请求的超时(秒)，为None时使用客户端的超时
+        max_retries: 本次请求的最大重试次数，为None时使用客户端的设置
+        """
+        method = method.upper()
+        max_retries = self.max_retries if max_retries is None else max_retries
+        timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        resolved = self._bucket_for(method, url)
+        name, bucket = resolved if resolved else ('other', None)
+        response = None
+
+        for attempt in range(max_retries + 1):
+            if bucket is not None:
+                wait = bucket.reserve(cost)
+                if wait > 0:
+                    metrics.incr('http_queued')
+                    with self._lock:
+                        self.queued += 1
+                    try:
+                        time.sleep(wait)
+                    finally:
+                        with self._lock:
+                            self.queued -= 1
+                    metrics.observe('http_queue_wait', wait)
+
+            request_headers = header_func() if header_func else headers
+            if request_headers:
+                # requests会忽略值为None的请求头，httpx需要手动去掉
+                request_headers = {k: v for k, v in request_headers.items() if v is not None}
+            try:
+                with metrics.timer(f'http_{name}'):
+                    response = self._client.request(method, url, params=params, headers=request_headers,
+                                                     content=content, timeout=timeout)
+            except httpx.TransportError as e:
+                if attempt >= max_retries:
+                    raise
+                delay = min(0.1 * 2 ** attempt, 2.0) * random.uniform(0.5, 1.0)
+                print(f"请求{url}连接异常: {e}，{delay:.2f}秒后重试")
+                time.sleep(delay)
+                continue
+            self.sent += 1
+            metrics.incr('http_sent')
+
+            if bucket is not None and self._is_throttled(response):
+                self.throttled += 1
+                metrics.incr('http_throttled')
+                pause = bucket.penalize()
+                print(f"接口{name}被限速，暂停{pause:.2f}秒 ({attempt + 1}/{max_retries})")
+                continue
+            if bucket is not None:
+                bucket.relax()
+            return response
+
+        return response
+
+    @staticmethod
+    def _is_throttled(response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        # 只有包含限速错误码时才解析JSON
+        body = response.content
+        if b'"5001' not in body and b'"5006' not in body:
+            return False
+        try:
+            return str(json.loads(body).get('code')) in THROTTLE_CODES
+        except (ValueError, AttributeError):
+            return False
+
+    def get_json(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None):
+        """GET请求并解析JSON"""
+        return self.request('GET', url, params=params, headers=headers).json()
+
+    def get_stats(self) -> Dict:
+        """获取请求统计"""
+        return {
+            'queued': self.queued,
+            'sent': self.sent,
+            'throttled': self.throttled,
+            'buckets': len(self._buckets)
+        }
+
+    def close(self):
+        self._client.close()
+
+
+_clients = {}  # 代理地址 -> RateLimitedHttpClient
+_clients_lock = threading.Lock()
+
+
+def get_http_client(proxy: Optional[str] = None) -> RateLimitedHttpClient:
+    """获取进程内共享的HTTP客户端，同一代理地址复用同一个连接池"""
+    with _clients_lock:
+        client = _clients.get(proxy)
+        if client is None:
+            client = _clients[proxy] = RateLimitedHttpClient(proxy=proxy)
+        return client
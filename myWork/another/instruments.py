@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, Decimal
+from pathlib import Path
+from typing import Dict, Optional
+
+# 默认缓存目录，可通过环境变量INSTRUMENT_CACHE_DIR修改
+DEFAULT_CACHE_DIR = os.getenv("INSTRUMENT_CACHE_DIR", str(Path(__file__).parent / "cache"))
+
+# 支持按类型一次性拉取全部产品的类型，期权必须指定标的，只能逐个查询
+BULK_INST_TYPES = ("SPOT", "SWAP", "FUTURES", "MARGIN")
+
+
+def infer_inst_type(inst_id: str) -> str:
+    """根据instId推断instType"""
+    if "-SWAP" in inst_id:
+        return "SWAP"
+    elif "-FUTURES" in inst_id:
+        return "FUTURES"
+    elif "-OPTION" in inst_id:
+        return "OPTION"
+    elif "-MARGIN" in inst_id:
+        return "MARGIN"
+    return "SPOT"
+
+
+def _quantum(value: str) -> Decimal:
+    """按数值的小数位数生成量化单位，如'0.010' -> Decimal('0.01')，'10' -> Decimal('1')"""
+    places = max(0, -Decimal(value).normalize().as_tuple().exponent)
+    return Decimal(1).scaleb(-places)
+
+
+def _snap(value, step: Decimal, quantum: Decimal, rounding) -> Decimal:
+    """把数值取整到step的整数倍，如step为0.5时1.3 -> 1.5，再按quantum固定小数位数便于转成字符串"""
+    steps = (Decimal(str(value)) / step).to_integral_value(rounding=rounding)
+    return (steps * step).quantize(quantum)
+
+
+class InstrumentSpec:
+    """单个产品的下单规格，价格和数量的步长及小数位数在加载时预先计算"""
+
+    __slots__ = ("inst_id", "info", "tick_sz", "min_sz", "lot_sz", "px_quantum", "sz_quantum")
+
+    def __init__(self, info: Dict):
+        self.inst_id = info["instId"]
+        self.info = info
+        tick_sz = info.get("tickSz") or "0.01"
+        min_sz = info.get("minSz") or "0.001"
+        # 下单数量的步长为lotSz，没有时按minSz
+        lot_sz = info.get("lotSz") or min_sz
+        self.tick_sz = Decimal(tick_sz)
+        self.min_sz = Decimal(min_sz)
+        self.lot_sz = Decimal(lot_sz)
+        self.px_quantum = _quantum(tick_sz)
+        self.sz_quantum = _quantum(lot_sz)
+
+    def quantize_price(self, price, rounding=ROUND_HALF_EVEN) -> Decimal:
+        """将价格取整到tickSz的整数倍，默认取最近的一档"""
+        return _snap(price, self.tick_sz, self.px_quantum, rounding)
+
+    def quantize_size(self, sz, rounding=ROUND_DOWN) -> Decimal:
+        """将数量取整到lotSz的整数倍，默认向下取整，卖出时不会超出持仓，买入时不会超出预算"""
+        return _snap(sz, self.lot_sz, self.sz_quantum, rounding)
+
+
+class InstrumentRegistry:
+    """产品信息注册表: 按类型一次性加载全部产品，缓存到本地文件并在过期后刷新"""
+
+    def __init__(self, public_api, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = 6 * 3600,
+                 missing_refresh_interval: float = 300):
+        """
+        参数:
+        public_api: okx公共数据接口实例
+        cache_dir: 本地缓存目录
+        ttl: 缓存有效期(秒)，过期后重新从接口加载
+        missing_refresh_interval: 查询不到的产品(如新上线)触发重新加载的最短间隔(秒)
+        """
+        self.public_api = public_api
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.missing_refresh_interval = missing_refresh_interval
+
+        self._specs = {}  # inst_id -> InstrumentSpec
+        self._loaded_at = {}  # inst_type -> 数据获取时间(epoch)
+        self._lock = threading.RLock()
+
+    def _cache_file(self, inst_type: str) -> Path:
+        return self.cache_dir / f"instruments_{inst_type}.json"
+
+    def load(self, inst_type: str, force: bool = False) -> int:
+        """加载某类型的全部产品，优先读取未过期的本地缓存，返回产品数量"""
+        with self._lock:
+            if not force and self._is_fresh(inst_type):
+                return sum(1 for spec in self._specs.values() if spec.info.get("instType") == inst_type)
+
+            if not force:
+                cached = self._read_cache(inst_type)
+                if cached is not None:
+                    self._install(inst_type, cached["data"], cached["fetched_at"])
+                    return len(cached["data"])
+
+            result = self.public_api.get_instruments(instType=inst_type)
+            if result["code"] != "0":
+                print(f"批量获取{inst_type}产品信息失败: {result.get('msg', '无错误信息')}")
+                return 0
+
+            fetched_at = time.time()
+            self._install(inst_type, result["data"], fetched_at)
+            self._write_cache(inst_type, result["data"], fetched_at)
+            print(f"已加载 {len(result['data'])} 个{inst_type}产品信息")
+            return len(result["data"])
+
+    def get_spec(self, inst_id: str) -> Optional[InstrumentSpec]:
+        """获取产品规格，必要时加载对应类型"""
+        spec = self._specs.get(inst_id)
+        inst_type = infer_inst_type(inst_id)
+        if spec is not None and self._is_fresh(inst_type):
+            return spec
+
+        if inst_type not in BULK_INST_TYPES:
+            return self._load_single(inst_type, inst_id)
+
+        with self._lock:
+            self.load(inst_type)
+            spec = self._specs.get(inst_id)
+            if spec is None:
+                # 可能是缓存之后新上线的产品，限制频率重新加载一次
+                loaded_at = self._loaded_at.get(inst_type, 0)
+                if time.time() - loaded_at > self.missing_refresh_interval:
+                    self.load(inst_type, force=True)
+                    spec = self._specs.get(inst_id)
+        return spec
+
+    def get(self, inst_id: str) -> Optional[Dict]:
+        """获取产品原始信息"""
+        spec = self.get_spec(inst_id)
+        return spec.info if spec else None
+
+    def _load_single(self, inst_type: str, inst_id: str) -> Optional[InstrumentSpec]:
+        result = self.public_api.get_instruments(instType=inst_type, instId=inst_id)
+        if result["code"] == "0" and len(result["data"]) > 0:
+            spec = InstrumentSpec(result["data"][0])
+            self._specs[inst_id] = spec
+            return spec
+        print(f"获取{inst_id}产品信息失败: {result.get('msg', '无错误信息')}")
+        return None
+
+    def _is_fresh(self, inst_type: str) -> bool:
+        loaded_at = self._loaded_at.get(inst_type)
+        if inst_type not in BULK_INST_TYPES:
+            return True
+        return loaded_at is not None and time.time() - loaded_at <= self.ttl
+
+    def _install(self, inst_type: str, instruments, fetched_at: float):
+        for info in instruments:
+            self._specs[info["instId"]] = InstrumentSpec(info)
+        self._loaded_at[inst_type] = fetched_at
+
+    def _read_cache(self, inst_type: str) -> Optional[Dict]:
+        path = self._cache_file(inst_type)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached.get("fetched_at", 0) > self.ttl:
+            return None
+        return cached
+
+    def _write_cache(self, inst_type: str, instruments, fetched_at: float):
+        path = self._cache_file(inst_type)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"inst_type": inst_type, "fetched_at": fetched_at, "data": instruments}, f)
+            os.replace(tmp_path, path)  # 原子替换，避免其他进程读到写了一半的文件
+        except OSError as e:
+            print(f"写入产品信息缓存失败: {e}")
+
+    def clear(self):
+        """清空内存中的产品信息"""
+        with self._lock:
+            self._specs.clear()
+            self._loaded_at.clear()
+
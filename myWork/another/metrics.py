@@ -0,0 +1,199 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# 直方图桶边界(秒): 1微秒到1000秒，按1.25倍递增，百分位误差不超过一个桶宽(约25%)
+_BUCKET_BOUNDS = []
+_bound = 1e-6
+while _bound < 1000:
+    _BUCKET_BOUNDS.append(_bound)
+    _bound *= 1.25
+_BUCKET_BOUNDS.append(float('inf'))
+
+
+class LatencyHistogram:
+    """固定对数分桶的直方图，记录为O(log n)的桶查找，不保存原始样本"""
+
+    def __init__(self, bounds=None):
+        self.bounds = bounds or _BUCKET_BOUNDS
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def record(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        """按桶估算百分位数(p取0~100)，在桶内线性插值"""
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c == 0:
+                continue
+            if seen + c >= target:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = min(self.bounds[i], self.max)
+                lower = max(lower, self.min)
+                if upper <= lower:
+                    return upper
+                return lower + (upper - lower) * (target - seen) / c
+            seen += c
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+class MetricsRegistry:
+    """进程内的耗时和计数统计，开销很小，可在生产环境常开"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # 名称 -> LatencyHistogram
+        self._counters = {}  # 名称 -> 累计次数
+        self._local = threading.local()
+        self.started_at = time.time()
+
+    def observe(self, name: str, value: float):
+        """记录一次观测值(耗时单位为秒)"""
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = LatencyHistogram()
+            hist.record(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """统计代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def incr(self, name: str, n: int = 1):
+        """累加计数，如果当前线程处于一次tick中，同时计入本次tick"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        tick_counts = getattr(self._local, 'tick_counts', None)
+        if tick_counts is not None:
+            tick_counts[name] = tick_counts.get(name, 0) + n
+
+    @contextmanager
+    def tick(self, name: str = 'tick', per_tick_counters=('db_calls', 'order_retries', 'ticker_rest_fetch')):
+        """
+        统计一次完整循环(tick)的总耗时，并把tick内的计数记录为分布，
+        如 db_calls_per_tick 表示每个tick的数据库调用次数
+        """
+        self._local.tick_counts = {}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_total", time.perf_counter() - start)
+            tick_counts = self._local.tick_counts
+            self._local.tick_counts = None
+            for counter in per_tick_counters:
+                self.observe(f"{counter}_per_tick", tick_counts.get(counter, 0))
+
+    def snapshot(self) -> Dict:
+        """获取当前所有统计数据"""
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started_at,
+                'histograms': {name: hist.summary() for name, hist in self._histograms.items()},
+                'counters': dict(self._counters)
+            }
+
+    def render_text(self) -> str:
+        """输出文本格式的统计，耗时单位为毫秒，*_per_tick为次数"""
+        snap = self.snapshot()
+        lines = [f"# uptime {snap['uptime']:.0f}s"]
+        for name in sorted(snap['histograms']):
+            s = snap['histograms'][name]
+            scale = 1 if name.endswith('_per_tick') else 1000
+            lines.append(
+                f"{name} count={s['count']} mean={s['mean'] * scale:.3f} p50={s['p50'] * scale:.3f} "
+                f"p90={s['p90'] * scale:.3f} p99={s['p99'] * scale:.3f} max={s['max'] * scale:.3f}"
+            )
+        for name in sorted(snap['counters']):
+            lines.append(f"{name}_total {snap['counters'][name]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def start_http_server(self, port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """在后台线程中提供本地文本接口，curl http://127.0.0.1:9108/metrics 查看"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"指标接口已启动: http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def start_periodic_dump(self, interval: float = 60, path: Optional[str] = None):
+        """定时输出统计，path为空时打印到控制台，否则覆盖写入文件"""
+
+        def dump_loop():
+            while True:
+                time.sleep(interval)
+                text = self.render_text()
+                if path:
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(text)
+                else:
+                    print(text, end="")
+
+        threading.Thread(target=dump_loop, name="metrics-dump", daemon=True).start()
+
+
+# 进程内共享的统计实例
+metrics = MetricsRegistry()
+
+
+def start_metrics_from_env():
+    """根据环境变量启动指标输出: METRICS_PORT开启本地接口，METRICS_DUMP_INTERVAL开启定时输出"""
+    port = os.getenv("METRICS_PORT")
+    if port:
+        metrics.start_http_server(int(port))
+    interval = os.getenv("METRICS_DUMP_INTERVAL")
+    if interval:
+        metrics.start_periodic_dump(float(interval), os.getenv("METRICS_DUMP_PATH"))
@@ -0,0 +1,132 @@
+import datetime
+import json
+import urllib.parse as up
+
+import okx.MarketData
+import okx.Trade
+from okx import utils as okx_utils
+from okx.api._client import ResponseStatusError, request_retry_wrapper
+from okx.api.market import Market as _Market
+from okx.api.public import Public as _Public
+from okx.api.trade import Trade as _Trade
+
+from myWork.another.http_client import get_http_client
+
+
+class PooledClientMixin:
+    """替换okx.api客户端的send_request，请求经过进程内共享的限速连接池，不再每次新建连接"""
+
+    def __init__(self, *args, request_timeout=None, request_retries=None, **kwargs):
+        """
+        参数:
+        request_timeout: 每次请求的超时(秒)，为None时使用连接池的超时
+        request_retries: 连接失败或被限速时的重试次数，为None时使用连接池的设置
+        """
+        super().__init__(*args, **kwargs)
+        self.request_timeout = request_timeout
+        self.request_retries = request_retries
+
+    def send_request(self, path, method, *args, **params):
+        # 与okx.api一致: 服务繁忙、超时等错误码按retry_num/retry_delay重试，连接失败由连接池重试
+        @request_retry_wrapper(retry_num=self.retry_num, retry_delay=self.retry_delay)
+        def inner():
+            return self._send_once(path, method, *args, **params)
+
+        return inner()
+
+    def _send_once(self, path, method, *args, **params):
+        params_no_empty = {}
+        for k, v in params.items():
+            if v not in ['', [], {}, None] and k not in ['proxies', 'proxy_host']:
+                params_no_empty[k] = v
+        if method == 'GET' and params_no_empty:
+            path = path + '?' + up.urlencode(params_no_empty)
+
+        # 与okx.api一致: 参数中的proxy_host优先于实例的proxy_host
+        proxy_host = params.get('proxy_host') or self.proxy_host
+        if proxy_host:
+            url = proxy_host.rstrip('/') + path
+        else:
+            url = up.urljoin(self.API_URL, path)
+        proxies = params.get('proxies') or self.proxies or {}
+        proxy = proxies.get('https') or proxies.get('http')
+
+        if method == 'POST':
+            # 类似批量下单这种无Key类型的body
+            body = json.dumps(args[0]) if args else json.dumps(params_no_empty)
+        else:
+            body = ''
+        # 批量接口按订单数消耗限速令牌
+        cost = len(args[0]) if args and isinstance(args[0], list) else 1
+
+        def header_func():
+            timestamp = datetime.datetime.utcnow().isoformat("T", "milliseconds") + 'Z'
+            sign = self._get_sign(message=self._pre_hash(timestamp, method, path, body), secret=self.secret)
+            return self._get_header(key=self.key, sign=sign, passphrase=self.passphrase, flag=self.flag,
+                                    timestamp=timestamp)
+
+        response = get_http_client(proxy).request(method, url, content=body or None, cost=cost,
+                                                  header_func=header_func, timeout=self.request_timeout,
+                                                  max_retries=self.request_retries)
+        if not str(response.status_code).startswith('2'):
+            msg = 'Error response_status_code {code}\nresponse_content={content}'.format(code=response.status_code,
+                                                                                         content=response.text)
+            raise ResponseStatusError(msg)
+        return response.json()
+
+
+class Trade(PooledClientMixin, _Trade):
+    pass
+
+
+class Market(PooledClientMixin, _Market):
+    pass
+
+
+class Public(PooledClientMixin, _Public):
+    pass
+
+
+class PooledOkxClientMixin:
+    """替换okx.Trade/okx.MarketData等客户端的_request，请求经过进程内共享的限速连接池"""
+
+    def __init__(self, api_key='-1', api_secret_key='-1', passphrase='-1', use_server_time=None, flag='1',
+                 domain='https://www.okx.com', debug=False, proxy=None):
+        # 不调用OkxClient.__init__: 它会新建一个httpx连接池，而请求都经过共享的连接池，新建的连接池不会被使用
+        self.API_KEY = api_key
+        self.API_SECRET_KEY = api_secret_key
+        self.PASSPHRASE = passphrase
+        self.use_server_time = False
+        self.flag = flag
+        self.domain = domain
+        self.debug = debug
+        self._pooled_proxy = proxy
+
+    def close(self):
+        # 共享连接池不随客户端关闭
+        pass
+
+    def _request(self, method, request_path, params):
+        if method == 'GET':
+            request_path = request_path + okx_utils.parse_params_to_str(params)
+        body = json.dumps(params) if method == 'POST' else ""
+
+        def header_func():
+            timestamp = okx_utils.get_timestamp()
+            if self.API_KEY != '-1':
+                sign = okx_utils.sign(okx_utils.pre_hash(timestamp, method, request_path, str(body), self.debug),
+                                      self.API_SECRET_KEY)
+                return okx_utils.get_header(self.API_KEY, sign, timestamp, self.PASSPHRASE, self.flag, self.debug)
+            return okx_utils.get_header_no_sign(self.flag, self.debug)
+
+        response = get_http_client(self._pooled_proxy).request(method, self.domain + request_path,
+                                                               content=body or None, header_func=header_func)
+        return response.json()
+
+
+class TradeAPI(PooledOkxClientMixin, okx.Trade.TradeAPI):
+    pass
+
+
+class MarketAPI(PooledOkxClientMixin, okx.MarketData.MarketAPI):
+    pass
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+def clamp_price(limits: Optional[Dict[str, float]], side: str, price: float) -> float:
+    """将委托价格限制在交易所允许的范围内，买单不高于最高买价，卖单不低于最低卖价"""
+    if not limits:
+        return price
+    if side == 'buy' and limits['buy_lmt'] and price > limits['buy_lmt']:
+        print(f"买价{price}超过限价，调整为: {limits['buy_lmt']}")
+        return limits['buy_lmt']
+    if side == 'sell' and limits['sell_lmt'] and price < limits['sell_lmt']:
+        print(f"卖价{price}低于限价，调整为: {limits['sell_lmt']}")
+        return limits['sell_lmt']
+    return price
+
+
+class PriceLimitCache:
+    """缓存产品当前的最高买价/最低卖价限制，后台定时刷新，下单前先把价格限制在允许范围内"""
+
+    def __init__(self, public_api, refresh_interval: float = 5, max_age: float = 15):
+        """
+        参数:
+        public_api: okx公共数据接口实例
+        refresh_interval: 后台刷新间隔(秒)
+        max_age: 超过该时间(秒)未刷新的限价视为过期，读取时重新查询
+        """
+        self.public_api = public_api
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+
+        self._limits = {}  # inst_id -> {'buy_lmt', 'sell_lmt', 'updated_at'}
+        self._tracked = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # 统计信息
+        self.fetches = 0
+
+    def get(self, inst_id: str) -> Optional[Dict[str, float]]:
+        """获取限价，首次查询的产品会加入后台刷新列表"""
+        with self._lock:
+            data = self._limits.get(inst_id)
+            self._tracked.add(inst_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refresh_loop, name="price-limit", daemon=True)
+                self._thread.start()
+
+        if data and time.monotonic() - data['updated_at'] <= self.max_age:
+            return dict(data)
+        return self._fetch(inst_id)
+
+    def invalidate(self, inst_id: str):
+        """下单仍被限价拒绝时调用，下次读取会重新查询"""
+        with self._lock:
+            self._limits.pop(inst_id, None)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _fetch(self, inst_id: str) -> Optional[Dict[str, float]]:
+        self.fetches += 1
+        result = self.public_api.get_price_limit(instId=inst_id)
+        if result["code"] != "0" or not result.get("data"):
+            print(f"获取{inst_id}限价失败: {result.get('msg', '无错误信息')}")
+            return None
+
+        item = result["data"][0]
+        # 未开启限价的产品buyLmt/sellLmt为空字符串
+        data = {
+            'buy_lmt': float(item["buyLmt"]) if item.get("buyLmt") else None,
+            'sell_lmt': float(item["sellLmt"]) if item.get("sellLmt") else None,
+            'updated_at': time.monotonic()
+        }
+        with self._lock:
+            self._limits[inst_id] = data
+        return dict(data)
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            with self._lock:
+                inst_ids = list(self._tracked)
+            for inst_id in inst_ids:
+                try:
+                    self._fetch(inst_id)
+                except Exception as e:
+                    print(f"刷新{inst_id}限价异常: {e}")
@@ -0,0 +1,212 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from myWork.another.metrics import LatencyHistogram, metrics
+
+
+class PriceSource:
+    """单个行情来源，记录延迟分布和成功率，用于计算健康分和对冲延迟"""
+
+    def __init__(self, name: str, fetch_func: Callable[[str], Optional[Dict[str, float]]], timeout: float = 2.0,
+                 ewma_alpha: float = 0.2):
+        """
+        参数:
+        name: 来源名称，用于统计
+        fetch_func: 查询函数，参数为inst_id，返回{'bid_px', 'ask_px'}或None
+        timeout: 单次查询超时(秒)，超时的结果视为失败
+        ewma_alpha: 成功率和延迟的指数平滑系数
+        """
+        self.name = name
+        self.fetch_func = fetch_func
+        self.timeout = timeout
+        self.ewma_alpha = ewma_alpha
+
+        self.latency = LatencyHistogram()
+        self.success_rate = 1.0
+        self.avg_latency = 0.0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, elapsed: float):
+        with self._lock:
+            self.latency.record(elapsed)
+            self.success_rate += self.ewma_alpha * ((1.0 if ok else 0.0) - self.success_rate)
+            self.avg_latency += self.ewma_alpha * (elapsed - self.avg_latency)
+            if not ok:
+                self.failures += 1
+        metrics.observe(f"price_source_{self.name}", elapsed)
+        if not ok:
+            metrics.incr(f"price_source_{self.name}_failure")
+
+    def score(self) -> float:
+        """健康分: 成功率越高、平均延迟越低分数越高"""
+        return self.success_rate / (1.0 + self.avg_latency / self.timeout)
+
+    def hedge_delay(self, percentile: float, default: float) -> float:
+        """本来源的延迟百分位数，样本不足时返回默认值"""
+        with self._lock:
+            if self.latency.count < 20:
+                return default
+            return self.latency.percentile(percentile)
+
+
+class HedgedPriceService:
+    """
+    对冲查询价格: 先向健康分最高的来源请求，超过其p95延迟仍未返回时再向下一个来源(或同一来源)发起请求，
+    先返回的有效结果生效，查询总耗时不超过各来源的超时时间
+    """
+
+    def __init__(self, sources: List[PriceSource], hedge_percentile: float = 95, min_hedge_delay: float = 0.05,
+                 max_hedge_delay: float = 1.0, default_hedge_delay: float = 0.3, retry_single_source: bool = True,
+                 max_workers: int = 8):
+        """
+        参数:
+        sources: 行情来源列表
+        hedge_percentile: 用于计算对冲延迟的延迟百分位
+        min_hedge_delay/max_hedge_delay: 对冲延迟的上下限(秒)
+        default_hedge_delay: 来源样本不足时的对冲延迟(秒)
+        retry_single_source: 只有一个来源时，是否向同一来源再发一次请求作为对冲
+        max_workers: 查询线程数
+        """
+        self.sources = sources
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.retry_single_source = retry_single_source
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="price-hedge")
+
+        # 统计信息
+        self.lookups = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+    def _hedge_delay(self, source: PriceSource) -> float:
+        delay = source.hedge_delay(self.hedge_percentile, self.default_hedge_delay)
+        return min(max(delay, self.min_hedge_delay), self.max_hedge_delay)
+
+    @staticmethod
+    def _call(source: PriceSource, inst_id: str) -> Optional[Dict[str, float]]:
+        start = time.perf_counter()
+        try:
+            data = source.fetch_func(inst_id)
+        except Exception as e:
+            print(f"行情来源{source.name}查询{inst_id}异常: {e}")
+            data = None
+        elapsed = time.perf_counter() - start
+        ok = bool(data) and data.get('bid_px', 0) > 0 and data.get('ask_px', 0) > 0 and elapsed <= source.timeout
+        source.record(ok, elapsed)
+        return data if ok else None
+
+    def get_price(self, inst_id: str) -> Optional[Dict]:
+        """
+        查询价格，返回 {'bid_px', 'ask_px', 'source', 'latency'}，所有来源都失败或超时时返回None
+        """
+        self.lookups += 1
+        start = time.perf_counter()
+        plan = sorted(self.sources, key=lambda s: s.score(), reverse=True)
+        if len(plan) == 1 and self.retry_single_source:
+            plan = plan * 2
+
+        pending = {}  # future -> (来源, 截止时间)
+        next_index = 0
+        next_launch = start
+
+        try:
+            while True:
+                now = time.perf_counter()
+                if next_index < len(plan) and now >= next_launch:
+                    source = plan[next_index]
+                    if next_index > 0:
+                        self.hedged += 1
+                        metrics.incr('price_hedged')
+                    pending[self._pool.submit(self._call, source, inst_id)] = (next_index, now + source.timeout)
+                    next_launch = now + self._hedge_delay(source)
+                    next_index += 1
+
+                # 超过单个来源超时时间的请求不再等待，并立即启用下一个来源
+                for future, (index, deadline) in list(pending.items()):
+                    if now >= deadline:
+                        del pending[future]
+                        next_launch = now
+                if not pending:
+                    if next_index >= len(plan):
+                        break
+                    continue
+
+                wake_at = min(deadline for _, deadline in pending.values())
+                if next_index < len(plan):
+                    wake_at = min(wake_at, next_launch)
+                done, _ = wait(list(pending), timeout=max(0.0, wake_at - time.perf_counter()),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, _ = pending.pop(future)
+                    data = future.result()
+                    if data:
+                        if index > 0:
+                            self.hedge_wins += 1
+                            metrics.incr('price_hedge_won')
+                        latency = time.perf_counter() - start
+                        return {'bid_px': data['bid_px'], 'ask_px': data['ask_px'],
+                                'source': plan[index].name, 'latency': latency}
+                    # 失败时不必等到对冲延迟，立即尝试下一个来源
+                    next_launch = time.perf_counter()
+        finally:
+            metrics.observe('price_lookup', time.perf_counter() - start)
+
+        self.failed += 1
+        metrics.incr('price_lookup_failure')
+        return None
+
+    def get_stats(self) -> Dict:
+        """获取对冲查询统计和各来源健康状况"""
+        return {
+            'lookups': self.lookups,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'failed': self.failed,
+            'sources': {
+                source.name: {
+                    'score': source.score(),
+                    'success_rate': source.success_rate,
+                    'avg_latency': source.avg_latency,
+                    'p95': source.latency.percentile(95),
+                    'failures': source.failures
+                } for source in self.sources
+            }
+        }
+
+
+def okx_ticker_source(market_api, name: str = "okx", timeout: float = 2.0) -> PriceSource:
+    """OKX REST行情来源"""
+
+    def fetch(inst_id: str) -> Optional[Dict[str, float]]:
+        result = market_api.get_ticker(instId=inst_id)
+        if result["code"] == "0" and len(result["data"]) > 0:
+            data = result["data"][0]
+            # 与推送行情一样使用交易所的时间戳，行情记录只使用一个时钟
+            return {"ask_px": float(data["askPx"]), "bid_px": float(data["bidPx"]), "ts": int(data["ts"])}
+        return None
+
+    return PriceSource(name, fetch, timeout=timeout)
+
+
+# CoinGecko使用币种ID而不是交易对
+COINGECKO_IDS = {'BTC': 'bitcoin', 'ETH': 'ethereum', 'SOL': 'solana', 'DOGE': 'dogecoin'}
+
+
+def coingecko_source(name: str = "coingecko", timeout: float = 3.0) -> PriceSource:
+    """CoinGecko行情来源，只有美元价格，买一价和卖一价相同"""
+    from myWork.ai.CoinGeckoAPI import CoinGeckoAPI
+
+    def fetch(inst_id: str) -> Optional[Dict[str, float]]:
+        coin_id = COINGECKO_IDS.get(inst_id.split('-')[0])
+        if coin_id is None:
+            return None
+        price = CoinGeckoAPI.get_simple_price(coin_id)
+        return {"ask_px": price, "bid_px": price} if price else None
+
+    return PriceSource(name, fetch, timeout=timeout)
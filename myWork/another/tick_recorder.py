@@ -0,0 +1,220 @@
+import json
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 每条记录定长28字节: 毫秒时间戳(int64)、产品编号(uint32)、买一价(float64)、卖一价(float64)
+RECORD_DTYPE = np.dtype([('ts', '<i8'), ('inst', '<u4'), ('bid', '<f8'), ('ask', '<f8')])
+_RECORD = struct.Struct('<qIdd')
+_DAY_MS = 86400 * 1000
+
+DEFAULT_RECORD_DIR = os.getenv("TICK_RECORD_DIR") or str(Path(__file__).parent / "ticks")
+
+
+def _day_of(ts_ms: int) -> str:
+    """按UTC日期切分文件，与交易所的日线划分一致"""
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+def _write_json_atomic(path: Path, data: Dict):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class TickRecorder:
+    """
+    把每次观察到的行情快照追加写入定长二进制日志，按天切分文件:
+    ticks-YYYYMMDD.bin 为记录数据，ticks-YYYYMMDD.idx.json 为索引(产品编号表、记录数、各产品的起止时间)
+
+    记录按到达顺序写入，时间戳保持原值不做修改。比上一条记录更早的行情(如推送延迟到达)计入索引的out_of_order，
+    读取时据此决定能否二分查找
+    """
+
+    def __init__(self, directory: str = DEFAULT_RECORD_DIR, flush_interval: float = 1.0):
+        """
+        参数:
+        directory: 日志目录
+        flush_interval: 写缓冲刷新到磁盘的最长间隔(秒)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._day = None
+        self._day_end = 0
+        self._index = None
+        self._last_ts = 0
+        self._last_flush = 0.0
+
+        # 统计信息
+        self.records = 0
+        self.out_of_order = 0
+
+    def record(self, inst_id: str, bid: float, ask: float, ts: Optional[int] = None):
+        """
+        追加一条行情快照
+
+        参数:
+        inst_id: 产品ID
+        bid: 买一价
+        ask: 卖一价
+        ts: 毫秒时间戳，默认为当前时间
+        """
+        if ts is None:
+            ts = time.time_ns() // 1_000_000
+        with self._lock:
+            if self._file is None or ts >= self._day_end:
+                self._rotate(ts)
+            if ts < self._last_ts:
+                # 保留原始时间戳，只计数，文件内不再保证时间戳不递减
+                self._index['out_of_order'] = self._index.get('out_of_order', 0) + 1
+                self.out_of_order += 1
+            else:
+                self._last_ts = ts
+
+            symbols = self._index['symbols']
+            code = symbols.get(inst_id)
+            if code is None:
+                code = symbols[inst_id] = len(symbols)
+                # 新产品立即写入索引，保证数据文件始终可以解析
+                self._write_index()
+            self._file.write(_RECORD.pack(ts, code, bid, ask))
+
+            stats = self._index['instruments'].setdefault(inst_id, {'count': 0, 'first_ts': ts, 'last_ts': ts})
+            stats['count'] += 1
+            stats['first_ts'] = min(stats['first_ts'], ts)
+            stats['last_ts'] = max(stats['last_ts'], ts)
+            self._index['count'] += 1
+            self.records += 1
+
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._flush()
+                self._last_flush = now
+
+    def on_ticker(self, inst_id: str, data: Dict):
+        """行情推送回调，可直接传给TickerStream.add_listener，使用交易所推送的时间戳，缺失时使用本地时间"""
+        self.record(inst_id, data['bid_px'], data['ask_px'], ts=data.get('ts') or None)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._write_index()
+
+    def _write_index(self):
+        _write_json_atomic(self.directory / f"ticks-{self._day}.idx.json", self._index)
+
+    def _rotate(self, ts: int):
+        if self._file is not None:
+            self._flush()
+            self._file.close()
+
+        self._day = _day_of(ts)
+        self._day_end = (ts // _DAY_MS + 1) * _DAY_MS
+        data_path = self.directory / f"ticks-{self._day}.bin"
+        index_path = self.directory / f"ticks-{self._day}.idx.json"
+
+        if index_path.exists():
+            # 重启后继续追加到当天的文件
+            with open(index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+            last_ts = [stats['last_ts'] for stats in self._index['instruments'].values()]
+            self._last_ts = max(last_ts + [self._last_ts])
+        else:
+            self._index = {'day': self._day, 'record_size': RECORD_DTYPE.itemsize, 'count': 0,
+                           'out_of_order': 0, 'symbols': {}, 'instruments': {}}
+
+        # 上次异常退出可能留下不完整的记录，截断到整条记录
+        if data_path.exists():
+            size = data_path.stat().st_size
+            complete = size - size % RECORD_DTYPE.itemsize
+            if complete != size:
+                os.truncate(data_path, complete)
+            self._index['count'] = complete // RECORD_DTYPE.itemsize
+        self._file = open(data_path, "ab", buffering=64 * 1024)
+        print(f"行情记录文件: {data_path}")
+
+
+class TickJournalReader:
+    """读取TickRecorder写入的日志，数据文件直接内存映射为NumPy数组，无需解析"""
+
+    def __init__(self, directory: str = DEFAULT_RECORD_DIR):
+        self.directory = Path(directory)
+
+    def days(self) -> List[str]:
+        """已记录的日期列表(YYYYMMDD)"""
+        return sorted(path.name[6:14] for path in self.directory.glob("ticks-*.bin"))
+
+    def index(self, day: str) -> Dict:
+        with open(self.directory / f"ticks-{day}.idx.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def open_day(self, day: str) -> np.ndarray:
+        """把一天的数据映射为只读结构化数组，字段为ts、inst、bid、ask"""
+        path = self.directory / f"ticks-{day}.bin"
+        count = path.stat().st_size // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def load(self, day: str, inst_id: Optional[str] = None, start_ms: Optional[int] = None,
+             end_ms: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        读取一天的行情，返回 {'ts', 'bid', 'ask', 'inst'} 数组，按时间升序
+
+        参数:
+        day: 日期(YYYYMMDD)
+        inst_id: 只返回该产品，为空时返回全部产品
+        start_ms/end_ms: 时间范围[start_ms, end_ms)，文件内时间戳不递减时通过二分查找定位，不扫描整个文件
+        """
+        records = self.open_day(day)
+        index = self.index(day)
+        # 有乱序记录时不能二分查找，按条件筛选后再按时间稳定排序
+        ordered = not index.get('out_of_order')
+        if start_ms is not None or end_ms is not None:
+            ts = records['ts']
+            if ordered:
+                lo = int(np.searchsorted(ts, start_ms, side='left')) if start_ms is not None else 0
+                hi = int(np.searchsorted(ts, end_ms, side='left')) if end_ms is not None else len(records)
+                records = records[lo:hi]
+            else:
+                mask = np.ones(len(records), dtype=bool)
+                if start_ms is not None:
+                    mask &= ts >= start_ms
+                if end_ms is not None:
+                    mask &= ts < end_ms
+                records = records[mask]
+        if inst_id is not None:
+            code = index['symbols'].get(inst_id)
+            if code is None:
+                records = records[:0]
+            else:
+                records = records[records['inst'] == code]
+        if not ordered:
+            records = records[np.argsort(records['ts'], kind='stable')]
+        return {'ts': records['ts'], 'bid': records['bid'], 'ask': records['ask'], 'inst': records['inst']}
+
+    def symbols(self, day: str) -> Dict[int, str]:
+        """产品编号到产品ID的映射"""
+        return {code: inst_id for inst_id, code in self.index(day)['symbols'].items()}
@@ -1,10 +1,10 @@
 import os
 import time
 
-import requests
 from dotenv import load_dotenv
 
 from myWork.another.all import process_trade_records
+from myWork.another.http_client import get_http_client
 
 
 def get_data(user_name):
@@ -31,9 +31,8 @@ def get_data(user_name):
         import json
         headers = json.loads(headers_content)
 
-    response = requests.get(url, params=params, headers=headers)
-
-    response_json = response.json()
+    # 复用共享连接池，并按接口限速排队
+    response_json = get_http_client().get_json(url, params=params, headers=headers)
 
     # 处理数据空值和类型转换
     data = response_json["data"]
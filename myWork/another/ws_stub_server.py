@@ -0,0 +1,182 @@
+"""
+本地WebSocket行情模拟服务器，用于在不连接交易所的情况下测试TickerStream，
+并对比推送读取与REST轮询的延迟。tests/test_ws_ticker.py 使用它验证订阅、读取价格和断线后重新订阅。
+
+直接运行: python myWork/another/ws_stub_server.py
+"""
+import asyncio
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import websockets
+
+# Add project root to Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from myWork.another.ws_ticker import TickerStream
+
+
+class LocalTickerServer:
+    """模拟OKX公共频道的tickers推送，价格为随机游走"""
+
+    def __init__(self, host="127.0.0.1", port=0, push_interval=0.1, base_prices=None):
+        self.host = host
+        self.port = port
+        self.push_interval = push_interval
+        self.prices = dict(base_prices or {"BTC-USDT-SWAP": 100000.0})
+        self.subscribe_count = 0
+
+        self._clients = {}  # websocket -> 订阅的产品集合
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stop_event = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self):
+        """在后台线程中启动服务器，返回后即可连接"""
+        self._thread = threading.Thread(target=self._thread_main, name="ticker-stub", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread:
+            self._thread.join(5)
+
+    def drop_connections(self):
+        """主动断开所有客户端连接，用于验证重连和重新订阅"""
+        for ws in list(self._clients):
+            asyncio.run_coroutine_threadsafe(ws.close(), self._loop)
+
+    def current_price(self, inst_id):
+        """当前最新价，模拟REST get_ticker返回的内容"""
+        last = self.prices[inst_id]
+        return {"ask_px": round(last + 0.1, 1), "bid_px": round(last - 0.1, 1)}
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._main())
+        self._loop.close()
+
+    async def _main(self):
+        self._stop_event = asyncio.Event()
+        async with websockets.serve(self._handler, self.host, self.port) as server:
+            self.port = list(server.sockets)[0].getsockname()[1]
+            self._ready.set()
+            pusher = asyncio.ensure_future(self._push_loop())
+            await self._stop_event.wait()
+            pusher.cancel()
+
+    async def _handler(self, ws):
+        self._clients[ws] = set()
+        try:
+            async for message in ws:
+                if message == "ping":
+                    await ws.send("pong")
+                    continue
+                msg = json.loads(message)
+                if msg.get("op") == "subscribe":
+                    for arg in msg.get("args", []):
+                        self._clients[ws].add(arg["instId"])
+                        self.prices.setdefault(arg["instId"], 100.0)
+                        await ws.send(json.dumps({"event": "subscribe", "arg": arg}))
+                    self.subscribe_count += 1
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._clients.pop(ws, None)
+
+    async def _push_loop(self):
+        while True:
+            await asyncio.sleep(self.push_interval)
+            ts = str(int(time.time() * 1000))
+            for inst_id in self.prices:
+                self.prices[inst_id] *= 1 + random.gauss(0, 0.0005)
+            for ws, inst_ids in list(self._clients.items()):
+                for inst_id in inst_ids:
+                    price = self.current_price(inst_id)
+                    payload = {
+                        "arg": {"channel": "tickers", "instId": inst_id},
+                        "data": [{
+                            "instId": inst_id,
+                            "askPx": str(price["ask_px"]),
+                            "bidPx": str(price["bid_px"]),
+                            "ts": ts
+                        }]
+                    }
+                    try:
+                        await ws.send(json.dumps(payload))
+                    except websockets.ConnectionClosed:
+                        break
+
+
+def compare_latency(rest_latency=0.08, poll_interval=5.0, reads=200):
+    """
+    对比推送读取与REST轮询:
+    - 读取耗时: 推送为内存读取，轮询每次读取都要等待一次REST往返
+    - 价格滞后: 轮询模式下两次请求之间价格不更新，平均滞后约为轮询间隔的一半
+    """
+    inst_id = "BTC-USDT-SWAP"
+    server = LocalTickerServer(push_interval=0.05).start()
+    stream = TickerStream([inst_id], url=server.url, reconnect_delay=0.2)
+    stream.start()
+    if not stream.wait_ready(timeout=5):
+        print("模拟服务器未推送行情")
+        return
+
+    def rest_get_ticker():
+        time.sleep(rest_latency)  # 模拟一次REST往返
+        return server.current_price(inst_id)
+
+    stream_costs = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        stream.get_price(inst_id)
+        stream_costs.append((time.perf_counter() - start) * 1000)
+
+    rest_costs = []
+    for _ in range(min(reads, 20)):
+        start = time.perf_counter()
+        rest_get_ticker()
+        rest_costs.append((time.perf_counter() - start) * 1000)
+
+    # 推送数据的滞后: 读取时距离最近一次推送的时间
+    stream_ages = []
+    for _ in range(50):
+        data = stream.get_price(inst_id)
+        stream_ages.append((time.monotonic() - data['received_at']) * 1000)
+        time.sleep(random.uniform(0, 0.05))
+
+    print(f"推送读取耗时: 平均 {statistics.mean(stream_costs):.4f} ms, "
+          f"最大 {max(stream_costs):.4f} ms")
+    print(f"REST读取耗时: 平均 {statistics.mean(rest_costs):.2f} ms, "
+          f"最大 {max(rest_costs):.2f} ms")
+    print(f"推送价格滞后: 平均 {statistics.mean(stream_ages):.1f} ms")
+    print(f"轮询价格滞后(间隔{poll_interval}秒): 平均约 {poll_interval * 1000 / 2 + rest_latency * 1000:.1f} ms")
+
+    # 验证断线重连后自动重新订阅
+    subscribe_before = server.subscribe_count
+    server.drop_connections()
+    time.sleep(1)
+    print(f"断线重连次数: {stream.reconnect_count}, "
+          f"重新订阅: {'是' if server.subscribe_count > subscribe_before else '否'}, "
+          f"价格可读: {'是' if stream.get_price(inst_id) else '否'}")
+
+    stream.stop()
+    server.stop()
+
+
+if __name__ == "__main__":
+    compare_latency()
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import websockets
+
+# OKX公共频道地址
+OKX_PUBLIC_WS_URL = "wss://ws.okx.com:8443/ws/v5/public"
+OKX_PUBLIC_WS_URL_DEMO = "wss://wspap.okx.com:8443/ws/v5/public?brokerId=9999"
+
+
+class TickerStream:
+    """订阅OKX公共tickers频道，在内存中维护每个产品最新的买一/卖一价"""
+
+    def __init__(self, inst_ids: Iterable[str], url: str = OKX_PUBLIC_WS_URL, ping_interval: float = 20,
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 30, stale_after: float = 10):
+        """
+        参数:
+        inst_ids: 需要订阅的产品ID列表
+        url: WebSocket地址
+        ping_interval: 无消息多少秒后发送ping(OKX要求30秒内必须有交互)
+        reconnect_delay: 断线后首次重连等待秒数，之后指数退避
+        max_reconnect_delay: 重连等待的上限(秒)
+        stale_after: 超过多少秒未更新的价格视为过期，读取时返回None
+        """
+        self.url = url
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stale_after = stale_after
+
+        # _inst_ids和_ws会被调用线程和推送线程同时访问，读写都要持有_lock
+        self._inst_ids = set(inst_ids)
+        self._prices = {}  # inst_id -> {'ask_px', 'bid_px', 'ts', 'received_at'}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+        self._thread = None
+        self._loop = None
+        self._ws = None
+        self._stopping = False
+        self._stop_event = None
+        self.connected = threading.Event()
+
+        # 统计信息
+        self.message_count = 0
+        self.reconnect_count = 0
+
+    def start(self):
+        """在后台线程中启动推送连接"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._thread_main, name="ticker-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """停止推送连接并等待后台线程退出"""
+        self._stopping = True
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread:
+            self._thread.join(timeout)
+        self.connected.clear()
+
+    def wait_ready(self, inst_ids: Optional[Iterable[str]] = None, timeout: float = 10) -> bool:
+        """等待指定产品收到第一条行情，超时返回False"""
+        if inst_ids:
+            targets = set(inst_ids)
+        else:
+            with self._lock:
+                targets = set(self._inst_ids)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if targets.issubset(self._prices.keys()):
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def add_instruments(self, inst_ids: Iterable[str]):
+        """追加订阅产品，已连接时立即发送订阅请求"""
+        with self._lock:
+            new_ids = set(inst_ids) - self._inst_ids
+            if not new_ids:
+                return
+            self._inst_ids |= new_ids
+            # 未连接时不发送，连接建立后会订阅全部产品
+            ws, loop = self._ws, self._loop
+        if loop and ws is not None:
+            asyncio.run_coroutine_threadsafe(self._subscribe(ws, new_ids), loop)
+
+    def add_listener(self, callback: Callable[[str, Dict], None]):
+        """注册行情回调 callback(inst_id, price_data)，在推送线程中调用，需尽快返回"""
+        self._listeners.append(callback)
+
+    def get_price(self, inst_id: str, max_age: Optional[float] = None) -> Optional[Dict[str, float]]:
+        """读取内存中的最新价格，不产生网络请求；无数据或已过期时返回None"""
+        max_age = self.stale_after if max_age is None else max_age
+        with self._lock:
+            data = self._prices.get(inst_id)
+            if data is None:
+                return None
+            if max_age and time.monotonic() - data['received_at'] > max_age:
+                return None
+            return dict(data)
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._run())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    async def _run(self):
+        """连接主循环，断线后指数退避重连并自动重新订阅"""
+        self._stop_event = asyncio.Event()
+        delay = self.reconnect_delay
+        while not self._stopping:
+            try:
+                async with websockets.connect(self.url, ping_interval=None) as ws:
+                    # 设置连接和复制订阅列表在同一个锁内，之后追加的产品由add_instruments在该连接上订阅
+                    with self._lock:
+                        self._ws = ws
+                        inst_ids = set(self._inst_ids)
+                    await self._subscribe(ws, inst_ids)
+                    self.connected.set()
+                    delay = self.reconnect_delay
+                    await self._consume(ws)
+            except Exception as e:
+                if not self._stopping:
+                    print(f"行情推送连接异常: {e}")
+            finally:
+                with self._lock:
+                    self._ws = None
+                self.connected.clear()
+
+            if self._stopping:
+                break
+            self.reconnect_count += 1
+            print(f"行情推送断开，{delay}秒后重连")
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _subscribe(self, ws, inst_ids):
+        if not inst_ids:
+            return
+        payload = {
+            "op": "subscribe",
+            "args": [{"channel": "tickers", "instId": inst_id} for inst_id in sorted(inst_ids)]
+        }
+        await ws.send(json.dumps(payload))
+
+    async def _consume(self, ws):
+        stop_task = asyncio.ensure_future(self._stop_event.wait())
+        waiting_pong = False
+        try:
+            while not self._stopping:
+                recv_task = asyncio.ensure_future(ws.recv())
+                done, _ = await asyncio.wait({recv_task, stop_task}, timeout=self.ping_interval,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if stop_task in done:
+                    recv_task.cancel()
+                    return
+                if recv_task not in done:
+                    recv_task.cancel()
+                    if waiting_pong:
+                        raise ConnectionError("心跳超时")
+                    # 长时间没有消息，发送ping保活
+                    await ws.send("ping")
+                    waiting_pong = True
+                    continue
+
+                waiting_pong = False
+                message = recv_task.result()
+                if message == "pong":
+                    continue
+                self._handle_message(message)
+        finally:
+            stop_task.cancel()
+
+    def _handle_message(self, message):
+        msg = json.loads(message)
+        if "event" in msg:
+            if msg["event"] == "error":
+                print(f"行情订阅错误 (代码: {msg.get('code')}): {msg.get('msg')}")
+            return
+
+        arg = msg.get("arg", {})
+        if arg.get("channel") != "tickers":
+            return
+
+        received_at = time.monotonic()
+        updates = []
+        with self._lock:
+            for item in msg.get("data", []):
+                if not item.get("askPx") or not item.get("bidPx"):
+                    continue
+                data = {
+                    'ask_px': float(item["askPx"]),
+                    'bid_px': float(item["bidPx"]),
+                    'ts': int(item.get("ts", 0)),
+                    'received_at': received_at
+                }
+                self._prices[item["instId"]] = data
+                updates.append((item["instId"], data))
+            self.message_count += 1
+
+        for inst_id, data in updates:
+            for callback in self._listeners:
+                try:
+                    callback(inst_id, dict(data))
+                except Exception as e:
+                    print(f"行情回调异常: {e}")
+
+    @property
+    def inst_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(self._inst_ids)
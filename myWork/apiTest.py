@@ -1,4 +1,4 @@
-import okx.MarketData as MarketData
+import sys
 import time
 import datetime
 import pandas as pd
@@ -7,8 +7,13 @@ import json
 import random
 import pymysql
 from dotenv import load_dotenv
+from pathlib import Path
 from tqdm import tqdm
 
+# Add project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+from myWork.another.okx_api import MarketAPI
+
 # ======================
 # 配置参数
 # ======================
@@ -149,8 +154,9 @@ def save_to_mysql(df):
 
 # ======================
 # 初始化API客户端
+# 请求经过共享的限速连接池，按接口文档限速(历史K线20次/2秒)排队，被限速时自动退避
 # ======================
-market_data_api = MarketData.MarketAPI(flag=CONFIG["API_ENV"], proxy='http://127.0.0.1:7890')
+market_data_api = MarketAPI(flag=CONFIG["API_ENV"], proxy='http://127.0.0.1:7890')
 
 
 # ======================
@@ -259,23 +265,12 @@ def main():
                 f"目标时间范围: {start_time.strftime('%Y-%m-%d %H:%M:%S')} 至 {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
         # 数据获取参数
-        request_count = 0
-        start_time_window = time.time()
         batch_data = []
 
         # 数据获取主循环
         while True:
             try:
-                # 处理API限速 (20次/2秒)
-                request_count += 1
-                if request_count > 20:
-                    elapsed = time.time() - start_time_window
-                    if elapsed < 2:
-                        time.sleep(2 - elapsed)
-                    request_count = 0
-                    start_time_window = time.time()
-
-                # 发起API请求（带重试机制）
+                # 发起API请求（带重试机制，限速由共享客户端处理）
                 response = fetch_data_with_retry(current_after_ts)
 
                 page_data = response.get("data", [])
@@ -341,9 +336,6 @@ def main():
                         print("保存数据到MySQL失败，程序退出")
                         return
 
-                # 安全间隔 (避免突发流量)
-                time.sleep(0.1)
-
             except Exception as e:
                 print(f"发生异常: {str(e)}")
                 print("保存当前状态并退出...")
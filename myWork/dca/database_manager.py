@@ -1,27 +1,61 @@
+import threading
+from functools import partial
+
 import pymysql
+
+from myWork.another.db_pool import ConnectionPool
+from myWork.another.metrics import metrics
 # 由于 datetime 导入项未使用，将其移除，不添加新的导入代码
 import time  # 添加此行
 
 
 class DatabaseManager:
-    def __init__(self, host, user, password, database):
-        """初始化数据库连接参数"""
+    def __init__(self, host, user, password, database, pool_size=0):
+        """
+        初始化数据库连接参数
+
+        pool_size大于0时使用连接池，connect/disconnect变为从池中借出/归还连接，
+        且每个线程持有各自的连接，可在多线程中共用同一个DatabaseManager
+        """
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
+        self._local = threading.local()
+        self.pool = None
+        if pool_size:
+            self.pool = ConnectionPool(
+                partial(pymysql.connect, host=host, user=user, password=password, database=database,
+                        cursorclass=pymysql.cursors.DictCursor),
+                max_size=pool_size,
+                idle_check_seconds=30
+            )
+
+    @property
+    def connection(self):
+        return getattr(self._local, 'connection', None)
+
+    @connection.setter
+    def connection(self, value):
+        self._local.connection = value
 
     def connect(self):
         """建立数据库连接"""
+        # 每个数据库操作都以connect开始，以此统计调用次数
+        metrics.incr('db_calls')
         try:
-            self.connection = pymysql.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            if self.pool:
+                with metrics.timer('db_connect'):
+                    self.connection = self.pool.acquire()
+                return True
+            with metrics.timer('db_connect'):
+                self.connection = pymysql.connect(
+                    host=self.host,
+                    user=self.user,
+                    password=self.password,
+                    database=self.database,
+                    cursorclass=pymysql.cursors.DictCursor
+                )
             return True
         except pymysql.Error as e:
             print(f"数据库连接错误: {e}")
@@ -30,7 +64,10 @@ class DatabaseManager:
     def disconnect(self):
         """关闭数据库连接"""
         if self.connection:
-            self.connection.close()
+            if self.pool:
+                self.pool.release(self.connection)
+            else:
+                self.connection.close()
             self.connection = None
 
     def create_tables(self):
@@ -377,3 +414,32 @@ class DatabaseManager:
             return False
         finally:
             self.disconnect()
+
+    def save_trade_log(self, inst_id, trade_time, trade_info, price, order_id):
+        """保存成交后的交易日志到 trade_logs 表"""
+        if not self.connect():
+            return False
+
+        try:
+            with self.connection.cursor() as cursor:
+                query = '''
+                INSERT INTO trade_logs (inst_id, trade_time, trade_type, price, position, fee, order_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                '''
+                cursor.execute(query, (
+                    inst_id,
+                    trade_time,
+                    trade_info['type'],
+                    price,
+                    trade_info['position'],
+                    trade_info['fee'],
+                    order_id
+                ))
+            self.connection.commit()
+            return True
+        except pymysql.Error as e:
+            print(f"保存交易日志错误: {e}")
+            self.connection.rollback()
+            return False
+        finally:
+            self.disconnect()
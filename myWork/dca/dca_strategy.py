@@ -54,6 +54,10 @@ class DcaExeStrategy:
         self.strategy_name = strategy_name or str(uuid.uuid4())  # 默认使用UUID作为策略名称
         self.strategy_id = None
 
+        # 触发区间缓存，持仓或参数变化时重新计算
+        self._bands = None
+        self._bands_key = None
+
     def execute_logic(self, current_time, current_price, inst_id=None):
         """执行交易逻辑并返回交易决策"""
         # 如果没有持仓，创建初始仓位
@@ -79,6 +83,63 @@ class DcaExeStrategy:
 
         return None
 
+    def get_trigger_bands(self):
+        """
+        获取当前持仓的触发区间，只在交易或参数变化后重新计算一次
+
+        返回:
+        {
+            'take_profit_price': 达到或高于该价格时止盈，无持仓均价时为None,
+            'dca_price': 达到或低于该价格时DCA，无上次交易价格时为None,
+            'deadline': 到达该时间时DCA，无上次交易时间时为None,
+            'time_threshold': 本轮随机选择的时间阈值(小时),
+            'always': 是否每次都需要评估(无持仓需要建仓，或没有上次交易时间)
+        }
+        """
+        key = (self.portfolio['position'], self.portfolio['avg_price'], self.portfolio['last_trade_time'],
+               self.portfolio['last_trade_price'], self.take_profit_threshold, self.price_drop_threshold,
+               self.min_time_since_last_trade, self.max_time_since_last_trade)
+        if key == self._bands_key:
+            return self._bands
+
+        last_trade_time = self.portfolio['last_trade_time']
+        last_trade_price = self.portfolio['last_trade_price']
+        avg_price = self.portfolio['avg_price']
+
+        # 使用上次交易时间作为种子生成固定随机阈值，确保间隔均匀分布
+        # 使用独立的随机数生成器，避免多策略并发时互相覆盖全局random的种子
+        if last_trade_time:
+            seed = int(last_trade_time.timestamp())
+            time_threshold = random.Random(seed).uniform(self.min_time_since_last_trade,
+                                                         self.max_time_since_last_trade)
+            deadline = last_trade_time + datetime.timedelta(hours=time_threshold)
+        else:
+            time_threshold = 0
+            deadline = None
+
+        self._bands = {
+            'take_profit_price': avg_price * (1 + self.take_profit_threshold) if avg_price else None,
+            'dca_price': last_trade_price / (1 + self.price_drop_threshold) if last_trade_price else None,
+            'deadline': deadline,
+            'time_threshold': time_threshold,
+            'always': self.portfolio['position'] == 0 or (last_trade_price is not None and deadline is None)
+        }
+        self._bands_key = key
+        print(f"[{self.strategy_name}] 触发区间: 止盈价 {self._bands['take_profit_price']}, "
+              f"DCA价 {self._bands['dca_price']}, 时间阈值 {time_threshold:.2f} 小时, 截止 {deadline}")
+        return self._bands
+
+    def needs_evaluation(self, current_time, current_price):
+        """价格穿过触发区间或到达截止时间时返回True，此时才需要调用execute_logic"""
+        bands = self.get_trigger_bands()
+        if bands['always']:
+            return True
+        if bands['take_profit_price'] is not None and current_price >= bands['take_profit_price']:
+            return True
+        if bands['dca_price'] is not None and current_price <= bands['dca_price']:
+            return True
+        return bands['deadline'] is not None and current_time >= bands['deadline']
+
     def _save_state_and_trade(self, trade_info, inst_id=None):
         """保存策略状态和交易记录到数据库"""
         if not self.database_manager:
@@ -215,41 +276,22 @@ class DcaExeStrategy:
 
     def _should_take_profit(self, current_price):
         """判断是否应该止盈"""
-        # 计算当前持仓的收益率
-        if self.portfolio['avg_price'] == 0:
-            return False
-
-        current_return = (current_price / self.portfolio['avg_price']) - 1
-
-        # 如果收益率达到或超过止盈阈值，则止盈
-        return current_return >= self.take_profit_threshold
+        # 收益率达到或超过止盈阈值，即价格达到止盈价
+        take_profit_price = self.get_trigger_bands()['take_profit_price']
+        return take_profit_price is not None and current_price >= take_profit_price
 
     def _should_dca(self, current_time, current_price):
         """判断是否应该执行DCA"""
         if self.portfolio['last_trade_price'] is None:
             return False
 
-        # 计算价格下跌幅度
-        price_drop = (self.portfolio['last_trade_price'] / current_price) - 1
-
-        # 计算自上次交易以来的时间(小时)
-        if self.portfolio['last_trade_time']:
-            time_since_last_trade = (current_time - self.portfolio['last_trade_time']).total_seconds() / 3600
-        else:
-            time_since_last_trade = float('inf')
-
-        # 使用上次交易时间作为种子生成固定随机阈值，确保间隔均匀分布
-        if self.portfolio['last_trade_time']:
-            # 将时间戳转换为整数作为随机种子
-            seed = int(self.portfolio['last_trade_time'].timestamp())
-            random.seed(seed)
-            random_time_threshold = random.uniform(self.min_time_since_last_trade, self.max_time_since_last_trade)
-            print("当前选择的时间阈值", random_time_threshold, "小时，已过去", time_since_last_trade, "小时")
-        else:
-            random_time_threshold = 0
+        bands = self.get_trigger_bands()
+        # 没有上次交易时间时时间阈值为0，直接执行DCA
+        if bands['deadline'] is None:
+            return True
 
         # 如果价格下跌超过阈值或者无交易时间超过随机时间阈值，则执行DCA
-        return (price_drop >= self.price_drop_threshold) or (time_since_last_trade >= random_time_threshold)
+        return current_price <= bands['dca_price'] or current_time >= bands['deadline']
 
     def _create_dca_order(self, current_time, current_price, inst_id=None):
         """创建DCA订单"""
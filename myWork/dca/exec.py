@@ -2,7 +2,6 @@ import os
 import time
 from datetime import datetime
 
-import pymysql
 from dotenv import load_dotenv
 # from okx.Trade import TradeAPI
 
@@ -11,7 +10,8 @@ from pathlib import Path
 
 # Add project root to Python path
 sys.path.append(str(Path(__file__).parent.parent.parent))
-from myWork.another.all import get_realtime_price
+from myWork.another.all import get_realtime_price, preload_instruments, start_tick_recorder, start_ticker_stream
+from myWork.another.metrics import metrics, start_metrics_from_env
 from myWork.dca.database_manager import DatabaseManager
 from myWork.dca.dca_strategy import DcaExeStrategy
 from myWork.dca.trade import TradingExecutor
@@ -31,6 +31,8 @@ ENV_FLAG = os.getenv("OKX_ENV_FLAG")
 load_dotenv()
 MYSQL_CONN = os.getenv("MYSQL_CONN")
 MYSQL_PASS = os.getenv("MYSQL_PASS")
+# 未触发评估时重新加载策略状态的间隔(秒)
+STATE_REFRESH_SECONDS = 300
 
 
 def main():
@@ -45,6 +47,9 @@ def main():
 
     db_manager.create_tables()
 
+    # 按环境变量开启指标接口(METRICS_PORT)或定时输出(METRICS_DUMP_INTERVAL)
+    start_metrics_from_env()
+
     # 初始化交易执行器
     executor = TradingExecutor(db_manager)
 
@@ -71,6 +76,13 @@ def main():
     # 交易对
     inst_id = "BTC-USDT-SWAP"
 
+    # 设置了TICK_RECORD_DIR时记录观察到的每个行情快照
+    start_tick_recorder()
+    # 订阅行情推送，之后读取价格不再每次请求REST接口
+    start_ticker_stream([inst_id])
+    # 启动时批量加载产品信息，下单时直接查表
+    preload_instruments()
+
     # 示例：手动执行一次交易决策
     current_time = datetime.now()
     price_data = get_realtime_price(inst_id)
@@ -86,65 +98,42 @@ def main():
         if order_id:
             print(f"交易执行成功，订单ID: {order_id}")
             # 保存交易日志
-            if db_manager.connect():
-                try:
-                    with db_manager.connection.cursor() as cursor:
-                        query = '''
-                        INSERT INTO trade_logs (inst_id, trade_time, trade_type, price, position, fee, order_id)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        '''
-                        cursor.execute(query, (
-                            inst_id,
-                            current_time,
-                            trade_decision['type'],
-                            current_price,
-                            trade_decision['position'],
-                            trade_decision['fee'],
-                            order_id
-                        ))
-                    db_manager.connection.commit()
-                except pymysql.Error as e:
-                    print(f"保存交易日志错误: {e}")
-                    db_manager.connection.rollback()
-                finally:
-                    db_manager.disconnect()
+            db_manager.save_trade_log(inst_id, current_time, trade_decision, current_price, order_id)
         else:
             print("交易执行失败")
 
     print("开始循环")
+    state_loaded_at = time.monotonic()
 
     while True:
         try:
-            current_time = datetime.now()
-            current_price = get_realtime_price(inst_id)['bid_px']
-            strategy.load_state()  # 每次循环都加载最新状态
-            trade_decision = strategy.execute_logic(current_time, current_price)
-            if trade_decision:
-                order_id = executor.execute_trade(inst_id, trade_decision)
-                if order_id:
-                    # 保存交易日志
-                    if db_manager.connect():
-                        try:
-                            with db_manager.connection.cursor() as cursor:
-                                query = '''
-                                INSERT INTO trade_logs (inst_id, trade_time, trade_type, price, position, fee, order_id)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                                '''
-                                cursor.execute(query, (
-                                    inst_id,
-                                    current_time,
-                                    trade_decision['type'],
-                                    current_price,
-                                    trade_decision['position'],
-                                    trade_decision['fee'],
-                                    order_id
-                                ))
-                            db_manager.connection.commit()
-                        except pymysql.Error as e:
-                            print(f"保存交易日志错误: {e}")
-                            db_manager.connection.rollback()
-                        finally:
-                            db_manager.disconnect()
+            # 记录每个阶段的耗时，见metrics.render_text()
+            with metrics.tick():
+                current_time = datetime.now()
+                with metrics.timer('price_fetch'):
+                    current_price = get_realtime_price(inst_id)['bid_px']
+                # 价格未穿过触发区间且未到截止时间时跳过评估，也不读取数据库
+                # 数据库中的状态可能被外部修改，定时重新加载一次触发区间
+                if time.monotonic() - state_loaded_at >= STATE_REFRESH_SECONDS:
+                    with metrics.timer('load_state'):
+                        strategy.load_state()
+                    state_loaded_at = time.monotonic()
+                trade_decision = None
+                if strategy.needs_evaluation(current_time, current_price):
+                    # 评估前加载最新状态，加载后仍需要评估时才执行策略
+                    with metrics.timer('load_state'):
+                        strategy.load_state()
+                    state_loaded_at = time.monotonic()
+                    if strategy.needs_evaluation(current_time, current_price):
+                        with metrics.timer('execute_logic'):
+                            trade_decision = strategy.execute_logic(current_time, current_price)
+                if trade_decision:
+                    with metrics.timer('execute_trade'):
+                        order_id = executor.execute_trade(inst_id, trade_decision)
+                    if order_id:
+                        # 保存交易日志
+                        with metrics.timer('trade_log'):
+                            db_manager.save_trade_log(inst_id, current_time, trade_decision, current_price, order_id)
             time.sleep(5)  # 每5秒检查一次
         except Exception as e:
             print(f"循环中出现错误: {e}")
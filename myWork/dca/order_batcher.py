@@ -0,0 +1,102 @@
+import asyncio
+import uuid
+from typing import Dict, List
+
+
+class OrderBatcher:
+    """在短时间窗口内收集多个下单请求，通过批量下单接口一次提交，再把每个订单的结果分发回调用方"""
+
+    MAX_BATCH_SIZE = 20  # OKX批量下单接口每次最多20个订单
+
+    def __init__(self, trade_api, window: float = 0.02, max_batch_size: int = MAX_BATCH_SIZE):
+        """
+        参数:
+        trade_api: okx交易接口实例，需要提供set_order和set_batch_orders
+        window: 收集窗口(秒)，第一个订单到达后最多等待该时间再提交
+        max_batch_size: 每批最多订单数，达到后立即提交
+        """
+        self.trade_api = trade_api
+        self.window = window
+        self.max_batch_size = min(max_batch_size, self.MAX_BATCH_SIZE)
+        self._pending = []  # (下单参数, future)
+        self._flush_handle = None
+
+        # 统计信息
+        self.orders = 0
+        self.requests = 0
+
+    async def submit(self, order_params: Dict) -> Dict:
+        """
+        提交一个订单，返回与set_order格式一致的结果:
+        {"code": "0"或错误码, "msg": ..., "data": [{"ordId", "clOrdId", "sCode", "sMsg"}]}
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        params = dict(order_params)
+        # 使用客户自定义订单ID对应批量结果
+        params.setdefault('clOrdId', uuid.uuid4().hex)
+        self._pending.append((params, future))
+        self.orders += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: List):
+        orders = [params for params, _ in batch]
+        self.requests += 1
+        try:
+            if len(orders) == 1:
+                result = await asyncio.to_thread(self.trade_api.set_order, **orders[0])
+            else:
+                print(f"批量提交 {len(orders)} 个订单")
+                result = await asyncio.to_thread(self.trade_api.set_batch_orders, orders)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._dispatch(batch, result)
+
+    @staticmethod
+    def _dispatch(batch: List, result: Dict):
+        """按clOrdId把批量结果拆分给各个调用方"""
+        items = {item.get('clOrdId'): item for item in result.get('data') or []}
+        for params, future in batch:
+            if future.done():
+                continue
+            item = items.get(params['clOrdId'])
+            if item is None:
+                # 整批请求失败(如签名错误、限频)，没有单个订单的结果
+                error_code = result.get('code', '-1')
+                future.set_result({
+                    'code': error_code,
+                    'msg': result.get('msg', ''),
+                    'data': [{'sCode': error_code, 'sMsg': result.get('msg') or '批量下单未返回该订单结果'}]
+                })
+            else:
+                future.set_result({
+                    'code': '0' if item.get('sCode') == '0' else item.get('sCode', '-1'),
+                    'msg': item.get('sMsg', ''),
+                    'data': [item]
+                })
+
+    def get_stats(self) -> Dict:
+        """获取批量提交统计"""
+        return {
+            'orders': self.orders,
+            'requests': self.requests,
+            'orders_per_request': self.orders / self.requests if self.requests else 0
+        }
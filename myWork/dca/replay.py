@@ -0,0 +1,347 @@
+import argparse
+import copy
+import csv
+import io
+import random
+import sys
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Tuple
+
+# Add project root to Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from myWork.another.instruments import InstrumentSpec
+from myWork.another.metrics import metrics
+from myWork.another.tick_recorder import TickJournalReader
+from myWork.dca import trade
+from myWork.dca.dca_strategy import DcaExeStrategy
+from myWork.dca.trade import TradingExecutor
+
+
+class VirtualClock:
+    """虚拟时钟，模拟的网络/数据库延迟只推进虚拟时间，不真正等待"""
+
+    def __init__(self, start: datetime = None):
+        self._now = start or datetime(2025, 1, 1)
+        self.slept = 0.0
+
+    def now(self) -> datetime:
+        return self._now
+
+    def set(self, moment: datetime):
+        """推进到指定时间，不会回退"""
+        if moment > self._now:
+            self._now = moment
+
+    def sleep(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+        self.slept += seconds
+
+    def time(self) -> float:
+        return self._now.timestamp()
+
+
+class FakeTradeApi:
+    """内存中的交易接口，接口格式与okx的set_order/set_batch_orders一致"""
+
+    def __init__(self, clock: VirtualClock, latency: float = 0.05, reject_rate: float = 0.0, seed: int = 0):
+        self.clock = clock
+        self.latency = latency
+        self.reject_rate = reject_rate
+        self._random = random.Random(seed)
+        self.orders = []
+
+    def _place(self, params: Dict) -> Dict:
+        if self._random.random() < self.reject_rate:
+            return {'ordId': '', 'clOrdId': params.get('clOrdId', ''), 'sCode': '51008',
+                    'sMsg': 'Order failed. Insufficient balance'}
+        self.orders.append(params)
+        return {'ordId': str(len(self.orders)), 'clOrdId': params.get('clOrdId', ''), 'sCode': '0', 'sMsg': ''}
+
+    def set_order(self, **params) -> Dict:
+        self.clock.sleep(self.latency)
+        item = self._place(params)
+        return {'code': '0' if item['sCode'] == '0' else '1', 'msg': '', 'data': [item]}
+
+    def set_batch_orders(self, orders) -> Dict:
+        self.clock.sleep(self.latency)
+        items = [self._place(params) for params in orders]
+        return {'code': '0' if all(item['sCode'] == '0' for item in items) else '1', 'msg': '', 'data': items}
+
+
+class FakeDatabaseManager:
+    """内存中的DatabaseManager，实现实盘循环用到的方法，每次调用推进虚拟时间"""
+
+    def __init__(self, clock: VirtualClock, latency: float = 0.002):
+        self.clock = clock
+        self.latency = latency
+        self.connection = None
+        self.calls = 0
+        self._states = {}  # strategy_name -> 状态
+        self._trades = {}  # strategy_id -> 交易记录列表
+        self.trade_logs = []
+        self.order_records = {}
+
+    def _call(self):
+        self.calls += 1
+        metrics.incr('db_calls')
+        self.clock.sleep(self.latency)
+
+    def create_tables(self):
+        return True
+
+    def save_strategy_state(self, strategy_name, strategy_params, portfolio, initial_dca_amount=None):
+        self._call()
+        state = self._states.get(strategy_name)
+        strategy_id = state['strategy_id'] if state else len(self._states) + 1
+        last_trade_time = portfolio['last_trade_time']
+        self._states[strategy_name] = {
+            'strategy_id': strategy_id,
+            'strategy_params': dict(strategy_params),
+            'portfolio': {
+                'cash': portfolio['cash'],
+                'position': portfolio['position'],
+                'avg_price': portfolio['avg_price'],
+                'last_trade_time': last_trade_time.isoformat() if last_trade_time else None,
+                'last_trade_price': portfolio['last_trade_price'],
+                'peak_value': portfolio['peak_value']
+            },
+            'initial_dca_amount': initial_dca_amount
+        }
+        return strategy_id
+
+    def save_trade_record(self, strategy_id, trade_info):
+        self._call()
+        self._trades.setdefault(strategy_id, []).append(dict(trade_info))
+        return True
+
+    def load_strategy_state(self, strategy_name):
+        self._call()
+        state = self._states.get(strategy_name)
+        if not state:
+            return None
+        result = copy.deepcopy(state)
+        result['trades'] = list(self._trades.get(state['strategy_id'], []))
+        return result
+
+    def record_trade(self, inst_id, trade_info, order_id, status):
+        self._call()
+        self.order_records[order_id] = status
+        return True
+
+    def update_order_status(self, order_id, status, result=None):
+        self._call()
+        if order_id in self.order_records:
+            self.order_records[order_id] = status
+            return True
+        return False
+
+    def save_trade_log(self, inst_id, trade_time, trade_info, price, order_id):
+        self._call()
+        self.trade_logs.append((inst_id, trade_time, trade_info['type'], price, order_id))
+        return True
+
+
+def synthetic_ticks(n: int, start: datetime = None, interval: float = 5, start_price: float = 100000,
+                    volatility: float = 0.0005, spread: float = 0.1, seed: int = 0) -> Iterator[Tuple]:
+    """生成随机游走的行情 (时间, 买一价, 卖一价)，默认每5秒一个，与exec.py的轮询间隔一致"""
+    rng = random.Random(seed)
+    moment = start or datetime(2025, 1, 1)
+    price = start_price
+    for _ in range(n):
+        price *= 1 + rng.gauss(0, volatility)
+        yield moment, price - spread / 2, price + spread / 2
+        moment += timedelta(seconds=interval)
+
+
+def ticks_from_csv(path: str, price_column: str = 'close', spread: float = 0.1) -> Iterator[Tuple]:
+    """从历史K线CSV(如sorted_history_7.csv)读取行情，每根K线作为一个tick"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            price = float(row[price_column])
+            yield datetime.fromisoformat(row['ts']), price - spread / 2, price + spread / 2
+
+
+def ticks_from_journal(directory: str, day: str, inst_id: str) -> Iterator[Tuple]:
+    """从TickRecorder记录的行情日志读取一天的实盘行情"""
+    data = TickJournalReader(directory).load(day, inst_id)
+    for ts, bid, ask in zip(data['ts'].tolist(), data['bid'].tolist(), data['ask'].tolist()):
+        yield datetime.fromtimestamp(ts / 1000), bid, ask
+
+
+class _NullWriter(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+
+class ReplayHarness:
+    """在虚拟时钟上驱动实盘路径 DcaExeStrategy.execute_logic + TradingExecutor.execute_trade"""
+
+    def __init__(self, strategy_kwargs: Dict = None, inst_id: str = "BTC-USDT-SWAP",
+                 order_latency: float = 0.05, db_latency: float = 0.002, reject_rate: float = 0.0,
+                 reload_state: bool = True, use_bands: bool = True, quiet: bool = True,
+                 instrument_info: Dict = None):
+        """
+        参数:
+        strategy_kwargs: DcaExeStrategy参数
+        inst_id: 交易对
+        order_latency: 模拟下单延迟(虚拟秒)
+        db_latency: 模拟每次数据库调用延迟(虚拟秒)
+        reject_rate: 模拟订单被拒绝的比例
+        reload_state: 是否像exec.py一样每个tick都从数据库加载状态
+        use_bands: 是否只在价格穿过触发区间或到达截止时间时评估策略
+        quiet: 是否屏蔽策略和执行器的打印输出
+        instrument_info: 产品信息，默认为BTC-USDT-SWAP的精度
+        """
+        self.strategy_kwargs = strategy_kwargs or {}
+        self.inst_id = inst_id
+        self.order_latency = order_latency
+        self.db_latency = db_latency
+        self.reject_rate = reject_rate
+        self.reload_state = reload_state
+        self.use_bands = use_bands
+        self.quiet = quiet
+        self.spec = InstrumentSpec(instrument_info or {'instId': inst_id, 'tickSz': '0.1', 'minSz': '0.0001'})
+
+    @contextmanager
+    def _patched_trade_module(self, clock, trade_api, price_holder):
+        """把执行器依赖的行情、产品、下单接口替换为内存实现，结束后恢复"""
+        names = ['trade_api', 'get_instrument_spec', 'get_realtime_price', 'get_price_limit', 'time']
+        saved = {name: getattr(trade, name) for name in names}
+        trade.trade_api = trade_api
+        trade.get_instrument_spec = lambda inst_id: self.spec
+        trade.get_realtime_price = lambda inst_id: dict(price_holder)
+        trade.get_price_limit = lambda inst_id: None
+        trade.time = clock  # 重试间隔的sleep只推进虚拟时间
+        try:
+            yield
+        finally:
+            for name, value in saved.items():
+                setattr(trade, name, value)
+
+    def run(self, ticks: Iterable[Tuple]) -> Dict:
+        """回放行情并返回性能报告"""
+        clock = VirtualClock()
+        db_manager = FakeDatabaseManager(clock, latency=self.db_latency)
+        trade_api = FakeTradeApi(clock, latency=self.order_latency, reject_rate=self.reject_rate)
+        strategy = DcaExeStrategy(database_manager=db_manager, strategy_name="replay", **self.strategy_kwargs)
+        executor = TradingExecutor(db_manager)
+        price_holder = {}
+
+        metrics.reset()
+        tick_count = 0
+        decisions = 0
+        evaluations = 0
+        virtual_start = None
+        out = _NullWriter() if self.quiet else sys.stdout
+
+        wall_start = time.perf_counter()
+        with self._patched_trade_module(clock, trade_api, price_holder), redirect_stdout(out):
+            for moment, bid_px, ask_px in ticks:
+                clock.set(moment)
+                if virtual_start is None:
+                    virtual_start = clock.now()
+                price_holder['bid_px'] = bid_px
+                price_holder['ask_px'] = ask_px
+                tick_count += 1
+
+                # 与exec.py的主循环保持一致
+                with metrics.tick():
+                    current_time = clock.now()
+                    with metrics.timer('price_fetch'):
+                        current_price = trade.get_realtime_price(self.inst_id)['bid_px']
+                    if self.reload_state:
+                        with metrics.timer('load_state'):
+                            strategy.load_state()
+                    if self.use_bands and not strategy.needs_evaluation(current_time, current_price):
+                        trade_decision = None
+                    else:
+                        evaluations += 1
+                        with metrics.timer('execute_logic'):
+                            trade_decision = strategy.execute_logic(current_time, current_price)
+                    if trade_decision:
+                        decisions += 1
+                        with metrics.timer('execute_trade'):
+                            order_id = executor.execute_trade(self.inst_id, trade_decision)
+                        if order_id:
+                            with metrics.timer('trade_log'):
+                                db_manager.save_trade_log(self.inst_id, current_time, trade_decision,
+                                                          current_price, order_id)
+        wall_seconds = time.perf_counter() - wall_start
+
+        virtual_seconds = (clock.now() - virtual_start).total_seconds() if virtual_start else 0
+        snapshot = metrics.snapshot()
+        return {
+            'ticks': tick_count,
+            'evaluations': evaluations,
+            'decisions': decisions,
+            'orders': len(trade_api.orders),
+            'db_calls': db_manager.calls,
+            'wall_seconds': wall_seconds,
+            'virtual_seconds': virtual_seconds,
+            'speedup': virtual_seconds / wall_seconds if wall_seconds else 0,
+            'ticks_per_second': tick_count / wall_seconds if wall_seconds else 0,
+            'decisions_per_second': decisions / wall_seconds if wall_seconds else 0,
+            'simulated_latency_seconds': clock.slept,
+            'stages': snapshot['histograms'],
+            'final_portfolio': dict(strategy.portfolio)
+        }
+
+
+def print_report(report: Dict):
+    print(f"回放 {report['ticks']} 个tick，虚拟时长 {report['virtual_seconds'] / 3600:.1f} 小时，"
+          f"实际耗时 {report['wall_seconds']:.2f} 秒 (加速 {report['speedup']:.0f} 倍)")
+    print(f"tick/秒: {report['ticks_per_second']:.0f}, 策略评估 {report['evaluations']} 次, 交易决策 {report['decisions']} 次 "
+          f"({report['decisions_per_second']:.1f} 次/秒), 订单 {report['orders']} 笔, "
+          f"数据库调用 {report['db_calls']} 次, 模拟延迟合计 {report['simulated_latency_seconds']:.1f} 秒")
+    print("各阶段实际CPU耗时(毫秒):")
+    for name in sorted(report['stages']):
+        if name.endswith('_per_tick'):
+            continue
+        s = report['stages'][name]
+        print(f"  {name:<24} count={s['count']:<8} mean={s['mean'] * 1000:.4f} "
+              f"p50={s['p50'] * 1000:.4f} p99={s['p99'] * 1000:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实盘DCA路径的虚拟时钟回放压测")
+    parser.add_argument("--csv", help="历史K线CSV路径(含ts和close列)，不提供时使用随机行情")
+    parser.add_argument("--journal", help="TickRecorder行情日志目录，需同时指定--day")
+    parser.add_argument("--day", help="回放的日期(YYYYMMDD)")
+    parser.add_argument("--inst-id", default="BTC-USDT-SWAP", help="回放的交易对")
+    parser.add_argument("--ticks", type=int, default=100000, help="随机行情的tick数量")
+    parser.add_argument("--order-latency", type=float, default=0.05, help="模拟下单延迟(秒)")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="模拟数据库调用延迟(秒)")
+    parser.add_argument("--no-reload", action="store_true", help="不在每个tick重新加载策略状态")
+    parser.add_argument("--no-bands", action="store_true", help="每个tick都评估策略，不使用触发区间")
+    args = parser.parse_args()
+
+    harness = ReplayHarness(
+        strategy_kwargs={
+            'price_drop_threshold': 0.03,
+            'take_profit_threshold': 0.02,
+            'max_time_since_last_trade': 48,
+            'min_time_since_last_trade': 24,
+            'initial_capital': 100000,
+            'initial_investment_ratio': 0.05,
+            'initial_dca_value': 0.065
+        },
+        inst_id=args.inst_id,
+        order_latency=args.order_latency,
+        db_latency=args.db_latency,
+        reload_state=not args.no_reload,
+        use_bands=not args.no_bands
+    )
+    if args.journal:
+        ticks = ticks_from_journal(args.journal, args.day, args.inst_id)
+    elif args.csv:
+        ticks = ticks_from_csv(args.csv)
+    else:
+        ticks = synthetic_ticks(args.ticks)
+    print_report(harness.run(ticks))
+
+
+if __name__ == "__main__":
+    main()
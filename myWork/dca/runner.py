@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Add project root to Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from myWork.another.all import (trade_api, get_realtime_price, preload_instruments, start_tick_recorder,
+                                start_ticker_stream)
+from myWork.another.instruments import infer_inst_type
+from myWork.dca.database_manager import DatabaseManager
+from myWork.dca.dca_strategy import DcaExeStrategy
+from myWork.dca.order_batcher import OrderBatcher
+from myWork.dca.trade import AsyncTradingExecutor
+
+load_dotenv()
+MYSQL_CONN = os.getenv("MYSQL_CONN")
+MYSQL_PASS = os.getenv("MYSQL_PASS")
+
+
+class StrategySlot:
+    """运行器中的单个策略实例及其运行统计"""
+
+    def __init__(self, strategy: DcaExeStrategy, inst_id: str):
+        self.strategy = strategy
+        self.inst_id = inst_id
+        self.busy = False
+        self.disabled = False
+        self.evaluations = 0
+        self.trades = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error = None
+        self.deadline_handle = None  # 时间触发DCA的定时器
+
+
+class StrategyRunner:
+    """在单个进程中运行多个DCA策略，共享行情推送和数据库连接池，每次价格更新时评估对应策略"""
+
+    def __init__(self, strategy_configs: List[Dict], db_manager: DatabaseManager, executor=None,
+                 max_workers: int = 8, poll_interval: float = 5, report_interval: float = 60,
+                 max_consecutive_errors: int = 10, use_stream: bool = True, batch_window: float = 0):
+        """
+        参数:
+        strategy_configs: 策略配置列表，每项包含strategy_name、inst_id和params(DcaExeStrategy参数)
+        db_manager: 数据库管理器，建议使用连接池(pool_size>0)
+        executor: 交易执行器，默认为AsyncTradingExecutor，也可传入同步的TradingExecutor
+        max_workers: 执行策略逻辑、下单和数据库操作的线程数
+        poll_interval: 定时查询价格的间隔(秒)，用于推送中断时的兜底，时间触发的DCA由各策略的截止时间定时器唤醒
+        report_interval: 吞吐量统计的打印间隔(秒)
+        max_consecutive_errors: 单个策略连续出错达到该次数后停用，不影响其他策略
+        use_stream: 是否使用WebSocket行情推送
+        batch_window: 大于0时，该时间窗口(秒)内各策略产生的订单合并为一次批量下单
+        """
+        self.db_manager = db_manager
+        if executor is None:
+            batcher = OrderBatcher(trade_api, window=batch_window) if batch_window > 0 else None
+            executor = AsyncTradingExecutor(db_manager, max_concurrency=OrderBatcher.MAX_BATCH_SIZE, batcher=batcher)
+        self.executor = executor
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self.max_consecutive_errors = max_consecutive_errors
+        self.use_stream = use_stream
+
+        self.slots = []
+        self._by_inst = defaultdict(list)
+        for config in strategy_configs:
+            strategy = DcaExeStrategy(
+                database_manager=db_manager,
+                strategy_name=config['strategy_name'],
+                **config.get('params', {})
+            )
+            slot = StrategySlot(strategy, config['inst_id'])
+            self.slots.append(slot)
+            self._by_inst[slot.inst_id].append(slot)
+
+        self._loop = None
+        self._pool = None
+        self._stop_event = None
+        self._pending_insts = set()
+        self._latest_prices = {}
+        self._update_event = None
+        self._tasks = set()
+
+        # 吞吐量统计
+        self.evaluations = 0
+        self.skipped = 0
+        self.price_updates = 0
+        self.started_at = None
+
+    @classmethod
+    def from_config_file(cls, path: str, db_manager: Optional[DatabaseManager] = None) -> "StrategyRunner":
+        """从JSON配置文件创建运行器"""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        if db_manager is None:
+            db_manager = DatabaseManager(
+                host=MYSQL_CONN,
+                user="root",
+                password=MYSQL_PASS,
+                database="trading_db",
+                pool_size=config.get('pool_size', 8)
+            )
+
+        return cls(
+            config['strategies'],
+            db_manager,
+            max_workers=config.get('max_workers', 8),
+            poll_interval=config.get('poll_interval', 5),
+            report_interval=config.get('report_interval', 60),
+            max_consecutive_errors=config.get('max_consecutive_errors', 10),
+            use_stream=config.get('use_stream', True),
+            batch_window=config.get('batch_window', 0)
+        )
+
+    @property
+    def inst_ids(self) -> List[str]:
+        return sorted(self._by_inst.keys())
+
+    async def run(self, duration: Optional[float] = None):
+        """运行所有策略，duration为None时一直运行直到调用stop()"""
+        self._loop = asyncio.get_running_loop()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="strategy")
+        self._stop_event = asyncio.Event()
+        self._update_event = asyncio.Event()
+
+        # 并发加载所有策略的状态
+        await asyncio.gather(*[
+            self._loop.run_in_executor(self._pool, slot.strategy.load_state) for slot in self.slots
+        ])
+        print(f"已加载 {len(self.slots)} 个策略，覆盖 {len(self._by_inst)} 个交易对")
+        for slot in self.slots:
+            self._arm_deadline(slot)
+
+        # 批量加载产品信息，下单时直接查表
+        inst_types = sorted({infer_inst_type(inst_id) for inst_id in self.inst_ids})
+        await self._loop.run_in_executor(self._pool, preload_instruments, inst_types)
+
+        # 设置了TICK_RECORD_DIR时记录观察到的每个行情快照
+        await self._loop.run_in_executor(self._pool, start_tick_recorder)
+        if self.use_stream:
+            stream = await self._loop.run_in_executor(self._pool, start_ticker_stream, self.inst_ids)
+            stream.add_listener(self._on_stream_update)
+
+        self.started_at = time.monotonic()
+        background = [
+            asyncio.ensure_future(self._dispatch_loop()),
+            asyncio.ensure_future(self._poll_loop()),
+            asyncio.ensure_future(self._report_loop())
+        ]
+        try:
+            if duration is None:
+                await self._stop_event.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=duration)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in background:
+                task.cancel()
+            for slot in self.slots:
+                if slot.deadline_handle:
+                    slot.deadline_handle.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._pool.shutdown(wait=True)
+            self._report()
+
+    def stop(self):
+        """停止运行，可在其他线程中调用"""
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def on_price(self, inst_id: str, price_data: Dict):
+        """提交一次价格更新(需在事件循环线程中调用)，同一交易对的连续更新只评估最新价格"""
+        if inst_id not in self._by_inst:
+            return
+        self.price_updates += 1
+        self._latest_prices[inst_id] = price_data
+        self._pending_insts.add(inst_id)
+        self._update_event.set()
+
+    def _on_stream_update(self, inst_id, price_data):
+        # 在推送线程中调用，转交给事件循环
+        if self._loop:
+            self._loop.call_soon_threadsafe(self.on_price, inst_id, price_data)
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._update_event.wait()
+            self._update_event.clear()
+            pending, self._pending_insts = self._pending_insts, set()
+            now = datetime.now()
+            for inst_id in pending:
+                price_data = self._latest_prices[inst_id]
+                for slot in self._by_inst[inst_id]:
+                    if slot.busy or slot.disabled:
+                        continue
+                    # 只有价格穿过触发区间或到达截止时间才评估策略
+                    if not slot.strategy.needs_evaluation(now, price_data['bid_px']):
+                        self.skipped += 1
+                        continue
+                    slot.busy = True
+                    task = asyncio.ensure_future(self._evaluate(slot, price_data))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+    def _arm_deadline(self, slot: StrategySlot):
+        """按策略的截止时间设置定时器，到期时即使价格没有变化也会评估一次"""
+        if slot.deadline_handle:
+            slot.deadline_handle.cancel()
+            slot.deadline_handle = None
+        deadline = slot.strategy.get_trigger_bands()['deadline']
+        if deadline is None or slot.disabled:
+            return
+        delay = (deadline - datetime.now()).total_seconds()
+        if delay <= 0:
+            # 已过截止时间的策略由定时查询价格触发评估，避免出错时反复立即唤醒
+            return
+        slot.deadline_handle = self._loop.call_later(delay, self._on_deadline, slot)
+
+    def _on_deadline(self, slot: StrategySlot):
+        slot.deadline_handle = None
+        task = asyncio.ensure_future(self._wake_at_deadline(slot))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _wake_at_deadline(self, slot: StrategySlot):
+        try:
+            price_data = await self._loop.run_in_executor(self._pool, get_realtime_price, slot.inst_id)
+        except Exception as e:
+            print(f"获取{slot.inst_id}价格失败: {e}")
+            price_data = None
+        if price_data:
+            self.on_price(slot.inst_id, price_data)
+        else:
+            # 获取价格失败时稍后重试
+            slot.deadline_handle = self._loop.call_later(self.poll_interval, self._on_deadline, slot)
+
+    async def _poll_loop(self):
+        """定时查询全部交易对的价格，保证推送中断时价格触发的交易也能执行"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for inst_id in self.inst_ids:
+                try:
+                    price_data = await self._loop.run_in_executor(self._pool, get_realtime_price, inst_id)
+                except Exception as e:
+                    print(f"获取{inst_id}价格失败: {e}")
+                    continue
+                if price_data:
+                    self.on_price(inst_id, price_data)
+
+    async def _evaluate(self, slot: StrategySlot, price_data: Dict):
+        """评估单个策略，异常只影响该策略"""
+        try:
+            current_time = datetime.now()
+            current_price = price_data['bid_px']  # 使用买一价
+            trade_decision = await self._loop.run_in_executor(
+                self._pool, slot.strategy.execute_logic, current_time, current_price, slot.inst_id
+            )
+            slot.evaluations += 1
+            self.evaluations += 1
+
+            if trade_decision:
+                print(f"[{slot.strategy.strategy_name}] 策略生成交易决策: "
+                      f"{trade_decision['type']} {trade_decision['side']}")
+                order_id = await self._submit(slot.inst_id, trade_decision)
+                if order_id:
+                    slot.trades += 1
+                    await self._loop.run_in_executor(
+                        self._pool, self.db_manager.save_trade_log,
+                        slot.inst_id, current_time, trade_decision, current_price, order_id
+                    )
+                else:
+                    print(f"[{slot.strategy.strategy_name}] 交易执行失败")
+            slot.consecutive_errors = 0
+        except Exception as e:
+            slot.errors += 1
+            slot.consecutive_errors += 1
+            slot.last_error = str(e)
+            print(f"[{slot.strategy.strategy_name}] 策略执行出错: {e}")
+            if slot.consecutive_errors >= self.max_consecutive_errors:
+                slot.disabled = True
+                print(f"[{slot.strategy.strategy_name}] 连续出错 {slot.consecutive_errors} 次，已停用")
+        finally:
+            slot.busy = False
+            # 交易后触发区间和截止时间会变化
+            self._arm_deadline(slot)
+
+    async def _submit(self, inst_id: str, trade_decision: Dict) -> Optional[str]:
+        """提交订单，同步执行器在线程池中运行"""
+        if asyncio.iscoroutinefunction(self.executor.execute_trade):
+            return await self.executor.execute_trade(inst_id, trade_decision)
+        return await self._loop.run_in_executor(self._pool, self.executor.execute_trade, inst_id, trade_decision)
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self._report()
+
+    def get_metrics(self) -> Dict:
+        """获取运行统计"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            'strategies': len(self.slots),
+            'instruments': len(self._by_inst),
+            'price_updates': self.price_updates,
+            'evaluations': self.evaluations,
+            'evaluations_per_second': self.evaluations / elapsed if elapsed else 0,
+            'skipped': self.skipped,
+            'trades': sum(slot.trades for slot in self.slots),
+            'errors': sum(slot.errors for slot in self.slots),
+            'disabled': [slot.strategy.strategy_name for slot in self.slots if slot.disabled],
+            'elapsed': elapsed
+        }
+
+    def _report(self):
+        metrics = self.get_metrics()
+        print(f"运行 {metrics['elapsed']:.0f}秒: 价格更新 {metrics['price_updates']} 次, "
+              f"策略评估 {metrics['evaluations']} 次 ({metrics['evaluations_per_second']:.1f} 次/秒), "
+              f"区间外跳过 {metrics['skipped']} 次, "
+              f"交易 {metrics['trades']} 笔, 错误 {metrics['errors']} 次, 停用 {len(metrics['disabled'])} 个")
+
+
+def main():
+    """主函数，从配置文件启动多策略运行器"""
+    parser = argparse.ArgumentParser(description="多策略DCA运行器")
+    parser.add_argument("config", nargs="?", default=str(Path(__file__).parent / "strategies.example.json"),
+                        help="策略配置文件(JSON)")
+    args = parser.parse_args()
+
+    runner = StrategyRunner.from_config_file(args.config)
+    runner.db_manager.create_tables()
+
+    try:
+        asyncio.run(runner.run())
+    except KeyboardInterrupt:
+        print("运行器已停止")
+
+
+if __name__ == "__main__":
+    main()
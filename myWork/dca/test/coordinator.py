@@ -0,0 +1,555 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from multiprocessing import get_context
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+import httpx
+import pandas as pd
+
+from myWork.dca.test.price_series import PriceSeries
+from myWork.dca.test.sweep_queue import json_default
+
+
+class ResultWriteError(Exception):
+    """写入结果失败，块保持未完成，worker稍后重新提交"""
+
+
+class SweepCoordinator:
+    """
+    多机参数扫描的协调者: 持有整个参数空间，按块分配给各个worker节点
+
+    - 块在被领取时才生成，不需要预先展开全部参数组合
+    - 领取的块有租约，worker通过心跳续期，租约过期(worker退出或断网)的块重新分配
+    - 没有新块可分时，把执行时间明显偏长的块再分给空闲的worker(work stealing)，先返回的结果生效，
+      另一个worker在下次心跳时得知该块已完成并放弃
+    - worker每完成一块，把整块的结果一次提交
+    """
+
+    def __init__(self, base_config, parameter_ranges, job=None, chunk_size=50, lease_seconds=60,
+                 heartbeat_interval=10, min_steal_seconds=30, on_results=None):
+        """
+        参数:
+        base_config: 基础策略配置
+        parameter_ranges: 参数范围，格式与dcamng.main中的parameter_ranges相同
+        job: 下发给worker的任务信息，如回测时间范围和币种
+        chunk_size: 每块的参数组合数量
+        lease_seconds: 块的租约时间(秒)，期间没有心跳则重新分配
+        heartbeat_interval: worker发送心跳的间隔(秒)
+        min_steal_seconds: 块执行超过该时间且超过平均耗时的2倍时，才会被其他worker抢占执行
+        on_results: 收到一块结果时的回调，参数为(chunk_id, results)
+        """
+        self.base_config = base_config
+        self.parameter_ranges = parameter_ranges
+        self.job = job or {}
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.min_steal_seconds = min_steal_seconds
+        self.on_results = on_results
+
+        self._lock = threading.Lock()
+        self._configs = self._iter_configs()
+        self._exhausted = False
+        self._next_chunk_id = 0
+        self._pending = deque()  # 等待分配的块id
+        # chunk_id -> {'configs', 'owners': {worker_id: 租约到期时间}, 'leased_at', 'submitting': 正在写入结果}
+        self._chunks = {}
+        self._workers = {}  # worker_id -> 最后一次请求时间
+        self._durations = deque(maxlen=200)
+        self.done_event = threading.Event()
+
+        # 统计信息
+        self.total_configs = 0
+        self.completed_chunks = 0
+        self.completed_configs = 0
+        self.requeued_chunks = 0
+        self.stolen_chunks = 0
+        self.duplicate_results = 0
+
+    def _iter_configs(self):
+        from myWork.dca.test.dcamng import iter_parameter_configs
+
+        return iter_parameter_configs(self.base_config, self.parameter_ranges)
+
+    def _new_chunk(self):
+        configs = list(islice(self._configs, self.chunk_size))
+        if not configs:
+            self._exhausted = True
+            return None
+        chunk_id = self._next_chunk_id
+        self._next_chunk_id += 1
+        self.total_configs += len(configs)
+        self._chunks[chunk_id] = {'configs': configs, 'owners': {}, 'leased_at': None, 'submitting': False}
+        return chunk_id
+
+    def _expire_leases(self, now):
+        for chunk_id, chunk in self._chunks.items():
+            if chunk['submitting']:
+                # 结果正在写入，写入失败时由提交的worker重试
+                continue
+            expired = [worker_id for worker_id, expires in chunk['owners'].items() if expires < now]
+            for worker_id in expired:
+                del chunk['owners'][worker_id]
+            if expired and not chunk['owners']:
+                # 所有执行者都失联，重新排队，优先分配
+                self._pending.appendleft(chunk_id)
+                self.requeued_chunks += 1
+                print(f"块{chunk_id}租约过期，重新分配")
+
+    def _steal_after(self):
+        if not self._durations:
+            return self.min_steal_seconds
+        return max(self.min_steal_seconds, 2 * sum(self._durations) / len(self._durations))
+
+    def _find_straggler(self, worker_id, now):
+        """找一个只有一个执行者且执行时间偏长的块"""
+        steal_after = self._steal_after()
+        candidates = [(chunk['leased_at'], chunk_id) for chunk_id, chunk in self._chunks.items()
+                      if len(chunk['owners']) == 1 and worker_id not in chunk['owners'] and not chunk['submitting']
+                      and now - chunk['leased_at'] > steal_after]
+        return min(candidates)[1] if candidates else None
+
+    def _is_finished(self):
+        return self._exhausted and not self._pending and not self._chunks
+
+    def register(self, worker_id):
+        with self._lock:
+            self._workers[worker_id] = time.time()
+        print(f"worker节点已注册: {worker_id}")
+        return {'job': self.job, 'lease_seconds': self.lease_seconds, 'heartbeat_interval': self.heartbeat_interval}
+
+    def lease(self, worker_id, max_chunks=1):
+        """
+        分配最多max_chunks块
+
+        返回:
+        {'chunks': [{'chunk_id', 'configs'}], 'done': 全部完成时为True}
+        """
+        now = time.time()
+        leased = []
+        with self._lock:
+            self._workers[worker_id] = now
+            self._expire_leases(now)
+            while len(leased) < max_chunks:
+                chunk_id = self._pending.popleft() if self._pending else None
+                if chunk_id is None and not self._exhausted:
+                    chunk_id = self._new_chunk()
+                if chunk_id is None:
+                    chunk_id = self._find_straggler(worker_id, now)
+                    if chunk_id is None:
+                        break
+                    self.stolen_chunks += 1
+                    print(f"块{chunk_id}执行时间过长，同时分配给{worker_id}")
+                chunk = self._chunks[chunk_id]
+                if not chunk['owners']:
+                    chunk['leased_at'] = now
+                chunk['owners'][worker_id] = now + self.lease_seconds
+                leased.append({'chunk_id': chunk_id, 'configs': chunk['configs']})
+            finished = self._is_finished()
+        # 最后一块提交时可能还不知道参数已经生成完，由之后的领取请求确认完成
+        if finished:
+            self.done_event.set()
+        return {'chunks': leased, 'done': finished}
+
+    def heartbeat(self, worker_id, chunk_ids):
+        """
+        续期worker正在执行的块
+
+        返回:
+        {'cancel': 已由其他worker完成或租约已失效的块id}
+        """
+        now = time.time()
+        cancel = []
+        with self._lock:
+            self._workers[worker_id] = now
+            for chunk_id in chunk_ids:
+                chunk = self._chunks.get(chunk_id)
+                if chunk is None or worker_id not in chunk['owners']:
+                    cancel.append(chunk_id)
+                else:
+                    chunk['owners'][worker_id] = now + self.lease_seconds
+        return {'cancel': cancel}
+
+    def submit(self, worker_id, chunk_id, results):
+        """
+        提交一块的结果，重复提交(被抢占执行的块)时忽略
+
+        先写入结果，写入成功后才把块标记为完成；写入失败时抛出ResultWriteError，块保持未完成，
+        提交的worker收到5xx后重试，worker放弃时租约过期重新分配
+        """
+        with self._lock:
+            self._workers[worker_id] = time.time()
+            chunk = self._chunks.get(chunk_id)
+            if chunk is None or chunk['submitting']:
+                self.duplicate_results += 1
+                return {'accepted': False}
+            chunk['submitting'] = True
+
+        # 回调在锁外执行，写结果较慢时不阻塞其他worker
+        if self.on_results is not None:
+            try:
+                self.on_results(chunk_id, results)
+            except Exception as e:
+                with self._lock:
+                    chunk['submitting'] = False
+                print(f"写入块{chunk_id}的结果失败: {e}")
+                raise ResultWriteError(f"写入块{chunk_id}的结果失败: {e}") from e
+
+        now = time.time()
+        with self._lock:
+            del self._chunks[chunk_id]
+            if chunk_id in self._pending:
+                self._pending.remove(chunk_id)
+            if chunk['leased_at'] is not None:
+                self._durations.append(now - chunk['leased_at'])
+            self.completed_chunks += 1
+            self.completed_configs += len(results)
+            finished = self._is_finished()
+        if finished:
+            print(f"参数扫描完成: 共{self.completed_configs}个参数组合")
+            self.done_event.set()
+        return {'accepted': True}
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'total_configs': self.total_configs,
+                'exhausted': self._exhausted,
+                'completed_chunks': self.completed_chunks,
+                'completed_configs': self.completed_configs,
+                'in_flight_chunks': len(self._chunks) - len(self._pending),
+                'pending_chunks': len(self._pending),
+                'requeued_chunks': self.requeued_chunks,
+                'stolen_chunks': self.stolen_chunks,
+                'duplicate_results': self.duplicate_results,
+                'workers': len(self._workers),
+                'done': self._is_finished()
+            }
+
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP: POST /register /lease /heartbeat /results，GET /status"""
+
+    protocol_version = "HTTP/1.1"
+    coordinator = None
+
+    def _send(self, data, status=200):
+        body = json.dumps(data, default=json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._send(self.coordinator.get_status())
+        else:
+            self._send({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            worker_id = payload['worker_id']
+            if self.path == "/register":
+                self._send(self.coordinator.register(worker_id))
+            elif self.path == "/lease":
+                self._send(self.coordinator.lease(worker_id, payload.get('max_chunks', 1)))
+            elif self.path == "/heartbeat":
+                self._send(self.coordinator.heartbeat(worker_id, payload.get('chunk_ids', [])))
+            elif self.path == "/results":
+                self._send(self.coordinator.submit(worker_id, payload['chunk_id'], payload['results']))
+            else:
+                self._send({'error': 'not found'}, 404)
+        except ResultWriteError as e:
+            # 服务端暂时失败，worker重试提交
+            self._send({'error': str(e)}, 503)
+        except Exception as e:
+            print(f"处理请求{self.path}失败: {e}")
+            self._send({'error': str(e)}, 400)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_coordinator_server(coordinator, host="0.0.0.0", port=8765):
+    """在后台线程中启动HTTP服务，返回server，port为0时自动选择端口(server.server_address[1])"""
+    handler = type("CoordinatorHandler", (_CoordinatorHandler,), {'coordinator': coordinator})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="sweep-coordinator", daemon=True).start()
+    print(f"参数扫描协调服务已启动: {host}:{server.server_address[1]}")
+    return server
+
+
+class SweepWorkerNode:
+    """
+    worker节点: 从协调者领取参数块，在本地回测，按块提交结果
+
+    后台线程定时发送心跳，当前块已被其他worker完成时放弃剩余的参数组合
+    """
+
+    def __init__(self, coordinator_url, data_loader, worker_id=None, max_retries=30, timeout=30):
+        """
+        参数:
+        coordinator_url: 协调者地址，如 http://127.0.0.1:8765
+        data_loader: 根据任务信息加载历史数据的函数，参数为job，返回PriceSeries或DataFrame
+        worker_id: 节点标识，默认使用主机名和进程号
+        max_retries: 连接协调者失败时的最大重试次数
+        timeout: 请求超时时间(秒)
+        """
+        self.url = coordinator_url.rstrip('/')
+        self.data_loader = data_loader
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.max_retries = max_retries
+        self.client = httpx.Client(timeout=timeout)
+
+        self._current_chunk = None
+        self._cancelled = set()
+        self._stop = threading.Event()
+
+        # 统计信息
+        self.chunks_done = 0
+        self.configs_done = 0
+        self.chunks_abandoned = 0
+
+    def _post(self, path, payload):
+        payload = dict(payload, worker_id=self.worker_id)
+        body = json.dumps(payload, default=json_default)
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.post(self.url + path, content=body,
+                                            headers={"Content-Type": "application/json"})
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                # 4xx是请求本身的问题，重试也不会成功
+                client_error = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+                if client_error or attempt == self.max_retries - 1:
+                    raise
+                print(f"请求协调者{path}失败，稍后重试: {e}")
+                time.sleep(min(2 ** attempt * 0.2, 5))
+
+    def _heartbeat_loop(self, interval):
+        while not self._stop.wait(interval):
+            chunk_id = self._current_chunk
+            if chunk_id is None:
+                continue
+            try:
+                response = self._post("/heartbeat", {'chunk_ids': [chunk_id]})
+                self._cancelled.update(response.get('cancel', []))
+            except Exception as e:
+                print(f"发送心跳失败: {e}")
+
+    def _run_chunk(self, chunk, data, job):
+        from myWork.dca.test.save import run_strategy_df
+
+        results = []
+        for config in chunk['configs']:
+            if chunk['chunk_id'] in self._cancelled:
+                return None
+            params = dict(config)
+            params.pop('currency', None)
+            result = run_strategy_df(params, None, job.get('start_time'), job.get('end_time'), data, save=False,
+                                     prune_rules=job.get('prune_rules'))
+            if result is None:
+                results.append({'config': config, 'error': '回测失败'})
+            else:
+                results.append({'config': config, 'performance': result['performance']})
+        return results
+
+    def run(self):
+        """领取并执行参数块，直到协调者返回全部完成"""
+        info = self._post("/register", {})
+        job = info.get('job', {})
+        # DataFrame只转换一次，块内的所有回测共享同一个只读价格序列
+        data = PriceSeries.coerce(self.data_loader(job))
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(info.get('heartbeat_interval', 10),),
+                                     name="sweep-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                response = self._post("/lease", {'max_chunks': 1})
+                if not response['chunks']:
+                    if response['done']:
+                        break
+                    # 剩余的块都在其他worker执行中，稍后再领取(可能接手过期或执行过慢的块)
+                    time.sleep(1)
+                    continue
+                for chunk in response['chunks']:
+                    self._current_chunk = chunk['chunk_id']
+                    results = self._run_chunk(chunk, data, job)
+                    self._current_chunk = None
+                    if results is None:
+                        self.chunks_abandoned += 1
+                        continue
+                    self._post("/results", {'chunk_id': chunk['chunk_id'], 'results': results})
+                    self.chunks_done += 1
+                    self.configs_done += len(results)
+        finally:
+            self._stop.set()
+            self.client.close()
+        print(f"worker节点{self.worker_id}完成: {self.chunks_done}块, {self.configs_done}个参数组合, "
+              f"放弃{self.chunks_abandoned}块")
+
+
+def jsonl_result_writer(path):
+    """把结果按行追加写入JSON文件，返回可作为on_results的回调"""
+    lock = threading.Lock()
+
+    def write(chunk_id, results):
+        lines = [json.dumps(dict(result, chunk_id=chunk_id), default=json_default) for result in results]
+        with lock, open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    return write
+
+
+def mysql_result_writer(db_config, start_time, end_time):
+    """把结果批量写入MySQL的strategy_performance表，返回可作为on_results的回调"""
+    from myWork.dca.test.save import PerformanceSink
+
+    lock = threading.Lock()
+    # 只在每块结束时显式写入，保证一块的结果在同一个事务中
+    sink = PerformanceSink(db_config, flush_size=float('inf'), flush_interval=float('inf'))
+
+    def write(chunk_id, results):
+        with lock:
+            try:
+                for result in results:
+                    # 提前结束的回测只有部分指标，不写入结果表
+                    if 'performance' in result and not result['performance'].get('pruned'):
+                        config = dict(result['config'])
+                        currency = config.pop('currency', 'UNKNOWN')
+                        sink.add(result['performance'], config, start_time, end_time, currency)
+                sink.flush()
+            except Exception:
+                # 整块在一个事务中写入，失败时全部回滚；丢弃缓存，重试时整块重新写入
+                sink.discard()
+                raise
+
+    return write
+
+
+def combine_result_writers(writers):
+    """
+    把多个结果回调合并为一个on_results回调
+
+    块写入失败时协调者会让worker重新提交整块，已成功写入该块的回调记录块id并跳过，
+    例如MySQL写入失败重试时不会重复追加JSON Lines
+    """
+    lock = threading.Lock()
+    committed = [set() for _ in writers]
+
+    def write(chunk_id, results):
+        for writer, done in zip(writers, committed):
+            with lock:
+                if chunk_id in done:
+                    continue
+            writer(chunk_id, results)
+            with lock:
+                done.add(chunk_id)
+
+    return write
+
+
+def load_job_data(job, csv_path=None):
+    """worker节点加载历史数据: 指定csv时从文件读取，否则从MySQL读取"""
+    if csv_path:
+        df = pd.read_csv(csv_path)
+        df['ts'] = pd.to_datetime(df['ts'])
+        return PriceSeries.from_frame(df)
+
+    from myWork.dca.test.dcamng import default_db_config
+    from myWork.dca.test.mysql_read import MySQLDataReader
+
+    reader = MySQLDataReader(**default_db_config())
+    reader.connect()
+    try:
+        return reader.get_price_series(job.get('start_time'), job.get('end_time'), job.get('currency'))
+    finally:
+        reader.disconnect()
+
+
+def _run_worker_process(url, csv_path):
+    SweepWorkerNode(url, lambda job: load_job_data(job, csv_path)).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多机DCA参数扫描: 协调者和worker节点")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="启动协调者，参数空间使用dcamng中的默认配置")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--chunk-size", type=int, default=50, help="每块的参数组合数量")
+    serve.add_argument("--lease", type=float, default=60, help="块的租约时间(秒)")
+    serve.add_argument("--start", help="回测开始时间，默认为结束时间前120天")
+    serve.add_argument("--end", default="2025-06-08", help="回测结束时间")
+    serve.add_argument("--results", default="sweep_results.jsonl", help="结果文件(JSON Lines)")
+    serve.add_argument("--mysql", action="store_true", help="同时把结果写入MySQL的strategy_performance表")
+    serve.add_argument("--prune-max-drawdown", type=float, help="回撤超过该比例时提前结束回测")
+    serve.add_argument("--prune-min-equity", type=float, help="资产低于初始资金的该比例时提前结束回测")
+    serve.add_argument("--prune-no-trade-days", type=float, help="超过该天数没有交易时提前结束回测")
+
+    work = sub.add_parser("work", help="启动worker节点")
+    work.add_argument("--url", default="http://127.0.0.1:8765", help="协调者地址")
+    work.add_argument("--processes", type=int, default=os.cpu_count(), help="本机启动的worker进程数")
+    work.add_argument("--csv", help="历史数据CSV(含ts和close列)，不指定时从MySQL读取")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        from myWork.dca.test.dcamng import default_db_config, default_parameter_space
+
+        base_config, parameter_ranges = default_parameter_space()
+        end_time = pd.Timestamp(args.end)
+        start_time = pd.Timestamp(args.start) if args.start else end_time - pd.Timedelta(days=120)
+        prune_rules = {name: value for name, value in (('prune_max_drawdown', args.prune_max_drawdown),
+                                                       ('prune_min_equity', args.prune_min_equity),
+                                                       ('prune_no_trade_days', args.prune_no_trade_days))
+                       if value is not None}
+        job = {'start_time': str(start_time), 'end_time': str(end_time), 'currency': base_config.get('currency'),
+               'prune_rules': prune_rules}
+
+        writers = [jsonl_result_writer(args.results)]
+        if args.mysql:
+            writers.append(mysql_result_writer(default_db_config(), start_time, end_time))
+
+        coordinator = SweepCoordinator(base_config, parameter_ranges, job=job, chunk_size=args.chunk_size,
+                                       lease_seconds=args.lease,
+                                       on_results=combine_result_writers(writers))
+        server = start_coordinator_server(coordinator, args.host, args.port)
+        try:
+            while not coordinator.done_event.wait(30):
+                print(coordinator.get_status())
+        except KeyboardInterrupt:
+            pass
+        # 等待worker取走"全部完成"的响应
+        time.sleep(2)
+        server.shutdown()
+        print(coordinator.get_status())
+    else:
+        context = get_context('spawn') if sys.platform.startswith('win') else get_context('fork')
+        processes = [context.Process(target=_run_worker_process, args=(args.url, args.csv))
+                     for _ in range(max(1, args.processes))]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
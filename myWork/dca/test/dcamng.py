@@ -1,7 +1,8 @@
 import datetime
 import os
 import sys
-from itertools import product
+import time
+from itertools import islice, product
 from multiprocessing import get_context
 from pathlib import Path
 
@@ -11,7 +12,9 @@ from dotenv import load_dotenv
 import numpy as np
 import pandas as pd
 from myWork.dca.test.mysql_read import MySQLDataReader
-from myWork.dca.test.save import run_strategy_df
+from myWork.dca.test.price_series import PriceSeries
+from myWork.dca.test.save import PerformanceSink, run_strategy_df
+from myWork.dca.test.sweep_queue import open_sweep_queue
 
 
 def generate_range(min_val, max_val, step):
@@ -21,12 +24,22 @@ def generate_range(min_val, max_val, step):
 def handle_worker_error(e):
     print(f"Worker进程异常: {str(e)}")
 
-def worker(db_config, df, start_time, end_time):
-    """工作函数，每个进程将从数据库获取参数并处理"""
-    # 每个worker创建自己的数据库连接
+def worker(db_config, df, start_time, end_time, queue_path=None, save_to_mysql=True, prune_rules=None):
+    """
+    工作函数，每个进程从任务队列获取参数并处理
+
+    queue_path为空时使用MySQL参数表作为队列，否则使用本地SQLite队列；
+    save_to_mysql为False时回测结果只保存在队列中，不写入strategy_performance；
+    满足prune_rules被提前结束的参数标记为pruned，队列中保存部分指标
+    """
+    # 每个worker创建自己的队列连接，回测结果缓存后批量写入
+    sink = PerformanceSink(db_config) if save_to_mysql else None
     try:
-        worker_reader = MySQLDataReader(**db_config)
+        worker_reader = open_sweep_queue(db_config, queue_path)
         worker_reader.connect()
+        # 批量写入参数状态前先写入对应的回测结果
+        if sink is not None:
+            worker_reader.before_status_flush = sink.flush
         while True:
             # 获取未执行的参数
             try:
@@ -39,8 +52,10 @@ def worker(db_config, df, start_time, end_time):
                     # 移除currency参数避免策略初始化错误
                     params_clean = params.copy()
                     params_clean.pop('currency', None)
-                    result = run_strategy_df(params_clean, db_config, start_time, end_time, df)
-                    worker_reader.update_parameter_status(param_id, 'completed', result)
+                    result = run_strategy_df(params_clean, db_config, start_time, end_time, df, sink=sink,
+                                             save=save_to_mysql, prune_rules=prune_rules)
+                    pruned = result is not None and result['performance']['pruned']
+                    worker_reader.update_parameter_status(param_id, 'pruned' if pruned else 'completed', result)
                 except Exception as e:
                     error_msg = f"处理参数 {param_id} 时出错: {str(e)}"
                     worker_reader.update_parameter_status(param_id, 'failed', error_msg)
@@ -49,25 +64,40 @@ def worker(db_config, df, start_time, end_time):
     except Exception as e:
         pass
     finally:
+        try:
+            if sink is not None:
+                sink.close()
+        except Exception as e:
+            print(f"写入回测结果失败: {e}")
         if 'worker_reader' in locals():
             worker_reader.disconnect()
 
-def parameter_range_training(db_config, start_time, end_time, base_strategy_config, n_jobs=1):
+def parameter_range_training(db_config, start_time, end_time, base_strategy_config, n_jobs=1, queue_path=None,
+                             save_to_mysql=True, data=None, prune_rules=None):
     """
-    从数据库获取参数并执行训练，每次处理一行参数
+    从任务队列获取参数并执行训练，每次处理一行参数
     
     参数:
     db_config - 数据库连接配置
     start_time, end_time - 回测时间范围
     n_jobs - 并行处理数
+    queue_path - 本地SQLite队列文件，为空时使用MySQL参数表
+    save_to_mysql - 是否把回测结果写入MySQL
+    data - 已加载的历史数据(PriceSeries或DataFrame)，为空时从数据库读取
+    prune_rules - 提前结束条件，如 {'prune_max_drawdown': 0.3, 'prune_min_equity': 0.5, 'prune_no_trade_days': 14}
     """
-    # 创建数据库连接
-    reader = MySQLDataReader(**db_config)
-    reader.connect()
-    
-    # 获取历史数据
-    # 使用基础配置中的货币对参数
-    df = reader.get_sorted_history_data(start_time, end_time, base_strategy_config['currency'])
+    reader = None
+    if data is None:
+        # 创建数据库连接
+        reader = MySQLDataReader(**db_config)
+        reader.connect()
+
+        # 获取历史数据，转换为只读价格序列后由所有worker共享
+        # 使用基础配置中的货币对参数
+        df = reader.get_price_series(start_time, end_time, base_strategy_config['currency'])
+    else:
+        # 传入DataFrame时只转换一次，不在每次回测中重复转换
+        df = PriceSeries.coerce(data)
     
     # 使用多进程处理参数
     # 根据操作系统选择合适的多进程启动方式
@@ -78,47 +108,67 @@ def parameter_range_training(db_config, start_time, end_time, base_strategy_conf
     with context.Pool(processes=n_jobs) as pool:
         # 启动n_jobs个worker进程
         for i in range(n_jobs):
-            pool.apply_async(worker, args=(db_config, df, start_time, end_time), error_callback=handle_worker_error)
+            pool.apply_async(worker, args=(db_config, df, start_time, end_time, queue_path, save_to_mysql,
+                                           prune_rules),
+                             error_callback=handle_worker_error)
         
         # 等待所有worker完成
         pool.close()
         pool.join()
     
-    reader.disconnect()
+    if reader is not None:
+        reader.disconnect()
     
     # 训练完成后分析结果
     # analyze_training_results(db_config)
     # print("所有参数训练完成!已生成结果报告")
 
-def generate_and_insert_parameters(db_config, base_config, param_ranges):
-    """生成参数组合并插入数据库，只执行一次"""
-    reader = MySQLDataReader(**db_config)
+def count_parameter_configs(param_ranges):
+    """参数组合总数"""
+    total = 1
+    for values in param_ranges.values():
+        total *= len(values)
+    return total
+
+
+def iter_parameter_configs(base_config, param_ranges):
+    """逐个生成参数组合的完整配置，不预先展开全部组合"""
+    param_names = list(param_ranges.keys())
+    for params in product(*param_ranges.values()):
+        config = base_config.copy()
+        config.update(zip(param_names, params))
+        yield config
+
+
+def generate_and_insert_parameters(db_config, base_config, param_ranges, queue_path=None, chunk_size=5000):
+    """
+    生成参数组合并分块插入任务队列，只执行一次。queue_path为空时插入MySQL参数表
+
+    参数组合逐个生成，每次只保存chunk_size个配置，内存占用与组合总数无关
+    """
+    reader = open_sweep_queue(db_config, queue_path)
     reader.connect()
     
     # 创建参数表
     reader.create_parameter_table()
     
-    # 生成所有参数组合
-    param_names = list(param_ranges.keys())
-    param_values = list(param_ranges.values())
-    param_combinations = list(product(*param_values))
-    
-    # 创建所有配置组合并插入数据库
-    all_configs = []
-    for params in param_combinations:
-        config = base_config.copy()
-        for name, value in zip(param_names, params):
-            config[name] = value
-        all_configs.append(config)
-    
-    # 插入参数到数据库
-    reader.insert_parameters(all_configs)
-    print(f"=== 参数生成完成，共{len(all_configs)}个组合 ===")
+    total = count_parameter_configs(param_ranges)
+    configs = iter_parameter_configs(base_config, param_ranges)
+    inserted = 0
+    started = time.perf_counter()
     try:
-        reader.insert_parameters(all_configs)
-        print(f"成功插入{len(all_configs)}个参数组合到数据库")
+        while True:
+            chunk = list(islice(configs, chunk_size))
+            if not chunk:
+                break
+            reader.insert_parameters(chunk)
+            inserted += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"参数插入进度: {inserted}/{total} ({inserted / total:.1%})，"
+                  f"{inserted / elapsed if elapsed > 0 else 0:.0f}个/秒")
+        print(f"=== 参数生成完成，共{inserted}个组合 ===")
     except Exception as e:
-        print(f"参数插入失败: {str(e)}")
+        print(f"参数插入失败: {str(e)}，已处理{inserted}/{total}个组合，重新执行时会跳过已插入的组合")
     
     reader.disconnect()
 
@@ -129,16 +179,8 @@ MYSQL_CONN = os.getenv("MYSQL_CONN")
 MYSQL_PASS = os.getenv("MYSQL_PASS")
 
 
-def main():
-    # 配置数据库连接信息
-    db_config = {
-        'host': MYSQL_CONN,
-        'user': 'root',
-        'password': MYSQL_PASS,
-        'database': 'trading_db',
-        'port': 3306
-    }
-
+def default_parameter_space():
+    """参数扫描的基础策略配置和参数范围，返回(base_strategy_config, parameter_ranges)"""
     # 基础策略配置
     base_strategy_config = {
         'currency': 'BTC-USDT',  # 添加货币对参数
@@ -160,6 +202,25 @@ def main():
         'initial_investment_ratio': generate_range(0.05, 0.3, 0.05),
         'initial_dca_value': generate_range(0.02, 0.2, 0.005)
     }
+    return base_strategy_config, parameter_ranges
+
+
+def default_db_config():
+    """从环境变量读取的数据库连接信息"""
+    return {
+        'host': MYSQL_CONN,
+        'user': 'root',
+        'password': MYSQL_PASS,
+        'database': 'trading_db',
+        'port': 3306
+    }
+
+
+def main():
+    # 配置数据库连接信息
+    db_config = default_db_config()
+
+    base_strategy_config, parameter_ranges = default_parameter_space()
 
     # 强制重新生成参数（用于测试）
     print("=== 开始生成并插入参数 ===")
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from filelock import FileLock
+
+# 默认缓存目录，可通过环境变量HISTORY_CACHE_DIR修改
+DEFAULT_HISTORY_CACHE_DIR = os.getenv("HISTORY_CACHE_DIR", str(Path(__file__).parent / "cache"))
+
+_META_KEY = b"history_cache"
+
+
+def _to_timestamp(value):
+    return None if value is None else pd.Timestamp(value)
+
+
+class HistoryDiskCache:
+    """
+    历史行情查询结果的磁盘缓存，同一台机器上的所有进程共享
+
+    每个查询(表、起止时间、列、条数限制)对应一个Arrow IPC文件，读取时内存映射，多个worker读同一个文件，
+    文件元数据中记录写入时源表的最大ts，用于判断源表是否新增了缓存范围之外的数据
+    """
+
+    def __init__(self, directory=DEFAULT_HISTORY_CACHE_DIR, max_files=50, lock_timeout=600):
+        """
+        参数:
+        directory: 缓存目录
+        max_files: 最多保留的缓存文件数，超出时删除最久未写入的文件
+        lock_timeout: 等待其他进程写入同一查询的最长时间(秒)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        self.lock_timeout = lock_timeout
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(table, start_time, end_time, columns, limit):
+        return json.dumps([table, None if start_time is None else str(start_time),
+                           None if end_time is None else str(end_time),
+                           None if columns is None else list(columns), limit])
+
+    def _path(self, table, start_time, end_time, columns, limit):
+        digest = hashlib.sha1(self._key(table, start_time, end_time, columns, limit).encode()).hexdigest()[:20]
+        return self.directory / f"{table}-{digest}.arrow"
+
+    def lock(self, table, start_time, end_time, columns=None, limit=None):
+        """同一查询的进程间锁，持有锁的进程查询数据库并写入，其他进程等待后直接读文件"""
+        path = self._path(table, start_time, end_time, columns, limit)
+        return FileLock(str(path) + ".lock", timeout=self.lock_timeout)
+
+    def load(self, table, start_time, end_time, columns=None, limit=None):
+        """
+        读取缓存
+
+        返回:
+        (pyarrow.Table, 写入时源表的最大ts)，没有缓存或文件损坏时返回None
+        """
+        path = self._path(table, start_time, end_time, columns, limit)
+        if not path.exists():
+            self.misses += 1
+            return None
+        try:
+            # 表中的数组直接引用映射的内存，不复制文件内容
+            source = pa.memory_map(str(path), "r")
+            arrow_table = pa.ipc.open_file(source).read_all()
+            meta = json.loads((arrow_table.schema.metadata or {})[_META_KEY])
+        except Exception as e:
+            print(f"读取历史数据缓存失败 {path.name}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrow_table, _to_timestamp(meta.get("source_max_ts"))
+
+    def store(self, table, start_time, end_time, df, source_max_ts, columns=None, limit=None):
+        """
+        写入缓存，先写临时文件再替换，正在读旧文件的进程不受影响
+
+        参数:
+        df: 查询结果DataFrame
+        source_max_ts: 查询前源表的最大ts
+        """
+        path = self._path(table, start_time, end_time, columns, limit)
+        meta = {
+            "key": self._key(table, start_time, end_time, columns, limit),
+            "source_max_ts": None if source_max_ts is None else str(pd.Timestamp(source_max_ts)),
+            "created_at": time.time()
+        }
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        arrow_table = arrow_table.replace_schema_metadata(
+            {**(arrow_table.schema.metadata or {}), _META_KEY: json.dumps(meta).encode()})
+
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                    writer.write_table(arrow_table)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"写入历史数据缓存失败 {path.name}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._evict()
+
+    def invalidate(self, table, start_time, end_time, columns=None, limit=None):
+        """删除指定查询的缓存"""
+        self._path(table, start_time, end_time, columns, limit).unlink(missing_ok=True)
+
+    def _evict(self):
+        files = sorted(self.directory.glob("*.arrow"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for path in files[self.max_files:]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        """删除全部缓存文件"""
+        for path in self.directory.glob("*.arrow"):
+            path.unlink(missing_ok=True)
+
+
+def slice_by_ts(df, start, end):
+    """按ts闭区间切片已排序的DataFrame，不复制数据"""
+    if 'ts' not in df.columns:
+        return df
+    left = df['ts'].searchsorted(start, side='left')
+    right = df['ts'].searchsorted(end, side='right')
+    return df.iloc[left:right]
+
+
+class IntervalHistoryCache:
+    """
+    按ts区间索引的内存缓存: 已缓存区间内的任意子区间直接切片返回，
+    请求超出已缓存区间时只需查询缺失的边缘部分，查询结果与已有区间合并成一段
+
+    区间两端都是闭区间，与查询条件 ts >= start AND ts <= end 一致
+    """
+
+    def __init__(self, max_rows=5000000, max_age=3600):
+        """
+        参数:
+        max_rows: 缓存的最大行数，超出时淘汰最久未使用的区间
+        max_age: 区间的最长保留时间(秒)，超过后重新查询，为None时不过期
+        """
+        self.max_rows = max_rows
+        self.max_age = max_age
+        # key -> [[start, end, df, last_used, created_at], ...]，按start排序且互不重叠
+        # 合并后的区间沿用其中最早的created_at
+        self._segments = {}
+
+        # 统计信息
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def missing(self, key, start, end):
+        """
+        返回[start, end]中尚未缓存的区间列表，同时统计命中情况
+
+        参数:
+        key: 数据集标识，如币种
+        start, end: pd.Timestamp
+        """
+        self._expire(key)
+        gaps = []
+        cursor = start
+        covered = False  # cursor这一时刻是否已缓存
+        for seg_start, seg_end, *_ in self._segments.get(key, []):
+            if seg_end < cursor:
+                continue
+            if seg_start > end:
+                break
+            if seg_start > cursor:
+                gaps.append((cursor, seg_start))
+            cursor = seg_end
+            covered = True
+            if cursor >= end:
+                break
+        if cursor < end or not covered:
+            gaps.append((cursor, end))
+
+        if not gaps:
+            self.hits += 1
+        elif gaps == [(start, end)]:
+            self.misses += 1
+        else:
+            self.partial_hits += 1
+        return gaps
+
+    def add(self, key, start, end, frames):
+        """
+        把新查询到的数据与重叠或相邻的已缓存区间合并
+
+        参数:
+        start, end: 本次请求的区间，合并后的区间至少覆盖它
+        frames: 缺失部分查询到的DataFrame列表，边界上与已缓存数据重复的行会被去掉
+
+        返回:
+        合并后的整段数据。请求的结束时间晚于最后一条数据时，只记录覆盖到最后一条数据，
+        之后写入源表的数据在下次请求时作为缺失的边缘查询；没有任何数据时不记录区间
+        """
+        segments = self._segments.setdefault(key, [])
+        merged = [seg for seg in segments if seg[1] >= start and seg[0] <= end]
+        kept = [seg for seg in segments if not (seg[1] >= start and seg[0] <= end)]
+
+        parts = [seg[2] for seg in merged] + [f for f in frames if len(f) > 0]
+        if not parts:
+            # 查询结果为空时不能把整个请求区间记为已缓存，否则之后写入的数据永远查不到
+            return frames[0] if frames else pd.DataFrame()
+        df = pd.concat(parts, ignore_index=True)
+        if 'ts' in df.columns:
+            df = df.sort_values('ts', kind='stable').drop_duplicates(subset='ts').reset_index(drop=True)
+
+        new_start = min([start] + [seg[0] for seg in merged])
+        new_end = max([end] + [seg[1] for seg in merged])
+        if 'ts' in df.columns:
+            new_end = min(new_end, df['ts'].iloc[-1])
+        now = time.monotonic()
+        created_at = min([now] + [seg[4] for seg in merged])
+        kept.append([new_start, new_end, df, now, created_at])
+        kept.sort(key=lambda seg: seg[0])
+        self._segments[key] = kept
+        self._evict()
+        return df
+
+    def slice(self, key, start, end):
+        """返回[start, end]的数据，区间未完全缓存时返回None。返回的是缓存数据的切片，调用方不应修改"""
+        self._expire(key)
+        for seg in self._segments.get(key, []):
+            if seg[0] <= start and end <= seg[1]:
+                seg[3] = time.monotonic()
+                return slice_by_ts(seg[2], start, end)
+        return None
+
+    def _expire(self, key):
+        if self.max_age is None or key not in self._segments:
+            return
+        deadline = time.monotonic() - self.max_age
+        self._segments[key] = [seg for seg in self._segments[key] if seg[4] >= deadline]
+
+    def total_rows(self):
+        return sum(len(seg[2]) for segments in self._segments.values() for seg in segments)
+
+    def _evict(self):
+        while self.total_rows() > self.max_rows:
+            key, seg = min(((key, seg) for key, segments in self._segments.items() for seg in segments),
+                           key=lambda item: item[1][3])
+            # 只剩一段时即使超出也保留，否则刚查询的数据会被立即淘汰
+            if sum(len(segments) for segments in self._segments.values()) <= 1:
+                break
+            self._segments[key].remove(seg)
+
+    def clear(self):
+        self._segments.clear()
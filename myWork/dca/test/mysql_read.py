@@ -9,14 +9,30 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 
 import pymysql
 import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
 from cachetools import TTLCache
 from cachetools.keys import hashkey
 import json
 import numpy as np
 
+from myWork.another.db_pool import ConnectionPool
+from myWork.dca.test.history_cache import (DEFAULT_HISTORY_CACHE_DIR, HistoryDiskCache, IntervalHistoryCache,
+                                           slice_by_ts)
+from myWork.dca.test.price_series import PriceSeries, read_only_frame
+
+# 历史行情表
+HISTORY_TABLE = "sorted_history_sui"
+# 回测只需要时间和收盘价
+PRICE_COLUMNS = ('ts', 'close')
+# 按列读取时各列的类型，未列出的列按float64读取
+HISTORY_COLUMN_TYPES = {'ts': 'datetime64[ns]', 'confirm': 'int64'}
+
 
 class MySQLDataReader:
-    def __init__(self, host, user, password, database, port=3306, charset='utf8mb4', cache_maxsize=10, cache_ttl=3600):
+    def __init__(self, host, user, password, database, port=3306, charset='utf8mb4', cache_maxsize=10, cache_ttl=3600,
+                 history_cache_dir=DEFAULT_HISTORY_CACHE_DIR, range_cache_max_rows=5000000, load_partitions=1,
+                 min_partition_rows=50000):
         """
         初始化数据库连接参数
 
@@ -28,7 +44,11 @@ class MySQLDataReader:
         port: 数据库端口，默认为3306
         charset: 字符集，默认为utf8mb4
         cache_maxsize: 缓存最多存储的数据集数量
-        cache_ttl: 缓存数据的有效时间(秒)
+        cache_ttl: 缓存数据的有效时间(秒)，区间缓存中的区间超过该时间后同样重新查询
+        history_cache_dir: 历史数据磁盘缓存目录，多个进程共享，为None时不使用磁盘缓存
+        range_cache_max_rows: 区间缓存最多保存的行数
+        load_partitions: 按列读取历史数据时把时间范围切分成的分区数，大于1时各分区使用连接池中的连接并发读取
+        min_partition_rows: 每个分区的最少行数，数据量较小时减少分区数
         """
         self.host = host
         self.user = user
@@ -40,19 +60,29 @@ class MySQLDataReader:
         self.cache = TTLCache(maxsize=cache_maxsize, ttl=cache_ttl)
         # 使用进程锁替代线程锁
         self.lock = multiprocessing.RLock()
+        self.history_cache = HistoryDiskCache(history_cache_dir) if history_cache_dir else None
+        # 起止时间确定的查询按区间缓存，子区间直接切片
+        self.range_cache = IntervalHistoryCache(max_rows=range_cache_max_rows, max_age=cache_ttl)
+        # 并发分区读取
+        self.load_partitions = load_partitions
+        self.min_partition_rows = min_partition_rows
+        self._pool = None
+
+    def _new_connection(self):
+        return pymysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            port=self.port,
+            charset=self.charset,
+            cursorclass=pymysql.cursors.DictCursor
+        )
 
     def connect(self):
         """建立数据库连接"""
         try:
-            self.connection = pymysql.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                port=self.port,
-                charset=self.charset,
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            self.connection = self._new_connection()
             print(f"成功连接到数据库: {self.database}")
         except Exception as e:
             print(f"连接数据库失败: {e}")
@@ -63,6 +93,9 @@ class MySQLDataReader:
         if self.connection:
             self.connection.close()
             print("已断开数据库连接")
+        if self._pool is not None and self._pool.owned_by_current_process():
+            self._pool.close()
+        self._pool = None
 
     def execute_query(self, query, params=None):
         """执行SQL查询并返回结果"""
@@ -89,8 +122,14 @@ class MySQLDataReader:
         limit: 返回记录数限制，默认为None，表示不限制
 
         返回:
-        pandas DataFrame格式的数据
+        pandas DataFrame格式的数据，与缓存共享的只读数据，需要修改时先copy()
         """
+        # 起止时间都确定时使用区间缓存，已缓存区间的子区间直接切片
+        if self._range_cacheable(start_time, end_time, limit):
+            with self.lock:
+                # 返回缓存数据的只读视图，不复制
+                return read_only_frame(self._get_history_range(start_time, end_time, currency))
+
         # 生成缓存键
         key = hashkey(start_time, end_time, currency, limit)
 
@@ -98,136 +137,328 @@ class MySQLDataReader:
         with self.lock:
             if key in self.cache:
                 print(f"从缓存获取数据: start={start_time}, end={end_time}, currency={currency}, limit={limit}")
-                return self.cache[key].copy()  # 返回副本，避免修改缓存数据
-
-            # 缓存未命中，从数据库读取
-            query = "SELECT * FROM sorted_history_sui"
-            conditions = []
-            params = []
-
-            if start_time:
-                conditions.append("ts >= %s")
-                params.append(start_time)
-
-            if end_time:
-                conditions.append("ts <= %s")
-                params.append(end_time)
+                return self.cache[key]
 
-            # if currency:
-            #     conditions.append("currency = %s")  # 添加币种条件
-            #     params.append(currency)
+            # 缓存未命中，从磁盘缓存或数据库读取
+            df = self._load_sorted_history(start_time, end_time, currency, limit)
 
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-
-            query += " ORDER BY ts ASC"
-
-            if limit:
-                query += f" LIMIT {limit}"
-
-            result = self.execute_query(query, params)
+            # 缓存只读视图，调用方需要修改时自行复制
+            df = read_only_frame(df)
+            self.cache[key] = df
+            print(f"已缓存数据: start={start_time}, end={end_time}, currency={currency}, limit={limit}")
 
-            # 转换为DataFrame
-            df = pd.DataFrame(result)
+            return df
 
-            # 确保ts列是datetime类型
-            if 'ts' in df.columns:
-                df['ts'] = pd.to_datetime(df['ts'])
+    def get_price_series(self, start_time=None, end_time=None, currency=None, limit=None):
+        """
+        获取只读的价格序列，供回测直接使用。缓存中保存的就是返回的对象，命中时不复制
 
-            # 缓存数据
-            self.cache[key] = df.copy()  # 存储副本，避免外部修改
-            print(f"已缓存数据: start={start_time}, end={end_time}, currency={currency}, limit={limit}")
+        参数与get_sorted_history_data相同
 
-            return df
+        返回:
+        PriceSeries，数组不可写，所有回测共享同一份数据
+        """
+        key = hashkey('price_series', start_time, end_time, currency, limit)
 
-    def clear_cache(self):
-        """清空缓存"""
         with self.lock:
-            self.cache.clear()
-            print("缓存已清空")
-
-    def create_parameter_table(self):
-        """创建策略参数表"""
-        query = """
-        CREATE TABLE IF NOT EXISTS strategy_parameters (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            params JSON NOT NULL,
-            params_hash VARCHAR(32) GENERATED ALWAYS AS (MD5(CAST(params AS CHAR))) STORED,
-            status ENUM('pending', 'executing', 'completed', 'failed') DEFAULT 'pending',
-            result JSON NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            UNIQUE KEY uk_params_hash (params_hash)
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            if key in self.cache:
+                return self.cache[key]
+
+            # 只读取时间和收盘价两列
+            if self._range_cacheable(start_time, end_time, limit):
+                df = self._get_history_range(start_time, end_time, currency, columns=PRICE_COLUMNS)
+            else:
+                df = self._load_sorted_history(start_time, end_time, currency, limit, columns=PRICE_COLUMNS)
+            series = PriceSeries.from_frame(df)
+            self.cache[key] = series
+            print(f"已缓存价格序列: start={start_time}, end={end_time}, currency={currency}, limit={limit}, "
+                  f"共{len(series)}条")
+            return series
+
+    @staticmethod
+    def _range_cacheable(start_time, end_time, limit):
+        return start_time is not None and end_time is not None and not limit
+
+    def _get_history_range(self, start_time, end_time, currency=None, columns=None):
         """
-        self.execute_query(query)
-        print("策略参数表已创建或已存在")
-
-    def _convert_numpy_types(self, obj):
-        if isinstance(obj, numpy.integer):
-            return int(obj)
-        return obj
-
-    def insert_parameters(self, params_list):
-        """批量插入参数组合，避免重复"""
-        if not params_list:
-            return
-
-        query = "INSERT IGNORE INTO strategy_parameters (params, status) VALUES (%s, 'pending')"
-        params = [(json.dumps(p, default=self._convert_numpy_types),) for p in params_list]
-
-        with self.connection.cursor() as cursor:
-            cursor.executemany(query, params)
-        self.connection.commit()
-        print(f"成功插入 {len(params_list)} 个参数组合，忽略重复项")
-
-    def get_unexecuted_parameter(self):
-        """获取一个未执行的参数组合并标记为执行中"""
-        # 使用SELECT FOR UPDATE锁定行，防止并发问题
-        query = """
-        SELECT id, params FROM strategy_parameters 
-        WHERE status = 'pending' 
-        ORDER BY id ASC 
-        LIMIT 1 
-        FOR UPDATE;
+        从区间缓存读取[start_time, end_time]的数据，只查询未缓存的边缘部分
+
+        返回的是缓存数据的切片，调用方需要持有self.lock且不能修改
         """
+        start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+        # 不同的列组合分别缓存
+        key = (currency, None if columns is None else tuple(columns))
+        gaps = self.range_cache.missing(key, start, end)
+        if not gaps:
+            return self.range_cache.slice(key, start, end)
+
+        if gaps == [(start, end)]:
+            # 与已缓存区间没有重叠，整段读取(可以使用磁盘缓存)
+            frames = [self._load_sorted_history(start_time, end_time, currency, columns=columns)]
+        else:
+            print(f"区间缓存补充查询: {[(str(s), str(e)) for s, e in gaps]}")
+            frames = [self._query_sorted_history(gap_start, gap_end, currency, columns=columns)
+                      for gap_start, gap_end in gaps]
+        return slice_by_ts(self.range_cache.add(key, start, end, frames), start, end)
+
+    def _load_sorted_history(self, start_time=None, end_time=None, currency=None, limit=None, columns=None):
+        """读取sorted_history数据，优先使用磁盘共享缓存，源表在缓存范围之后新增了数据时重新查询"""
+        if self.history_cache is None:
+            return self._query_sorted_history(start_time, end_time, currency, limit, columns)
+
+        cache_key = (HISTORY_TABLE, start_time, end_time, columns, limit)
+        cached = self.history_cache.load(*cache_key)
+        if cached is not None and not self._history_grew(cached[1], end_time):
+            return cached[0].to_pandas()
+
+        # 同一查询只由一个进程访问数据库，其他进程等待后读取它写入的文件
+        with self.history_cache.lock(*cache_key):
+            cached = self.history_cache.load(*cache_key)
+            if cached is not None and not self._history_grew(cached[1], end_time):
+                return cached[0].to_pandas()
+
+            # 先取最大ts再查询，查询期间新写入的数据会在下次读取时触发失效
+            source_max_ts = self._get_source_max_ts()
+            df = self._query_sorted_history(start_time, end_time, currency, limit, columns)
+            self.history_cache.store(HISTORY_TABLE, start_time, end_time, df, source_max_ts, columns=columns,
+                                     limit=limit)
+            print(f"已写入历史数据磁盘缓存: start={start_time}, end={end_time}, 共{len(df)}条")
+            return df
 
-        update_query = """
-        UPDATE strategy_parameters 
-        SET status = 'executing', updated_at = CURRENT_TIMESTAMP 
-        WHERE id = %s;
+    def _get_source_max_ts(self):
+        """源表当前的最大ts"""
+        if self.connection:
+            # 结束当前连接上未结束的读事务，否则一直读到第一次查询时的快照，检测不到之后写入的数据
+            # (写操作都在各自的方法中立即提交，这里回滚不会丢失数据)
+            self.connection.rollback()
+        result = self.execute_query(f"SELECT MAX(ts) AS max_ts FROM {HISTORY_TABLE}")
+        max_ts = result[0]['max_ts'] if result else None
+        return None if max_ts is None else pd.Timestamp(max_ts)
+
+    def _history_grew(self, cached_max_ts, end_time):
+        """缓存写入后源表是否新增了查询范围内的数据"""
+        # 查询的结束时间不晚于缓存时的最大ts，之后新增的数据不在查询范围内
+        if cached_max_ts is not None and end_time is not None and pd.Timestamp(end_time) <= cached_max_ts:
+            return False
+        current_max_ts = self._get_source_max_ts()
+        if current_max_ts is None:
+            return False
+        return cached_max_ts is None or current_max_ts > cached_max_ts
+
+    @staticmethod
+    def _history_conditions(start_time=None, end_time=None):
+        """按起止时间生成WHERE子句和参数"""
+        conditions = []
+        params = []
+
+        if start_time:
+            conditions.append("ts >= %s")
+            params.append(start_time)
+
+        if end_time:
+            conditions.append("ts <= %s")
+            params.append(end_time)
+
+        # if currency:
+        #     conditions.append("currency = %s")  # 添加币种条件
+        #     params.append(currency)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def _query_sorted_history(self, start_time=None, end_time=None, currency=None, limit=None, columns=None):
+        """从数据库读取sorted_history数据，不经过缓存。指定columns时按列流式读取"""
+        if columns is not None:
+            if self.load_partitions > 1 and start_time is not None and end_time is not None and not limit:
+                arrays = self.load_history_parallel(start_time, end_time, columns)
+            else:
+                arrays = self.read_history_arrays(start_time, end_time, columns, limit)
+            # 直接引用读取到的数组，不再复制
+            return pd.DataFrame(arrays, copy=False)
+
+        where, params = self._history_conditions(start_time, end_time)
+        query = f"SELECT * FROM {HISTORY_TABLE}{where} ORDER BY ts ASC"
+
+        if limit:
+            query += f" LIMIT {limit}"
+
+        result = self.execute_query(query, params)
+
+        # 转换为DataFrame
+        df = pd.DataFrame(result)
+
+        # 确保ts列是datetime类型
+        if 'ts' in df.columns:
+            df['ts'] = pd.to_datetime(df['ts'])
+
+        return df
+
+    @staticmethod
+    def _stream_select_expr(column):
+        """按列的类型生成查询表达式，让服务器直接返回整数和浮点数，不生成Decimal和datetime对象"""
+        dtype = np.dtype(HISTORY_COLUMN_TYPES.get(column, 'float64'))
+        if dtype.kind == 'M':
+            # 不受会话时区影响的微秒时间戳
+            return f"TIMESTAMPDIFF(MICROSECOND, '1970-01-01 00:00:00', {column})"
+        if dtype.kind in 'iu':
+            return f"CAST({column} AS SIGNED)"
+        # 与浮点数相加的结果为DOUBLE，兼容不支持CAST AS DOUBLE的旧版本MySQL
+        return f"({column} + 0E0)"
+
+    def read_history_arrays(self, start_time=None, end_time=None, columns=PRICE_COLUMNS, limit=None,
+                            batch_size=20000, connection=None, count=None):
         """
+        按列流式读取历史数据到NumPy数组: 只查询需要的列，通过不缓冲的SSCursor分批取数，
+        直接写入预先分配好的数组，不生成每行一个的字典
+
+        参数:
+        start_time: 开始时间，默认为None，表示不限制
+        end_time: 结束时间，默认为None，表示不限制
+        columns: 需要读取的列
+        limit: 返回记录数限制
+        batch_size: 每批从服务器读取的行数
+        connection: 使用的数据库连接，默认为当前连接
+        count: 已知的行数，用于预先分配数组，为None时先查询行数
 
+        返回:
+        {列名: numpy数组}，按ts升序，ts为datetime64[ns]，浮点列中的NULL为NaN
+        """
+        columns = list(columns)
+        for column in columns:
+            if not column.isidentifier():
+                raise ValueError(f"非法的列名: {column}")
+        if connection is None:
+            if not self.connection:
+                self.connect()
+            connection = self.connection
+
+        where, params = self._history_conditions(start_time, end_time)
+
+        # 先统计行数，一次性分配数组
+        if count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) AS n FROM {HISTORY_TABLE}{where}", params)
+                row = cursor.fetchone()
+            count = row['n'] if isinstance(row, dict) else row[0]
+        if limit:
+            count = min(count, int(limit))
+
+        dtypes = [np.dtype(HISTORY_COLUMN_TYPES.get(column, 'float64')) for column in columns]
+        # 时间先按int64微秒存放，读完后转换
+        arrays = [np.empty(count, dtype=np.int64 if dtype.kind == 'M' else dtype) for dtype in dtypes]
+
+        query = (f"SELECT {', '.join(self._stream_select_expr(column) for column in columns)} "
+                 f"FROM {HISTORY_TABLE}{where} ORDER BY ts ASC")
+        if limit:
+            query += f" LIMIT {int(limit)}"
+
+        filled = 0
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
         try:
-            with self.connection.cursor() as cursor:
-                # 开始事务
-                self.connection.begin()
-                cursor.execute(query)
-                result = cursor.fetchone()
-                if result:
-                    param_id = result['id']
-                    params = json.loads(result['params'])
-                    cursor.execute(update_query, (param_id,))
-                    self.connection.commit()
-                    return param_id, params
-                self.connection.commit()
-                return None, None
-        except Exception as e:
-            self.connection.rollback()
-            print(f"获取未执行参数失败: {e}")
-            raise
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                n = len(rows)
+                if filled + n > len(arrays[0]):
+                    # 统计行数之后又写入了新数据
+                    arrays = [np.resize(array, max(filled + n, len(array) * 2)) for array in arrays]
+                # 按列从元组直接写入目标数组，不生成临时的二维数组
+                for j, array in enumerate(arrays):
+                    if array.dtype.kind == 'f':
+                        values = (np.nan if row[j] is None else row[j] for row in rows)
+                    else:
+                        values = (row[j] for row in rows)
+                    array[filled:filled + n] = np.fromiter(values, dtype=array.dtype, count=n)
+                filled += n
+        finally:
+            cursor.close()
+
+        result = {}
+        for column, dtype, array in zip(columns, dtypes, arrays):
+            array = array[:filled]
+            if dtype.kind == 'M':
+                array *= 1000
+                array = array.view('datetime64[ns]')
+            result[column] = array
+        return result
+
+    def _get_pool(self):
+        if self._pool is None or not self._pool.owned_by_current_process():
+            self._pool = ConnectionPool(self._new_connection, max_size=self.load_partitions)
+        return self._pool
+
+    def load_history_parallel(self, start_time, end_time, columns=PRICE_COLUMNS, partitions=None, batch_size=20000):
+        """
+        把[start_time, end_time]按时间切分成多个分区，每个分区使用连接池中的一个连接并发读取，
+        再按时间顺序拼接成一份按列存放的结果
+
+        参数:
+        start_time, end_time: 时间范围(闭区间)
+        columns: 需要读取的列
+        partitions: 分区数，默认为load_partitions
+        batch_size: 每批从服务器读取的行数
 
-    def update_parameter_status(self, param_id, status, result=None):
-        """更新参数执行状态和结果"""
-        query = """
-        UPDATE strategy_parameters 
-        SET status = %s, result = %s, updated_at = CURRENT_TIMESTAMP 
-        WHERE id = %s;
+        返回:
+        {列名: numpy数组}，与read_history_arrays相同
         """
-        result_json = json.dumps(result) if result else None
-        self.execute_query(query, (status, result_json, param_id))
-        self.connection.commit()
-        print(f"参数 {param_id} 状态已更新为 {status}")
+        partitions = partitions or self.load_partitions
+        start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+        if partitions <= 1 or end <= start:
+            return self.read_history_arrays(start, end, columns, batch_size=batch_size)
+
+        # 各分区为[b_i, b_{i+1})，用b_{i+1}前一微秒作为闭区间的结束时间，最后一个分区包含end
+        bounds = pd.date_range(start, end, periods=partitions + 1)
+        ranges = [(bounds[i].to_pydatetime(), (bounds[i + 1] - pd.Timedelta(microseconds=1)).to_pydatetime())
+                  for i in range(partitions - 1)]
+        ranges.append((bounds[-2].to_pydatetime(), end.to_pydatetime()))
+
+        # 一次查询统计每个分区的行数，各分区读取时直接按行数分配数组，不再各自统计
+        where, params = self._history_conditions(start, end)
+        sums = ", ".join(f"SUM(ts BETWEEN %s AND %s) AS p{i}" for i in range(partitions))
+        row = self.execute_query(f"SELECT {sums} FROM {HISTORY_TABLE}{where}",
+                                 [bound for partition_range in ranges for bound in partition_range] + params)[0]
+        counts = [int(row[f"p{i}"] or 0) for i in range(partitions)]
+
+        # 数据量较小时合并相邻分区，避免建立过多连接
+        merged = max(1, min(partitions, sum(counts) // max(self.min_partition_rows, 1)))
+        if merged < partitions:
+            groups = np.array_split(np.arange(partitions), merged)
+            ranges = [(ranges[group[0]][0], ranges[group[-1]][1]) for group in groups]
+            counts = [sum(counts[i] for i in group) for group in groups]
+            partitions = merged
+        if partitions <= 1:
+            return self.read_history_arrays(start, end, columns, batch_size=batch_size, count=counts[0])
+
+        pool = self._get_pool()
+
+        def load_partition(partition):
+            partition_range, count = partition
+            connection = pool.acquire()
+            try:
+                return self.read_history_arrays(partition_range[0], partition_range[1], columns,
+                                                batch_size=batch_size, connection=connection, count=count)
+            finally:
+                pool.release(connection)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=partitions, thread_name_prefix="history-load") as executor:
+            pieces = list(executor.map(load_partition, zip(ranges, counts)))
+
+        result = {column: np.concatenate([piece[column] for piece in pieces]) for column in columns}
+        rows = len(result[columns[0]]) if columns else 0
+        print(f"分区并发读取历史数据: {partitions}个分区, 共{rows}条, 耗时{time.perf_counter() - started:.2f}秒")
+        return result
+
+    def clear_cache(self, disk=False):
+        """清空缓存，disk为True时同时删除磁盘缓存文件"""
+        with self.lock:
+            self.cache.clear()
+            self.range_cache.clear()
+            if disk and self.history_cache is not None:
+                self.history_cache.clear()
+            print("缓存已清空")
 
     def get_cache_info(self):
         """获取缓存信息"""
@@ -235,5 +466,10 @@ class MySQLDataReader:
             return {
                 'current_size': len(self.cache),
                 'max_size': self.cache.maxsize,
-                'ttl': self.cache.ttl
+                'ttl': self.cache.ttl,
+                'range_hits': self.range_cache.hits,
+                'range_partial_hits': self.range_cache.partial_hits,
+                'range_rows': self.range_cache.total_rows(),
+                'disk_hits': self.history_cache.hits if self.history_cache else 0,
+                'disk_misses': self.history_cache.misses if self.history_cache else 0
             }
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+
+def _read_only(array):
+    # 在视图上关闭可写标志，不影响调用方的原数组
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+
+def read_only_frame(df):
+    """返回与df共享数据的DataFrame，各列数组不可写，修改时抛出ValueError，可以安全地返回缓存数据"""
+    return pd.DataFrame({column: _read_only(df[column].to_numpy()) for column in df.columns},
+                        index=df.index, copy=False)
+
+
+class PriceSeries:
+    """
+    只读的价格序列，回测时所有参数组合共享同一份数据，不再逐个复制DataFrame
+
+    ts、close、price_change_pct 都是关闭了可写标志的NumPy数组，修改时直接抛出ValueError
+    """
+
+    def __init__(self, ts, close, price_change_pct):
+        """
+        参数:
+        ts: 时间数组(datetime64[ns])，按时间升序
+        close: 收盘价数组
+        price_change_pct: 价格变动百分比数组
+        """
+        self.ts = _read_only(ts)
+        self.close = _read_only(close)
+        self.price_change_pct = _read_only(price_change_pct)
+        # DatetimeIndex本身不可修改，直接引用ts数组，遍历时得到Timestamp
+        self.times = pd.DatetimeIndex(self.ts, copy=False)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        由历史K线DataFrame构建，处理方式与原prepare_data一致: 按时间排序、计算价格变动、去掉含空值的行
+
+        参数:
+        df: 包含ts和close列的DataFrame，不会被修改
+        """
+        if not df['ts'].is_monotonic_increasing:
+            df = df.sort_values('ts')
+        price_change_pct = df['close'].pct_change()
+        valid = (df.notna().all(axis=1) & price_change_pct.notna()).to_numpy()
+        return cls(pd.to_datetime(df['ts']).to_numpy(dtype='datetime64[ns]')[valid],
+                   df['close'].to_numpy(dtype=np.float64)[valid],
+                   price_change_pct.to_numpy(dtype=np.float64)[valid])
+
+    @classmethod
+    def coerce(cls, data):
+        """已经是PriceSeries时直接返回，DataFrame转换一次，供多次回测共享"""
+        if isinstance(data, cls):
+            return data
+        return cls.from_frame(data)
+
+    def __len__(self):
+        return len(self.close)
+
+    def __reduce__(self):
+        # 传给子进程后重新设置只读标志
+        return self.__class__, (self.ts, self.close, self.price_change_pct)
+
+    @property
+    def empty(self):
+        return len(self.close) == 0
+
+    def to_frame(self):
+        """转换为DataFrame(会复制数据)，用于分析和绘图"""
+        return pd.DataFrame({'ts': self.ts, 'close': self.close, 'price_change_pct': self.price_change_pct})
@@ -1,99 +1,187 @@
+import time
 from datetime import datetime
 
 import pymysql
 
-from myWork.dca.test.mysql_read import MySQLDataReader
+from myWork.another.backtest_cache import data_fingerprint, get_backtest_cache, result_key
+from myWork.dca.test.mysql_read import MySQLDataReader, PRICE_COLUMNS
 from myWork.dca.test.stg import DCAStrategy
 
+# 回测结果缓存的版本，DCAStrategy的回测逻辑或指标变化时修改，使旧的缓存结果失效
+DCA_CACHE_VERSION = "dca-v2"
+
+# 需要验证的字段列表
+REQUIRED_PERFORMANCE_FIELDS = [
+    'total_return', 'annualized_return', 'sharpe_ratio', 'max_drawdown',
+    'trade_count', 'dca_count', 'take_profit_count', 'win_rate',
+    'final_portfolio_value'
+]
+
+REQUIRED_STRATEGY_FIELDS = [
+    'price_drop_threshold', 'max_time_since_last_trade', 'min_time_since_last_trade',
+    'take_profit_threshold', 'initial_capital', 'initial_investment_ratio', 'initial_dca_value'
+]
+
+INSERT_PERFORMANCE_SQL = """
+INSERT INTO strategy_performance 
+(currency, total_return, annualized_return, sharpe_ratio, max_drawdown, 
+ trade_count, dca_count, take_profit_count, win_rate, final_portfolio_value,
+ price_drop_threshold, max_time_since_last_trade, min_time_since_last_trade,
+ take_profit_threshold, initial_capital, initial_investment_ratio, initial_dca_value,
+ total_fees,
+ start_time, end_time)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def build_performance_row(performance, strategy_config, start_time, end_time, currency):
+    """验证回测结果和策略参数，返回strategy_performance表的一行数据"""
+    # 验证performance字典中的字段
+    for field in REQUIRED_PERFORMANCE_FIELDS:
+        if field not in performance:
+            raise ValueError(f"performance缺少必要的字段: {field}")
+        if performance[field] is None:
+            raise ValueError(f"performance字段 '{field}' 的值为None")
+
+    # 验证strategy_config字典中的字段
+    for field in REQUIRED_STRATEGY_FIELDS:
+        if field not in strategy_config:
+            raise ValueError(f"strategy_config缺少必要的字段: {field}")
+        if strategy_config[field] is None:
+            raise ValueError(f"strategy_config字段 '{field}' 的值为None")
+
+    # 检查时间参数
+    if not isinstance(start_time, (str, datetime)):
+        raise TypeError(f"start_time类型错误，期望str或datetime，得到{type(start_time)}")
+    if not isinstance(end_time, (str, datetime)):
+        raise TypeError(f"end_time类型错误，期望str或datetime，得到{type(end_time)}")
+
+    # 检查currency参数
+    if not isinstance(currency, str):
+        raise TypeError(f"currency类型错误，期望str，得到{type(currency)}")
+
+    return (
+        currency,
+        performance['total_return'],
+        performance['annualized_return'],
+        performance['sharpe_ratio'],
+        performance['max_drawdown'],
+        performance['trade_count'],
+        performance['dca_count'],
+        performance['take_profit_count'],
+        performance['win_rate'],
+        performance['final_portfolio_value'],
+        strategy_config['price_drop_threshold'],
+        strategy_config['max_time_since_last_trade'],
+        strategy_config['min_time_since_last_trade'],
+        strategy_config['take_profit_threshold'],
+        strategy_config['initial_capital'],
+        strategy_config['initial_investment_ratio'],
+        strategy_config['initial_dca_value'],
+        performance.get('total_fees', 0),
+        start_time,
+        end_time
+    )
+
+
+class PerformanceSink:
+    """每个worker一个的回测结果缓冲区，使用持久连接按行数或时间批量写入strategy_performance"""
+
+    def __init__(self, db_config, flush_size=200, flush_interval=10):
+        """
+        参数:
+        db_config: 数据库连接配置
+        flush_size: 缓存的结果达到该行数时写入
+        flush_interval: 缓存的结果最长等待时间(秒)
+        """
+        self.db_config = db_config
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.connection = None
+        self._rows = []
+        self._on_written = []
+        self._last_flush = time.monotonic()
+
+        # 统计信息
+        self.rows_written = 0
+        self.flushes = 0
+
+    def add(self, performance, strategy_config, start_time, end_time, currency, on_written=None):
+        """
+        缓存一条回测结果，字段验证失败时立即抛出异常
+
+        on_written: 该结果写入数据库后调用的函数
+        """
+        self._rows.append(build_performance_row(performance, strategy_config, start_time, end_time, currency))
+        if on_written is not None:
+            self._on_written.append(on_written)
+        if len(self._rows) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把缓存的结果写入数据库，executemany会合并为多行INSERT"""
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        if self.connection is None or not self.connection.open:
+            self.connection = pymysql.connect(**self.db_config)
+        else:
+            self.connection.ping(reconnect=True)
+
+        rows, self._rows = self._rows, []
+        callbacks, self._on_written = self._on_written, []
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(INSERT_PERFORMANCE_SQL, rows)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            # 写入失败时保留数据，下次再试
+            self._rows = rows + self._rows
+            self._on_written = callbacks + self._on_written
+            raise
+        self.rows_written += len(rows)
+        self.flushes += 1
+        for callback in callbacks:
+            callback()
+
+    def discard(self):
+        """丢弃缓存中尚未写入的结果，调用方会整批重新add时使用，避免重复写入"""
+        self._rows = []
+        self._on_written = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.connection and self.connection.open:
+                self.connection.close()
+            self.connection = None
+
 
 def save_strategy_performance(db_config, performance, strategy_config, start_time, end_time, currency, debug=False):
     """将策略回测结果和配置参数保存到MySQL数据库"""
-    # 定义需要验证的字段列表
-    required_performance_fields = [
-        'total_return', 'annualized_return', 'sharpe_ratio', 'max_drawdown',
-        'trade_count', 'dca_count', 'take_profit_count', 'win_rate',
-        'final_portfolio_value'
-    ]
-
-    required_strategy_fields = [
-        'price_drop_threshold', 'max_time_since_last_trade', 'min_time_since_last_trade',
-        'take_profit_threshold', 'initial_capital', 'initial_investment_ratio', 'initial_dca_value'
-    ]
-
+    connection = None
+    cursor = None
+    params = None
     try:
-        # 验证performance字典中的字段
-        for field in required_performance_fields:
-            if field not in performance:
-                raise ValueError(f"performance缺少必要的字段: {field}")
-            if performance[field] is None:
-                raise ValueError(f"performance字段 '{field}' 的值为None")
-
-        # 验证strategy_config字典中的字段
-        for field in required_strategy_fields:
-            if field not in strategy_config:
-                raise ValueError(f"strategy_config缺少必要的字段: {field}")
-            if strategy_config[field] is None:
-                raise ValueError(f"strategy_config字段 '{field}' 的值为None")
-
-        # 检查时间参数
-        if not isinstance(start_time, (str, datetime)):
-            raise TypeError(f"start_time类型错误，期望str或datetime，得到{type(start_time)}")
-        if not isinstance(end_time, (str, datetime)):
-            raise TypeError(f"end_time类型错误，期望str或datetime，得到{type(end_time)}")
-
-        # 检查currency参数
-        if not isinstance(currency, str):
-            raise TypeError(f"currency类型错误，期望str，得到{type(currency)}")
+        params = build_performance_row(performance, strategy_config, start_time, end_time, currency)
 
         connection = pymysql.connect(**db_config)
         with connection.cursor() as cursor:
-            sql = """
-            INSERT INTO strategy_performance 
-            (currency, total_return, annualized_return, sharpe_ratio, max_drawdown, 
-             trade_count, dca_count, take_profit_count, win_rate, final_portfolio_value,
-             price_drop_threshold, max_time_since_last_trade, min_time_since_last_trade,
-             take_profit_threshold, initial_capital, initial_investment_ratio, initial_dca_value,
-             total_fees,
-             start_time, end_time)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            # 准备所有参数值
-            params = (
-                currency,
-                performance['total_return'],
-                performance['annualized_return'],
-                performance['sharpe_ratio'],
-                performance['max_drawdown'],
-                performance['trade_count'],
-                performance['dca_count'],
-                performance['take_profit_count'],
-                performance['win_rate'],
-                performance['final_portfolio_value'],
-                strategy_config['price_drop_threshold'],
-                strategy_config['max_time_since_last_trade'],
-                strategy_config['min_time_since_last_trade'],
-                strategy_config['take_profit_threshold'],
-                strategy_config['initial_capital'],
-                strategy_config['initial_investment_ratio'],
-                strategy_config['initial_dca_value'],
-                performance.get('total_fees', 0),
-                start_time,
-                end_time
-            )
-
             # 仅在debug模式下打印参数信息
             if debug:
                 print("\n准备插入的参数:")
                 print(f"currency: {currency}")
-                for field in required_performance_fields:
+                for field in REQUIRED_PERFORMANCE_FIELDS:
                     print(f"performance['{field}']: {performance[field]} ({type(performance[field])})")
-                for field in required_strategy_fields:
+                for field in REQUIRED_STRATEGY_FIELDS:
                     print(f"strategy_config['{field}']: {strategy_config[field]} ({type(strategy_config[field])})")
                 print(f"total_fees: {performance.get('total_fees', 0)}")
                 print(f"start_time: {start_time} ({type(start_time)})")
                 print(f"end_time: {end_time} ({type(end_time)})")
 
-            cursor.execute(sql, params)
+            cursor.execute(INSERT_PERFORMANCE_SQL, params)
         connection.commit()
 
         # 仅在debug模式下打印成功信息
@@ -115,7 +203,8 @@ def save_strategy_performance(db_config, performance, strategy_config, start_tim
         if debug:
             print(f"\nMySQL错误 ({e.args[0]}): {e.args[1]}")
             # 获取错误的SQL语句
-            print(f"错误的SQL: {cursor.mogrify(sql, params).decode('utf-8')}")
+            if cursor is not None:
+                print(f"错误的SQL: {cursor.mogrify(INSERT_PERFORMANCE_SQL, params)}")
         raise
     except Exception as e:
         # 仅在debug模式下打印其他错误信息
@@ -129,30 +218,62 @@ def save_strategy_performance(db_config, performance, strategy_config, start_tim
             connection.close()
 
 
-def run_strategy_df(config, db_config, start_time, end_time, df):
-    """运行策略并返回性能指标"""
+def run_strategy_df(config, db_config, start_time, end_time, df, sink=None, save=True, prune_rules=None,
+                    cache=None):
+    """
+    运行策略并返回性能指标，传入sink时结果先缓存再批量写入，save为False时不写入数据库
+
+    df可以是PriceSeries或DataFrame，回测不会修改数据，所有参数组合直接共享，不再复制
+    prune_rules为提前结束条件(prune_max_drawdown等)，被提前结束的回测只返回部分指标，不写入数据库
+    cache为BacktestResultCache，默认使用进程内共享的缓存，传False时不使用。相同数据、参数(含随机数种子)、
+    手续费率和回测区间的结果直接从缓存返回，且不再写入数据库: 只有写入成功(或不需要写入)的结果才会进入缓存，
+    崩溃后重跑或参数网格重叠时不会插入重复的行。seed为None的回测结果不固定，不使用缓存
+    """
     try:
 
         if df.empty:
             reader = MySQLDataReader(**db_config)
             reader.connect()
-            df = reader.get_sorted_history_data(start_time, end_time, config.get('currency', 'UNKNOWN'))
+            df = reader.get_price_series(start_time, end_time, config.get('currency', 'UNKNOWN'))
             reader.disconnect()
 
-        df1 = df.copy(deep=True)  # 确保所有层级数据独立
+        strategy = DCAStrategy(**config, **(prune_rules or {}))
+        if cache is None:
+            cache = get_backtest_cache()
+        currency = config.get('currency', 'UNKNOWN')
+        key = None
+        if cache is not False and strategy.seed is not None:
+            key = result_key(DCA_CACHE_VERSION, data_fingerprint(df, PRICE_COLUMNS), {
+                'config': config,
+                'prune_rules': prune_rules or {},
+                'fees': [strategy.buy_fee_rate, strategy.sell_fee_rate],
+                'seed': strategy.seed,
+                # 结果按回测区间和币种写入数据库，区间不同或本次需要写入而之前没有写入时不能复用
+                'window': [start_time, end_time, currency],
+                'stored': sink is not None or bool(save)
+            })
+            performance = cache.get(key)
+            if performance is not None:
+                # 命中说明相同的回测已经完成并写入过数据库
+                return {
+                    'config': config,
+                    'performance': performance
+                }
+
+        performance = strategy.backtest(df)
 
-        strategy = DCAStrategy(**config)
-        performance = strategy.backtest(df1)
+        def remember():
+            if key is not None:
+                cache.put(key, performance)
 
-        # 保存到数据库，从配置中获取币种
-        save_strategy_performance(
-            db_config,
-            performance,
-            config,
-            start_time,
-            end_time,
-            config.get('currency', 'UNKNOWN')  # 从配置中获取币种，如果没有则使用默认值
-        )
+        # 保存到数据库，币种从配置中获取，如果没有则使用默认值。写入成功后才加入缓存
+        if performance['pruned'] or (sink is None and not save):
+            remember()
+        elif sink is not None:
+            sink.add(performance, config, start_time, end_time, currency, on_written=remember)
+        else:
+            save_strategy_performance(db_config, performance, config, start_time, end_time, currency)
+            remember()
 
         return {
             'config': config,
@@ -5,12 +5,15 @@ from datetime import datetime, timedelta
 import pymysql
 import random
 
+from myWork.dca.test.price_series import PriceSeries
+
 
 class DCAStrategy:
     def __init__(self, price_drop_threshold=0.02, max_time_since_last_trade=7,
                  min_time_since_last_trade=3, take_profit_threshold=0.01,
                  initial_capital=100000, initial_investment_ratio=0.5, initial_dca_value=0.1,
-                 buy_fee_rate=0.001, sell_fee_rate=0.001, currency="UNKNOWN"):
+                 buy_fee_rate=0.001, sell_fee_rate=0.001, currency="UNKNOWN",
+                 prune_max_drawdown=None, prune_min_equity=None, prune_no_trade_days=None, seed=0):
         """
         初始化DCA策略参数
 
@@ -23,6 +26,10 @@ class DCAStrategy:
         initial_investment_ratio: 初始投资使用的资金比例
         buy_fee_rate: 买入交易费用比例
         sell_fee_rate: 卖出交易费用比例
+        prune_max_drawdown: 回撤超过该比例时提前结束回测，为None时不检查
+        prune_min_equity: 资产低于初始资金的该比例时提前结束回测，为None时不检查
+        prune_no_trade_days: 超过该天数没有任何交易时提前结束回测，为None时不检查
+        seed: 随机交易间隔的随机数种子，相同种子的回测结果可以复现，为None时每次回测不同
         """
         self.portfolio_df = None
         self.price_drop_threshold = price_drop_threshold
@@ -36,6 +43,17 @@ class DCAStrategy:
         self.sell_fee_rate = sell_fee_rate
         self.currency = currency
 
+        # 提前结束条件，被提前结束的回测只计算到结束时的指标
+        self.prune_max_drawdown = prune_max_drawdown
+        self.prune_min_equity = prune_min_equity
+        self.prune_no_trade_days = prune_no_trade_days
+        self.pruned_reason = None
+        self.pruned_at = None
+
+        # 使用独立的随机数生成器，不受全局random的影响，每次回测开始时按种子重置
+        self.seed = seed
+        self._rng = random.Random(seed)
+
         # 策略状态
         self.positions = []  # 持仓记录
         self.trades = []  # 交易记录
@@ -114,7 +132,7 @@ class DCAStrategy:
             time_since_last_trade = float('inf')
 
         # 随机选择一个介于min和max之间的时间阈值
-        random_time_threshold = random.uniform(self.min_time_since_last_trade, self.max_time_since_last_trade)
+        random_time_threshold = self._rng.uniform(self.min_time_since_last_trade, self.max_time_since_last_trade)
 
         # 如果价格下跌超过阈值或者无交易时间超过随机时间阈值，则执行DCA
         return (price_drop >= self.price_drop_threshold) or (time_since_last_trade >= random_time_threshold)
@@ -199,30 +217,35 @@ class DCAStrategy:
             'fee': fee
         })
 
-    def prepare_data(self, df):
-        """准备策略所需的数据"""
-        # 确保数据按时间排序
-        df = df.sort_values('ts')
+    def prepare_data(self, data):
+        """准备策略所需的数据，已经是PriceSeries时直接使用，不复制"""
+        return PriceSeries.coerce(data)
 
-        # 计算价格变动百分比
-        df['price_change_pct'] = df['close'].pct_change()
-
-        return df.dropna()
+    def backtest(self, data):
+        """
+        回测策略
 
-    def backtest(self, df):
-        """回测策略"""
-        df = self.prepare_data(df)
+        参数:
+        data: PriceSeries或包含ts、close列的DataFrame，回测过程中不会被修改
+        """
+        series = self.prepare_data(data)
+        self._rng = random.Random(self.seed)
 
         # 记录每日资产变化
         portfolio_values = []
         dates = []
 
         # 初始化上次交易价格为第一个价格点
-        self.portfolio['last_trade_price'] = df['close'].iloc[0]
+        self.portfolio['last_trade_price'] = series.close[0]
 
-        for i, row in df.iterrows():
-            current_price = row['close']
-            current_time = row['ts']
+        # 提前结束条件预先换算成阈值，循环中只做比较
+        min_equity = (self.initial_capital * self.prune_min_equity
+                      if self.prune_min_equity is not None else None)
+        drawdown_floor = 1 - self.prune_max_drawdown if self.prune_max_drawdown is not None else None
+        no_trade_limit = (pd.Timedelta(days=self.prune_no_trade_days)
+                          if self.prune_no_trade_days is not None else None)
+
+        for current_time, current_price in zip(series.times, series.close.tolist()):
 
             # 记录日期和当前资产价值
             dates.append(current_time)
@@ -233,6 +256,18 @@ class DCAStrategy:
             if portfolio_value > self.portfolio['peak_value']:
                 self.portfolio['peak_value'] = portfolio_value
 
+            # 检查是否提前结束
+            if min_equity is not None and portfolio_value < min_equity:
+                self.pruned_reason = 'min_equity'
+            elif drawdown_floor is not None and portfolio_value < self.portfolio['peak_value'] * drawdown_floor:
+                self.pruned_reason = 'max_drawdown'
+            elif (no_trade_limit is not None and self.portfolio['last_trade_time'] is not None
+                  and current_time - self.portfolio['last_trade_time'] > no_trade_limit):
+                self.pruned_reason = 'no_trade'
+            if self.pruned_reason is not None:
+                self.pruned_at = current_time
+                break
+
             # 执行交易逻辑
             self._execute_trading_logic(current_time, current_price)
 
@@ -242,9 +277,9 @@ class DCAStrategy:
             'portfolio_value': portfolio_values
         })
 
-        return self.calculate_performance(df)
+        return self.calculate_performance(series)
 
-    def calculate_performance(self, df):
+    def calculate_performance(self, series):
         """计算策略表现指标"""
         if not hasattr(self, 'portfolio_df'):
             return "请先运行回测"
@@ -294,7 +329,10 @@ class DCAStrategy:
             'take_profit_count': len(take_profit_trades),
             'win_rate': win_rate,
             'final_portfolio_value': self.portfolio_df['portfolio_value'].iloc[-1],
-            'total_fees': total_fees
+            'total_fees': total_fees,
+            'pruned': self.pruned_reason is not None,
+            'prune_reason': self.pruned_reason,
+            'pruned_at': str(self.pruned_at) if self.pruned_at is not None else None
         }
 
     def plot_performance(self):
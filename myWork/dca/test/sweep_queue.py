@@ -0,0 +1,487 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from pathlib import Path
+
+import numpy
+
+from myWork.dca.test.mysql_read import MySQLDataReader
+
+# 参数组合的执行状态，与MySQL的strategy_parameters表一致，pruned为满足条件被提前结束的回测
+PARAMETER_STATUSES = ('pending', 'executing', 'completed', 'failed', 'pruned')
+
+
+def json_default(obj):
+    if isinstance(obj, numpy.integer):
+        return int(obj)
+    if isinstance(obj, numpy.floating):
+        return float(obj)
+    raise TypeError(f"无法序列化的类型: {type(obj)}")
+
+
+def params_hash(params):
+    """参数组合的去重键: 键排序后的JSON的MD5"""
+    text = json.dumps(params, sort_keys=True, separators=(',', ':'), default=json_default)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class SweepQueue(ABC):
+    """
+    参数扫描的任务队列接口
+
+    状态为 pending/executing/completed/failed/pruned，相同参数组合只保存一次。
+    后端缺少任一抽象方法时在创建实例时就会报错，而不是在扫描中途
+    """
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    @abstractmethod
+    def create_parameter_table(self):
+        """创建参数表"""
+
+    @abstractmethod
+    def insert_parameters(self, params_list):
+        """插入参数组合，已存在的组合忽略"""
+
+    @abstractmethod
+    def get_status_counts(self):
+        """各状态的参数数量"""
+
+    @abstractmethod
+    def get_unexecuted_parameter(self):
+        """获取一个未执行的参数组合，没有参数时返回(None, None)"""
+
+    @abstractmethod
+    def release_claimed_parameters(self):
+        """把已领取但尚未执行的参数归还为pending"""
+
+    @abstractmethod
+    def update_parameter_status(self, param_id, status, result=None):
+        """更新参数执行状态和结果"""
+
+    @abstractmethod
+    def flush_status_updates(self):
+        """写入缓存的状态更新"""
+
+
+class BufferedSweepQueue(SweepQueue):
+    """
+    在进程内缓存的任务队列: 领取的参数先缓存在进程内，状态更新先缓存再批量写入，
+    写入前调用before_status_flush(如先写入回测结果)。子类只需实现领取、归还和写入状态的事务
+    """
+
+    def __init__(self, claim_batch_size=20, lease_seconds=3600, status_flush_size=20, status_flush_interval=30):
+        """
+        参数:
+        claim_batch_size: 每次领取的参数组合数量
+        lease_seconds: 领取后超过该时间(秒)仍为executing的参数视为失效，可被重新领取
+        status_flush_size: 缓存的状态更新达到该数量时批量写入
+        status_flush_interval: 缓存的状态更新最长等待时间(秒)
+        """
+        self.claim_batch_size = claim_batch_size
+        self.lease_seconds = lease_seconds
+        self.status_flush_size = status_flush_size
+        self.status_flush_interval = status_flush_interval
+        self._claimed = deque()  # (param_id, params)
+        self._status_updates = []  # (status, result_json, param_id)
+        self._last_status_flush = time.monotonic()
+        self.before_status_flush = None
+
+    def disconnect(self):
+        """写入缓存的状态更新并归还未执行的参数"""
+        try:
+            self.flush_status_updates()
+            self.release_claimed_parameters()
+        except Exception as e:
+            print(f"关闭任务队列前写入参数状态失败: {e}")
+
+    @abstractmethod
+    def _claim(self, batch_size):
+        """领取最多batch_size个参数并标记为executing，返回[(param_id, params)]"""
+
+    @abstractmethod
+    def _release(self, ids):
+        """把参数归还为pending"""
+
+    @abstractmethod
+    def _apply_status_updates(self, updates, renew_ids):
+        """在一个事务中写入状态更新并续期renew_ids的租约"""
+
+    def get_unexecuted_parameter(self):
+        """获取一个未执行的参数组合，本地缓存为空时批量领取，没有参数时返回(None, None)"""
+        if not self._claimed:
+            # 领取新一批之前先写入上一批的执行结果
+            self.flush_status_updates()
+            self._claimed.extend(self._claim(self.claim_batch_size))
+        if self._claimed:
+            return self._claimed.popleft()
+        return None, None
+
+    def release_claimed_parameters(self):
+        """把已领取但尚未执行的参数归还为pending"""
+        if not self._claimed:
+            return
+        ids = [param_id for param_id, _ in self._claimed]
+        self._claimed.clear()
+        self._release(ids)
+        print(f"已归还 {len(ids)} 个未执行的参数组合")
+
+    def update_parameter_status(self, param_id, status, result=None):
+        """更新参数执行状态和结果，先缓存，达到数量或时间阈值后批量写入"""
+        if status not in PARAMETER_STATUSES:
+            raise ValueError(f"未知的参数状态: {status}")
+        result_json = json.dumps(result, default=json_default) if result else None
+        self._status_updates.append((status, result_json, param_id))
+        if (len(self._status_updates) >= self.status_flush_size
+                or time.monotonic() - self._last_status_flush >= self.status_flush_interval):
+            self.flush_status_updates()
+
+    def flush_status_updates(self):
+        """写入缓存的状态更新，同时续期本地尚未执行的参数的租约"""
+        self._last_status_flush = time.monotonic()
+        if not self._status_updates and not self._claimed:
+            return
+        if self.before_status_flush is not None:
+            self.before_status_flush()
+
+        updates, self._status_updates = self._status_updates, []
+        try:
+            self._apply_status_updates(updates, [param_id for param_id, _ in self._claimed])
+        except Exception:
+            # 写入失败时保留更新，下次再试
+            self._status_updates = updates + self._status_updates
+            raise
+
+
+class SQLiteSweepQueue(BufferedSweepQueue):
+    """
+    本地参数扫描队列: 参数和状态保存在SQLite(WAL模式)文件中，单机多进程共享，中断后可以继续执行，
+    不需要MySQL
+    """
+
+    def __init__(self, path, claim_batch_size=100, lease_seconds=3600, status_flush_size=100,
+                 status_flush_interval=5, busy_timeout=30):
+        """
+        参数:
+        path: SQLite数据库文件路径
+        busy_timeout: 等待其他进程释放写锁的最长时间(秒)
+        其余参数见BufferedSweepQueue
+        """
+        super().__init__(claim_batch_size, lease_seconds, status_flush_size, status_flush_interval)
+        self.path = Path(path)
+        self.busy_timeout = busy_timeout
+        self._conn = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # 连接按进程创建，fork出的worker不复用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def connect(self):
+        self.create_parameter_table()
+
+    def disconnect(self):
+        super().disconnect()
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def _transaction(self):
+        return _SQLiteTransaction(self.connection)
+
+    @staticmethod
+    def _table_sql(name):
+        statuses = ', '.join(f"'{status}'" for status in PARAMETER_STATUSES)
+        return f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            params TEXT NOT NULL,
+            params_hash TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ({statuses})),
+            result TEXT NULL,
+            leased_at REAL NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+
+    def create_parameter_table(self):
+        """创建参数表，字段与MySQL的strategy_parameters一致"""
+        self.connection.execute(self._table_sql("strategy_parameters"))
+
+        # 旧文件的状态约束不含新增的状态时重建表(SQLite不支持修改CHECK约束)
+        table_sql = self.connection.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'strategy_parameters'").fetchone()[0]
+        missing = [status for status in PARAMETER_STATUSES if f"'{status}'" not in table_sql]
+        if missing:
+            with self._transaction() as conn:
+                conn.execute(self._table_sql("strategy_parameters_new"))
+                conn.execute("INSERT INTO strategy_parameters_new SELECT * FROM strategy_parameters")
+                conn.execute("DROP TABLE strategy_parameters")
+                conn.execute("ALTER TABLE strategy_parameters_new RENAME TO strategy_parameters")
+            print(f"参数表已增加状态: {missing}")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_status_id ON strategy_parameters (status, id)")
+
+    def insert_parameters(self, params_list):
+        """批量插入参数组合，按参数哈希去重"""
+        if not params_list:
+            return 0
+        now = time.time()
+        rows = [(json.dumps(p, default=json_default), params_hash(p), now, now) for p in params_list]
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO strategy_parameters (params, params_hash, status, created_at, "
+                             "updated_at) VALUES (?, ?, 'pending', ?, ?)", rows)
+            inserted = conn.total_changes - before
+        print(f"成功插入 {inserted} 个参数组合，忽略重复项 {len(rows) - inserted} 个")
+        return inserted
+
+    def _claim(self, batch_size):
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, params FROM strategy_parameters "
+                "WHERE status = 'pending' OR (status = 'executing' AND (leased_at IS NULL OR leased_at < ?)) "
+                "ORDER BY id ASC LIMIT ?", (now - self.lease_seconds, batch_size)
+            ).fetchall()
+            if rows:
+                ids = [row[0] for row in rows]
+                placeholders = ', '.join(['?'] * len(ids))
+                conn.execute(f"UPDATE strategy_parameters SET status = 'executing', leased_at = ?, updated_at = ? "
+                             f"WHERE id IN ({placeholders})", [now, now] + ids)
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def _release(self, ids):
+        placeholders = ', '.join(['?'] * len(ids))
+        with self._transaction() as conn:
+            conn.execute(f"UPDATE strategy_parameters SET status = 'pending', leased_at = NULL "
+                         f"WHERE id IN ({placeholders}) AND status = 'executing'", ids)
+
+    def _apply_status_updates(self, updates, renew_ids):
+        now = time.time()
+        with self._transaction() as conn:
+            if updates:
+                conn.executemany("UPDATE strategy_parameters SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                                 [(status, result, now, param_id) for status, result, param_id in updates])
+            if renew_ids:
+                placeholders = ', '.join(['?'] * len(renew_ids))
+                conn.execute(f"UPDATE strategy_parameters SET leased_at = ? "
+                             f"WHERE id IN ({placeholders}) AND status = 'executing'", [now] + renew_ids)
+
+    def get_status_counts(self):
+        rows = self.connection.execute("SELECT status, COUNT(*) FROM strategy_parameters GROUP BY status").fetchall()
+        counts = {status: 0 for status in PARAMETER_STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+    def get_results(self, status='completed'):
+        """读取指定状态的参数和结果，返回[(param_id, params, result)]"""
+        rows = self.connection.execute(
+            "SELECT id, params, result FROM strategy_parameters WHERE status = ? ORDER BY id", (status,)
+        ).fetchall()
+        return [(row[0], json.loads(row[1]), json.loads(row[2]) if row[2] else None) for row in rows]
+
+
+class _SQLiteTransaction:
+    """BEGIN IMMEDIATE开始的写事务，进入时即取得写锁，多个进程领取参数时不会读到同一批行"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+class MySQLSweepQueue(BufferedSweepQueue):
+    """
+    使用MySQL的strategy_parameters表作为任务队列，多台机器可以共享，连接由MySQLDataReader管理
+
+    params_hash由params_hash()在插入时计算，与SQLite队列使用同一个去重键
+    """
+
+    def __init__(self, db_config, claim_batch_size=20, lease_seconds=3600, status_flush_size=20,
+                 status_flush_interval=30):
+        """
+        参数:
+        db_config: 数据库连接配置
+        其余参数见BufferedSweepQueue
+        """
+        super().__init__(claim_batch_size, lease_seconds, status_flush_size, status_flush_interval)
+        self.reader = MySQLDataReader(**db_config)
+
+    @property
+    def connection(self):
+        if not self.reader.connection:
+            self.reader.connect()
+        return self.reader.connection
+
+    def connect(self):
+        self.reader.connect()
+
+    def disconnect(self):
+        if self.reader.connection:
+            super().disconnect()
+        self.reader.disconnect()
+
+    def _transaction(self):
+        return _MySQLTransaction(self.connection)
+
+    def create_parameter_table(self):
+        """创建策略参数表"""
+        statuses = ', '.join(f"'{status}'" for status in PARAMETER_STATUSES)
+        self.reader.execute_query(f"""
+        CREATE TABLE IF NOT EXISTS strategy_parameters (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            params JSON NOT NULL,
+            params_hash VARCHAR(32) NOT NULL,
+            status ENUM({statuses}) DEFAULT 'pending',
+            result JSON NULL,
+            leased_at TIMESTAMP NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uk_params_hash (params_hash),
+            KEY idx_status_id (status, id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """)
+
+        columns = {row['COLUMN_NAME']: row for row in self.reader.execute_query(
+            "SELECT COLUMN_NAME, COLUMN_TYPE, EXTRA FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'strategy_parameters'"
+        )}
+        # 旧表没有租约字段时补上
+        if 'leased_at' not in columns:
+            self.reader.execute_query("ALTER TABLE strategy_parameters ADD COLUMN leased_at TIMESTAMP NULL, "
+                                      "ADD KEY idx_status_id (status, id)")
+        # 旧表的状态不含pruned(提前结束的回测)时补上
+        if 'pruned' not in columns['status']['COLUMN_TYPE']:
+            self.reader.execute_query(f"ALTER TABLE strategy_parameters MODIFY COLUMN status "
+                                      f"ENUM({statuses}) DEFAULT 'pending'")
+        # 旧表的params_hash由MySQL按MD5(CAST(params AS CHAR))生成，与params_hash()不一致，改为普通列后重新计算
+        if 'GENERATED' in columns['params_hash']['EXTRA'].upper():
+            self._rehash_parameters()
+        self.connection.commit()
+        print("策略参数表已创建或已存在")
+
+    def _rehash_parameters(self):
+        self.reader.execute_query("ALTER TABLE strategy_parameters MODIFY COLUMN params_hash VARCHAR(32) NOT NULL")
+        rows = self.reader.execute_query("SELECT id, params FROM strategy_parameters")
+        updates = [(params_hash(json.loads(row['params'])), row['id']) for row in rows]
+        with self._transaction() as cursor:
+            # 按新的哈希重复的参数保留原哈希，不影响执行
+            changed = cursor.executemany("UPDATE IGNORE strategy_parameters SET params_hash = %s WHERE id = %s",
+                                         updates) if updates else 0
+        print(f"参数表params_hash已改为程序计算，重新计算 {changed} 行")
+
+    def insert_parameters(self, params_list):
+        """批量插入参数组合，按参数哈希去重"""
+        if not params_list:
+            return 0
+        rows = [(json.dumps(p, default=json_default), params_hash(p)) for p in params_list]
+        with self._transaction() as cursor:
+            inserted = cursor.executemany("INSERT IGNORE INTO strategy_parameters (params, params_hash, status) "
+                                          "VALUES (%s, %s, 'pending')", rows)
+        print(f"成功插入 {inserted} 个参数组合，忽略重复项 {len(rows) - inserted} 个")
+        return inserted
+
+    def _claim(self, batch_size):
+        # SKIP LOCKED跳过其他worker正在领取的行，多个worker不会在同一批行上排队等待；
+        # 租约过期的executing行(worker异常退出)会被重新领取
+        with self._transaction() as cursor:
+            cursor.execute(
+                "SELECT id, params FROM strategy_parameters "
+                "WHERE status = 'pending' "
+                "OR (status = 'executing' AND (leased_at IS NULL OR leased_at < NOW() - INTERVAL %s SECOND)) "
+                "ORDER BY id ASC LIMIT %s FOR UPDATE SKIP LOCKED", (self.lease_seconds, batch_size)
+            )
+            rows = cursor.fetchall()
+            if rows:
+                ids = [row['id'] for row in rows]
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f"UPDATE strategy_parameters SET status = 'executing', leased_at = CURRENT_TIMESTAMP "
+                               f"WHERE id IN ({placeholders})", ids)
+        return [(row['id'], json.loads(row['params'])) for row in rows]
+
+    def _release(self, ids):
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self._transaction() as cursor:
+            cursor.execute(f"UPDATE strategy_parameters SET status = 'pending', leased_at = NULL "
+                           f"WHERE id IN ({placeholders}) AND status = 'executing'", ids)
+
+    def _apply_status_updates(self, updates, renew_ids):
+        with self._transaction() as cursor:
+            if updates:
+                cursor.executemany("UPDATE strategy_parameters SET status = %s, result = %s, "
+                                   "updated_at = CURRENT_TIMESTAMP WHERE id = %s", updates)
+            if renew_ids:
+                placeholders = ', '.join(['%s'] * len(renew_ids))
+                cursor.execute(f"UPDATE strategy_parameters SET leased_at = CURRENT_TIMESTAMP "
+                               f"WHERE id IN ({placeholders}) AND status = 'executing'", renew_ids)
+        if updates:
+            print(f"已批量更新 {len(updates)} 个参数的状态")
+
+    def get_status_counts(self):
+        # 在新事务中统计，不读取之前的快照
+        with self._transaction() as cursor:
+            cursor.execute("SELECT status, COUNT(*) AS n FROM strategy_parameters GROUP BY status")
+            rows = cursor.fetchall()
+        counts = {status: 0 for status in PARAMETER_STATUSES}
+        counts.update({row['status']: row['n'] for row in rows})
+        return counts
+
+
+class _MySQLTransaction:
+    """在一个MySQL事务中执行，返回游标，出错时回滚"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = None
+
+    def __enter__(self):
+        self.conn.begin()
+        self.cursor = self.conn.cursor()
+        return self.cursor
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cursor.close()
+        if exc_type is None:
+            self.conn.commit()
+        else:
+            self.conn.rollback()
+        return False
+
+
+def open_sweep_queue(db_config=None, queue_path=None, **kwargs):
+    """
+    创建参数扫描队列: 指定queue_path时使用本地SQLite队列，否则使用MySQL
+
+    参数:
+    db_config: 数据库连接配置
+    queue_path: 本地队列文件路径
+    kwargs: 传给队列的领取和状态写入参数
+    """
+    if queue_path:
+        return SQLiteSweepQueue(queue_path, **kwargs)
+    return MySQLSweepQueue(db_config, **kwargs)
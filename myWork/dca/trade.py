@@ -4,31 +4,81 @@ import os
 workspace_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, workspace_root)
 
+import asyncio
+import random
 import time
+from decimal import ROUND_DOWN, ROUND_UP
 from typing import Dict, Optional
 
-from myWork.another.all import trade_api, get_instrument_info, get_realtime_price
+from myWork.another.all import trade_api, get_instrument_spec, get_price_limit, get_realtime_price, price_limit_cache
+from myWork.another.instruments import InstrumentSpec
+from myWork.another.metrics import metrics
+from myWork.another.price_limit import clamp_price
 
 
-def _get_precision(value: float) -> int:
-    """获取数值的小数位数精度"""
-    value_str = str(value)
-    # 处理科学计数法表示的数字
-    if 'e' in value_str.lower():
-        # 转换为标准格式
-        value_str = format(value, 'f')
-    if '.' in value_str:
-        decimal_part = value_str.split('.')[1]
-        # 移除末尾的零
-        decimal_part = decimal_part.rstrip('0')
-        return len(decimal_part)
-    return 0
+def build_order_params(inst_id: str, trade_info: Dict, spec: InstrumentSpec, price_data: Dict,
+                       price_limits: Optional[Dict] = None) -> Optional[Dict]:
+    """根据交易决策、产品规格和最新价格构造下单参数，不满足下单条件时返回None"""
+    # 根据交易类型确定使用买价还是卖价
+    if trade_info['side'] == 'buy':
+        price = price_data['ask_px']
+    else:  # sell
+        price = price_data['bid_px']
 
+    # 提交前按交易所限价调整，避免被51006/51137拒绝后再重试
+    price = clamp_price(price_limits, trade_info['side'], price)
 
-def format_number(value: float, precision: int) -> str:
-    """根据精度格式化数字"""
-    # 使用格式化字符串确保小数位数正确
-    return f"{value:.{precision}f}"
+    # 确保价格符合精度要求，买入向下、卖出向上取整到tickSz的整数倍，不会越过交易所限价
+    adjusted_px = spec.quantize_price(price, ROUND_DOWN if trade_info['side'] == 'buy' else ROUND_UP)
+
+    # 确定交易数量
+    if trade_info['side'] == 'buy':
+        # 买入时，根据金额计算数量
+        sz = trade_info['amount'] / float(adjusted_px)
+    else:  # sell
+        # 卖出时，使用当前持仓量
+        sz = float(trade_info['sz'])
+
+    # 数量向下取整到下单步长后，确保符合最小下单量要求
+    adjusted_sz = spec.quantize_size(sz)
+    if adjusted_sz < spec.min_sz:
+        print(f"计算的下单量{sz}小于最小下单量{spec.min_sz}，交易取消")
+        return None
+
+    # 构造交易参数
+    return {
+        "instId": inst_id,
+        "tdMode": "cross",
+        "side": trade_info['side'],
+        "ccy": "USDT",
+        "ordType": "limit",
+        "sz": str(adjusted_sz),  # 数量精度
+        "px": str(adjusted_px)  # 价格精度
+    }
+
+
+def adjust_price_from_error(error_code: str, error_msg: str, side: str, spec: InstrumentSpec):
+    """从限价错误信息中解析交易所允许的价格，无法处理的错误返回None(限价缓存失效时的兜底)"""
+    if error_code in ("51137", "51006"):
+        price_limit_cache.invalidate(spec.inst_id)
+    if error_code == "51137" and "buy orders" in error_msg:
+        new_px = float(error_msg.split("is ")[1].split(". ")[0])
+        print(f"触发价格限制，使用强制限价: {new_px}")
+        return f"{new_px:.8f}"
+    if error_code == "51006":
+        # 处理价格超出限制错误
+        if side == 'buy':
+            # 提取最大买入价
+            max_buy_price_str = error_msg.split("max buy price: ")[1].split(", min sell price")[0].replace(",", "")
+            new_px = float(max_buy_price_str)
+        else:
+            # 提取最小卖出价
+            min_sell_price_str = error_msg.split("min sell price: ")[1].split(")")[0].replace(",", "")
+            new_px = float(min_sell_price_str)
+        print(f"订单价格超出限制，调整为: {new_px}")
+        # 确保价格精度符合要求
+        return str(spec.quantize_price(new_px))
+    return None
 
 
 class TradingExecutor:
@@ -40,71 +90,24 @@ class TradingExecutor:
     def execute_trade(self, inst_id: str, trade_info: Dict) -> Optional[str]:
         """执行交易并返回订单ID"""
         # 获取产品信息
-        instrument_info = get_instrument_info(inst_id)
-        if not instrument_info:
+        with metrics.timer('trade_instrument_lookup'):
+            spec = get_instrument_spec(inst_id)
+        if not spec:
             print(f"无法获取{inst_id}的产品信息，交易取消")
             return None
 
         # 获取最新价格
-        price_data = get_realtime_price(inst_id)
+        with metrics.timer('trade_price_fetch'):
+            price_data = get_realtime_price(inst_id)
         if not price_data:
             print(f"无法获取{inst_id}的最新价格，交易取消")
             return None
 
-        # 根据交易类型确定使用买价还是卖价
-        if trade_info['side'] == 'buy':
-            price = price_data['ask_px']
-        else:  # sell
-            price = price_data['bid_px']
-
-        # 确保价格符合精度要求
-        tick_sz = float(instrument_info.get('tickSz', '0.01'))
-        adjusted_px = round(price, _get_precision(tick_sz))
-
-        # 确定交易数量
-        if trade_info['side'] == 'buy':
-            # 买入时，根据金额计算数量
-            min_sz = float(instrument_info.get('minSz', '0.001'))
-            sz = trade_info['amount'] / adjusted_px
-
-            # 确保数量符合最小下单量要求
-            if sz < min_sz:
-                print(f"计算的下单量{sz}小于最小下单量{min_sz}，交易取消")
-                return None
-
-            # 调整数量精度
-            sz_precision = _get_precision(min_sz)
-            # 先四舍五入到指定精度
-            rounded_sz = round(sz, sz_precision)
-            # 然后格式化为字符串
-            final_sz = format_number(rounded_sz, sz_precision)
-        else:  # sell
-            # 卖出时，使用当前持仓量
-            min_sz = float(instrument_info.get('minSz', '0.001'))
-            sz = float(trade_info['sz'])
-
-            # 确保数量符合最小下单量要求
-            if sz < min_sz:
-                print(f"计算的下单量{sz}小于最小下单量{min_sz}，交易取消")
-                return None
-
-            # 调整数量精度
-            sz_precision = _get_precision(min_sz)
-            # 先四舍五入到指定精度
-            rounded_sz = round(sz, sz_precision)
-            # 然后格式化为字符串
-            final_sz = format_number(rounded_sz, sz_precision)
-
-        # 构造交易参数
-        trade_params = {
-            "instId": inst_id,
-            "tdMode": "cross",
-            "side": trade_info['side'],
-            "ccy": "USDT",
-            "ordType": "limit",
-            "sz": final_sz,  # 数量精度
-            "px": adjusted_px  # 价格精度
-        }
+        with metrics.timer('trade_price_limit'):
+            price_limits = get_price_limit(inst_id)
+        trade_params = build_order_params(inst_id, trade_info, spec, price_data, price_limits)
+        if not trade_params:
+            return None
 
         # 记录初始订单
         # self.db_manager.record_trade(inst_id, trade_info, status='pending')
@@ -114,9 +117,12 @@ class TradingExecutor:
         order_id = None
 
         for attempt in range(max_retries):
+            if attempt > 0:
+                metrics.incr('order_retries')
             try:
                 print(f"[{attempt + 1}/{max_retries}] 提交订单: {trade_params}")
-                result = trade_api.set_order(**trade_params)
+                with metrics.timer('order_submit'):
+                    result = trade_api.set_order(**trade_params)
 
                 if result["code"] == "0" and len(result.get("data", [])) > 0:
                     order_id = result["data"][0]["ordId"]
@@ -133,23 +139,9 @@ class TradingExecutor:
                     print(f"订单失败 (代码: {error_code}): {error_msg}")
 
                     # 处理特定错误
-                    if error_code == "51137" and "buy orders" in error_msg:
-                        new_px = float(error_msg.split("is ")[1].split(". ")[0])
-                        print(f"触发价格限制，使用强制限价: {new_px}")
-                        trade_params["px"] = f"{new_px:.8f}"
-                    elif error_code == "51006":
-                        # 处理价格超出限制错误
-                        if trade_info['side'] == 'buy':
-                            # 提取最大买入价
-                            max_buy_price_str = error_msg.split("max buy price: ")[1].split(", min sell price")[0].replace(",", "")
-                            new_px = float(max_buy_price_str)
-                        else:
-                            # 提取最小卖出价
-                            min_sell_price_str = error_msg.split("min sell price: ")[1].split(")")[0].replace(",", "")
-                            new_px = float(min_sell_price_str)
-                        print(f"订单价格超出限制，调整为: {new_px}")
-                        # 确保价格精度符合要求
-                        trade_params["px"] = round(new_px, _get_precision(tick_sz))
+                    new_px = adjust_price_from_error(error_code, error_msg, trade_info['side'], spec)
+                    if new_px is not None:
+                        trade_params["px"] = new_px
                     else:
                         self.db_manager.update_order_status(order_id, 'rejected', error_msg)
                         break
@@ -161,3 +153,104 @@ class TradingExecutor:
             time.sleep(1)  # API调用间隔
 
         return order_id
+
+
+class AsyncTradingExecutor:
+    """异步交易执行器，并发预取产品信息和价格，下单不阻塞事件循环，多个订单可同时进行"""
+
+    def __init__(self, db_manager, max_concurrency: int = 10, max_retries: int = 3,
+                 base_delay: float = 0.2, max_delay: float = 2.0, batcher=None):
+        """
+        参数:
+        db_manager: 数据库管理器
+        batcher: 可选的OrderBatcher，提供时同一时间窗口内的订单合并为一次批量下单
+        max_concurrency: 同时进行中的下单请求上限
+        max_retries: 最大尝试次数
+        base_delay: 异常重试的基础退避时间(秒)，按指数增长并加入随机抖动
+        max_delay: 单次退避时间上限(秒)
+        """
+        self.db_manager = db_manager
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batcher = batcher
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # 统计信息
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.retries = 0
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """指数退避加全抖动，避免多个订单同时重试"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def execute_trade(self, inst_id: str, trade_info: Dict) -> Optional[str]:
+        """执行交易并返回订单ID"""
+        # 并发获取产品信息、最新价格和限价
+        spec, price_data, price_limits = await asyncio.gather(
+            asyncio.to_thread(get_instrument_spec, inst_id),
+            asyncio.to_thread(get_realtime_price, inst_id),
+            asyncio.to_thread(get_price_limit, inst_id)
+        )
+        if not spec:
+            print(f"无法获取{inst_id}的产品信息，交易取消")
+            return None
+        if not price_data:
+            print(f"无法获取{inst_id}的最新价格，交易取消")
+            return None
+
+        trade_params = build_order_params(inst_id, trade_info, spec, price_data, price_limits)
+        if not trade_params:
+            return None
+
+        order_id = None
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.retries += 1
+                metrics.incr('order_retries')
+            try:
+                print(f"[{attempt + 1}/{self.max_retries}] 提交订单: {trade_params}")
+                with metrics.timer('order_submit'):
+                    result = await self._set_order(trade_params)
+
+                if result["code"] == "0" and len(result.get("data", [])) > 0:
+                    order_id = result["data"][0]["ordId"]
+                    print(f"订单提交成功，订单ID: {order_id}")
+
+                    # 更新订单状态
+                    await asyncio.to_thread(self.db_manager.update_order_status, order_id, 'filled')
+                    await asyncio.to_thread(self.db_manager.record_trade, inst_id, trade_info, order_id, 'filled')
+                    return order_id
+
+                error = result.get("data", [{}])[0]
+                error_msg = error.get("sMsg", "未知错误")
+                error_code = error.get("sCode", "未知代码")
+                print(f"订单失败 (代码: {error_code}): {error_msg}")
+
+                # 价格限制错误调整价格后立即重试，其余错误不再重试
+                new_px = adjust_price_from_error(error_code, error_msg, trade_info['side'], spec)
+                if new_px is None:
+                    await asyncio.to_thread(self.db_manager.update_order_status, order_id, 'rejected', error_msg)
+                    return None
+                trade_params["px"] = new_px
+            except Exception as e:
+                print(f"下单异常: {str(e)}")
+                if attempt == self.max_retries - 1:
+                    await asyncio.to_thread(self.db_manager.update_order_status, order_id, 'rejected', str(e))
+                else:
+                    await asyncio.sleep(self._backoff_delay(attempt))
+
+        return order_id
+
+    async def _set_order(self, trade_params: Dict) -> Dict:
+        """在并发上限内提交订单"""
+        async with self._semaphore:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                if self.batcher is not None:
+                    return await self.batcher.submit(trade_params)
+                return await asyncio.to_thread(trade_api.set_order, **trade_params)
+            finally:
+                self.in_flight -= 1
@@ -5,14 +5,36 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing
 import os
 
+from myWork.another.backtest_cache import data_fingerprint, get_backtest_cache, result_key
 from myWork.process.回测 import calculate_ma_signals, backtest_strategy, evaluate_performance
 
+# 回测结果缓存的版本，均线回测逻辑变化时修改，使旧的缓存结果失效
+MA_CACHE_VERSION = "ma-v1"
+# 回测用到的K线列，计算信号时新增的列不影响数据指纹
+KLINE_COLUMNS = ('ts', 'c')
 
-def process_single_param_combination(kline_df, params, initial_balance, fees, verbose):
-    """处理单个参数组合的回测"""
+
+def process_single_param_combination(kline_df, params, initial_balance, fees, verbose, fingerprint=None, cache=None):
+    """
+    处理单个参数组合的回测
+
+    相同K线数据、参数、初始资金和手续费率的结果从缓存返回，cache为False时不使用缓存
+    fingerprint为K线数据指纹，批量回测时由调用方计算一次传入
+    """
     buy_fee_rate, sell_fee_rate = fees
     short, long_, buy_ratio, sell_ratio = params
 
+    if cache is None:
+        cache = get_backtest_cache()
+    key = None
+    if cache is not False:
+        # 计算信号会修改kline_df，指纹要在回测前计算
+        key = result_key(MA_CACHE_VERSION, fingerprint or data_fingerprint(kline_df, KLINE_COLUMNS),
+                         {'params': list(params), 'initial_balance': initial_balance, 'fees': list(fees)})
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     try:
         # 1. 计算信号
         signal_df = calculate_ma_signals(kline_df, short, long_)
@@ -39,7 +61,7 @@ def process_single_param_combination(kline_df, params, initial_balance, fees, ve
         performance = evaluate_performance(backtest_result)
 
         # 4. 记录结果
-        return {
+        result = {
             'short_window': short,
             'long_window': long_,
             'buy_ratio': buy_ratio,
@@ -51,6 +73,9 @@ def process_single_param_combination(kline_df, params, initial_balance, fees, ve
             'win_rate': performance['win_rate'],
             'avg_return': performance['avg_return']
         }
+        if key is not None:
+            cache.put(key, result)
+        return result
 
     except Exception as e:
         if verbose:
@@ -79,6 +104,7 @@ def optimize_trading_params(kline_df, param_ranges, initial_balance=100000, fees
     total_combinations = len(param_combinations)
     start_time = time.time()
     processed_count = multiprocessing.Value('i', 0)  # 进程安全的计数器
+    fingerprint = data_fingerprint(kline_df, KLINE_COLUMNS)
 
     if verbose:
         print(f"开始参数优化，共{total_combinations}种参数组合需要测试")
@@ -94,7 +120,8 @@ def optimize_trading_params(kline_df, param_ranges, initial_balance=100000, fees
                 params,
                 initial_balance,
                 fees,
-                verbose
+                verbose,
+                fingerprint
             ): params
             for params in param_combinations
         }
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# Add project root to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# 测试中的回测结果不写入磁盘缓存
+os.environ.setdefault("BACKTEST_CACHE_DIR", "")
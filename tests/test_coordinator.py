@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+import pandas as pd
+import pytest
+
+from myWork.dca.test.coordinator import (SweepCoordinator, SweepWorkerNode, combine_result_writers,
+                                         start_coordinator_server)
+from myWork.dca.test.price_series import PriceSeries
+
+CSV_PATH = Path(__file__).parent.parent / "myWork" / "sorted_history_7.csv"
+
+BASE_CONFIG = {'max_time_since_last_trade': 6, 'min_time_since_last_trade': 1}
+PARAMETER_RANGES = {
+    'price_drop_threshold': [0.005, 0.01, 0.02],
+    'take_profit_threshold': [0.002, 0.005],
+    'initial_investment_ratio': [0.1, 0.2],
+}
+TOTAL_CONFIGS = 12
+
+
+@pytest.fixture(scope="module")
+def series():
+    df = pd.read_csv(CSV_PATH, nrows=300)
+    df['ts'] = pd.to_datetime(df['ts'])
+    return PriceSeries.from_frame(df)
+
+
+class RecordingWriter:
+    """记录每次写入的块，前fail_times次写入时抛出异常(模拟MySQL不可用)"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.calls = []
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def __call__(self, chunk_id, results):
+        with self.lock:
+            self.calls.append(chunk_id)
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise RuntimeError("写入失败")
+            self.rows.extend(json.dumps(result['config'], sort_keys=True) for result in results)
+
+
+class SlowWorkerNode(SweepWorkerNode):
+    """每个块都执行很久，直到被告知该块已由其他worker完成"""
+
+    def _run_chunk(self, chunk, data, job):
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if chunk['chunk_id'] in self._cancelled:
+                return None
+            time.sleep(0.05)
+        return super()._run_chunk(chunk, data, job)
+
+
+def start(coordinator):
+    server = start_coordinator_server(coordinator, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_nodes(nodes):
+    threads = [threading.Thread(target=node.run, daemon=True) for node in nodes]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def assert_written_once(writer):
+    counts = Counter(writer.rows)
+    assert len(counts) == TOTAL_CONFIGS
+    assert set(counts.values()) == {1}
+
+
+def test_lease_expiry_and_write_retry(series):
+    jsonl = RecordingWriter()
+    mysql = RecordingWriter(fail_times=1)
+    coordinator = SweepCoordinator(BASE_CONFIG, PARAMETER_RANGES, chunk_size=3, lease_seconds=1,
+                                   heartbeat_interval=0.2, on_results=combine_result_writers([jsonl, mysql]))
+    server, url = start(coordinator)
+    try:
+        # 领取一块后就失联的worker
+        lost = httpx.post(url + "/lease", json={'worker_id': 'lost', 'max_chunks': 1}).json()
+        assert len(lost['chunks']) == 1
+
+        nodes = [SweepWorkerNode(url, lambda job: series, worker_id=f"node-{i}") for i in range(2)]
+        threads = run_nodes(nodes)
+        assert coordinator.done_event.wait(60)
+        for thread in threads:
+            thread.join(10)
+
+        status = coordinator.get_status()
+        assert status['completed_configs'] == TOTAL_CONFIGS
+        assert status['requeued_chunks'] >= 1
+        # 写入失败的块被重新提交: MySQL写入两次，JSON Lines只写入一次
+        assert len(mysql.calls) == status['completed_chunks'] + 1
+        assert Counter(jsonl.calls).most_common(1)[0][1] == 1
+        assert_written_once(jsonl)
+        assert_written_once(mysql)
+    finally:
+        server.shutdown()
+
+
+def test_straggler_chunk_is_stolen(series):
+    writer = RecordingWriter()
+    coordinator = SweepCoordinator(BASE_CONFIG, PARAMETER_RANGES, chunk_size=3, lease_seconds=5,
+                                   heartbeat_interval=0.2, min_steal_seconds=0.5, on_results=writer)
+    server, url = start(coordinator)
+    try:
+        slow = SlowWorkerNode(url, lambda job: series, worker_id="slow")
+        threads = run_nodes([slow])
+        deadline = time.monotonic() + 10
+        while coordinator.get_status()['in_flight_chunks'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        fast = SweepWorkerNode(url, lambda job: series, worker_id="fast")
+        threads += run_nodes([fast])
+        assert coordinator.done_event.wait(60)
+        for thread in threads:
+            thread.join(10)
+
+        assert coordinator.get_status()['stolen_chunks'] >= 1
+        assert slow.chunks_abandoned >= 1
+        assert_written_once(writer)
+    finally:
+        server.shutdown()
+
+
+def test_client_errors_are_not_retried():
+    coordinator = SweepCoordinator(BASE_CONFIG, PARAMETER_RANGES, chunk_size=3)
+    server, url = start(coordinator)
+    try:
+        node = SweepWorkerNode(url, None, worker_id="bad", max_retries=30)
+        started = time.monotonic()
+        with pytest.raises(httpx.HTTPStatusError) as info:
+            node._post("/results", {})
+        assert info.value.response.status_code == 400
+        assert time.monotonic() - started < 2
+    finally:
+        server.shutdown()
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from myWork.another.ws_stub_server import LocalTickerServer
+from myWork.another.ws_ticker import TickerStream
+
+INST_ID = "BTC-USDT-SWAP"
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def server():
+    server = LocalTickerServer(push_interval=0.02).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stream(server):
+    stream = TickerStream([INST_ID], url=server.url, reconnect_delay=0.1)
+    stream.start()
+    yield stream
+    stream.stop()
+
+
+def test_subscribe_and_get_price(server, stream):
+    assert stream.wait_ready(timeout=5)
+    assert server.subscribe_count == 1
+
+    price = stream.get_price(INST_ID)
+    assert price['bid_px'] < price['ask_px']
+    assert price['ts'] > 0
+    # 推送的价格是最近一次随机游走的结果
+    assert price['bid_px'] == pytest.approx(server.current_price(INST_ID)['bid_px'], rel=0.01)
+    assert stream.get_price("ETH-USDT-SWAP") is None
+
+
+def test_add_instruments_while_connected(server, stream):
+    assert stream.wait_ready(timeout=5)
+    stream.add_instruments(["ETH-USDT-SWAP"])
+    assert stream.wait_ready(["ETH-USDT-SWAP"], timeout=5)
+    assert stream.inst_ids == ["BTC-USDT-SWAP", "ETH-USDT-SWAP"]
+
+
+def test_resubscribe_after_drop(server, stream):
+    stream.add_instruments(["ETH-USDT-SWAP"])
+    assert stream.wait_ready(timeout=5)
+    subscribe_before = server.subscribe_count
+
+    server.drop_connections()
+    dropped_at = time.monotonic()
+    assert wait_until(lambda: stream.reconnect_count >= 1)
+    assert wait_until(lambda: server.subscribe_count > subscribe_before)
+
+    # 重连后全部产品重新订阅，价格继续更新
+    for inst_id in ("BTC-USDT-SWAP", "ETH-USDT-SWAP"):
+        assert wait_until(lambda: (stream.get_price(inst_id) or {}).get('received_at', 0) > dropped_at)